@@ -1,16 +1,20 @@
 """
-Vercel Serverless Function - Magic Card API (OpenAI Version)
-Using OpenAI GPT for reliable YouTube summarization
+Vercel 无服务器函数 - Magic Card API（OpenAI 版）
+使用 OpenAI GPT 生成 YouTube 视频摘要
 """
 from http.server import BaseHTTPRequestHandler
 import json
 import sys
 import os
 import re
+import time
 import requests
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from llm_metrics import begin_request, record_llm_call, write_request_log
+from prompts import get_prompt
+
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         self.send_response(200)
@@ -18,6 +22,14 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
     
     def do_POST(self):
+        # 无服务器函数没有 /metrics，本次调用的 LLM 用量以一行 llm_usage JSON 日志输出
+        begin_request()
+        try:
+            self._handle_post()
+        finally:
+            write_request_log(self.path)
+
+    def _handle_post(self):
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             body = self.rfile.read(content_length)
@@ -56,7 +68,7 @@ class handler(BaseHTTPRequestHandler):
             })
 
     def _get_youtube_metadata(self, video_id):
-        """Fetch video title and description"""
+        """抓取视频标题与简介"""
         url = f"https://www.youtube.com/watch?v={video_id}"
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -76,15 +88,15 @@ class handler(BaseHTTPRequestHandler):
             return {"title": "Unknown Title", "description": ""}
 
     def _parse_youtube_gpt(self, url, extract_id):
-        """Parse YouTube using OpenAI GPT"""
+        """使用 OpenAI GPT 解析 YouTube 视频"""
         video_id = extract_id(url)
         if not video_id:
             raise ValueError("无效的 YouTube 链接")
         
-        # Get Metadata
+        # 获取元数据
         meta = self._get_youtube_metadata(video_id)
         
-        # Try to get Transcript (best effort)
+        # 尽力获取字幕，失败时只用标题与简介
         transcript = ""
         try:
             from youtube_transcript_api import YouTubeTranscriptApi
@@ -93,22 +105,22 @@ class handler(BaseHTTPRequestHandler):
         except:
             pass
             
-        # Prepare content for GPT
+        # 组装发给 GPT 的内容
         content = f"视频标题: {meta['title']}\n\n视频描述: {meta['description']}\n\n"
         if transcript:
-            content += f"视频字幕文本:\n{transcript[:10000]}"  # Limit to 10k chars
+            content += f"视频字幕文本:\n{transcript[:10000]}"  # 最多 1 万字符
         else:
             content += "注: 无法获取字幕，请基于标题和描述进行深度分析。"
 
         return self._call_openai(content, video_id)
 
     def _call_openai(self, text_content, video_id):
-        """Call OpenAI GPT API using direct HTTP requests (avoid SDK version issues)"""
+        """直接用 HTTP 请求调用 OpenAI GPT 接口（避开 SDK 版本问题）"""
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise RuntimeError("未配置 OPENAI_API_KEY")
         
-        # Use direct HTTP requests instead of SDK to avoid version conflicts
+        # 不用 SDK，直接发 HTTP 请求，避免版本冲突
         base_url = os.getenv("OPENAI_BASE_URL", "https://openkey.cloud/v1")
         model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
         
@@ -118,41 +130,35 @@ class handler(BaseHTTPRequestHandler):
             "Authorization": f"Bearer {api_key}"
         }
         
-        prompt = f"""你是一个专业的视频内容分析师。请根据以下视频信息，生成一份简洁、高质量的中文总结卡片。
-
-{text_content}
-
-请按照以下格式回答：
-
-【核心观点】
-用2-3句话概括视频的主要内容
-
-【关键亮点】
-1. 第一个重要观点
-2. 第二个重要观点  
-3. 第三个重要观点
-
-【适用场景】
-说明这个视频适合哪些人观看"""
+        # 固定指令放在 system 消息，变量内容放在 user 消息
+        template = get_prompt("video_card")
+        system_prompt, user_prompt = template.render(content=text_content)
 
         payload = {
             "model": model,
             "messages": [
-                {"role": "system", "content": "你是一个专业的视频内容分析专家，擅长将长视频内容提炼为简洁的要点。"},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
             ],
             "temperature": 0.7,
             "max_tokens": 800
         }
         
+        started = time.monotonic()
         try:
             response = requests.post(url, headers=headers, json=payload, timeout=30)
             response.raise_for_status()
             
             result = response.json()
             full_text = result['choices'][0]['message']['content']
+            usage = result.get('usage') or {}
+            record_llm_call("openai", model, "video_card", time.monotonic() - started,
+                            input_chars=len(text_content), usage={
+                                "prompt_tokens": usage.get("prompt_tokens", 0),
+                                "completion_tokens": usage.get("completion_tokens", 0),
+                            })
             
-            # Parse response
+            # 解析响应
             summary = self._extract_section(full_text, "【核心观点】")
             highlights_text = self._extract_section(full_text, "【关键亮点】")
             
@@ -174,8 +180,12 @@ class handler(BaseHTTPRequestHandler):
             }
             
         except requests.exceptions.RequestException as e:
+            record_llm_call("openai", model, "video_card", time.monotonic() - started,
+                            status="error", input_chars=len(text_content))
             raise RuntimeError(f"OpenAI API 请求失败: {str(e)}")
         except (KeyError, IndexError) as e:
+            record_llm_call("openai", model, "video_card", time.monotonic() - started,
+                            status="parse_error", input_chars=len(text_content))
             raise RuntimeError(f"OpenAI API 响应解析失败: {str(e)}")
 
     def _extract_section(self, text, marker):
@@ -8,10 +8,14 @@ import json
 import sys
 import os
 import re
+import time
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from llm_metrics import begin_request, extract_usage, record_llm_call, write_request_log
+from prompts import get_prompt
+
 # Force Vercel to rebuild - Version 2.0.0
 API_VERSION = "2.0.0-gemini-2.0-flash"
 
@@ -41,6 +45,14 @@ class handler(BaseHTTPRequestHandler):
     
     def do_POST(self):
         """Handle POST requests - full implementation with Gemini"""
+        # 无服务器函数没有 /metrics，本次调用的 LLM 用量以一行 llm_usage JSON 日志输出
+        begin_request()
+        try:
+            self._handle_post()
+        finally:
+            write_request_log(self.path)
+
+    def _handle_post(self):
         try:
             # Parse request
             content_length = int(self.headers.get('Content-Length', 0))
@@ -101,38 +113,26 @@ class handler(BaseHTTPRequestHandler):
             raise RuntimeError("未配置 GEMINI_API_KEY。YouTube 功能需要 Gemini API。")
         
         try:
-            import google.generativeai as genai
-            
-            # Configure Gemini
-            genai.configure(api_key=gemini_key)
-            # Use gemini-2.0-flash - most stable
-            # HARDCODED: gemini-2.0-flash only (gemini-1.5-flash not available)
-            model = genai.GenerativeModel("gemini-2.0-flash")
-            # Generate summary
-            prompt = f"""请分析这个 YouTube 视频并生成中文总结：
-
-视频链接：{url}
+            from llm_clients import get_gemini_model
 
-请提供：
-1. **核心观点**：用 2-3 句话概括视频的主要内容
-2. **关键亮点**：列出 3-5 个最重要的要点
-3. **适用场景**：这个视频适合哪些人观看？
-
-请用中文回答，格式如下：
-
-【核心观点】
-...
-
-【关键亮点】
-1. ...
-2. ...
-3. ...
-
-【适用场景】
-..."""
+            # 进程内共享客户端：每个 worker 只执行一次 genai.configure
+            # HARDCODED: gemini-2.0-flash only (gemini-1.5-flash not available)
+            model = get_gemini_model("gemini-2.0-flash")
+            if model is None:
+                raise RuntimeError("google-generativeai 未安装")
+            # 生成摘要：固定指令在前，视频链接在后
+            prompt = get_prompt("video_card_gemini").render_text(url=url)
             
-            response = model.generate_content([prompt, url])
-            full_text = response.text
+            started = time.monotonic()
+            try:
+                response = model.generate_content([prompt, url])
+                full_text = response.text
+            except Exception:
+                record_llm_call("gemini", "gemini-2.0-flash", "video_card", time.monotonic() - started,
+                                status="error")
+                raise
+            record_llm_call("gemini", "gemini-2.0-flash", "video_card", time.monotonic() - started,
+                            usage=extract_usage(response))
             
             # Parse response
             summary = self._extract_gemini_section(full_text, "【核心观点】")
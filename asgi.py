@@ -0,0 +1,344 @@
+"""
+ASGI 入口（可选，与 server.py 的 Flask 应用并存）
+提供与 Flask 版相同的 /api/parse、/api/magic 与 /api/parse/stream、/api/magic/stream 接口：
+请求在事件循环上处理，等待中的请求只占一个协程而不是一个线程；推文先用异步 HTTP 请求 FixTweet，
+其余同步流水线（字幕、yt-dlp、LLM）放到有界线程池执行；同一内容的并发请求共用一次执行。
+SSE 的进度与增量文本由流水线线程经 call_soon_threadsafe 放入 asyncio.Queue，在事件循环上等待，
+不占用线程池
+其他路径（/api/jobs、/api/batch、/metrics 等）经 asgiref 的 WSGI 适配器交给 server.app 处理
+
+用法：
+    pip install uvicorn asgiref
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+import asyncio
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import httpx
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as exc:
+    raise ImportError("asgi.py 需要 asgiref 与 uvicorn：pip install uvicorn asgiref") from exc
+
+import server
+from llm_metrics import begin_request, write_request_log
+from twitter_sessions import cookie_key
+
+MAX_BODY_BYTES = 1024 * 1024
+
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ASGI_PIPELINE_WORKERS", "32")), thread_name_prefix="asgi-pipeline"
+)
+_HTTP_CLIENT = None
+_INFLIGHT = {}
+_FLASK_APP = WsgiToAsgi(server.app)
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+def get_http_client():
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            timeout=10,
+            headers={"User-Agent": server.DEFAULT_USER_AGENT},
+            limits=httpx.Limits(max_connections=int(os.getenv("ASGI_HTTP_MAX_CONNECTIONS", "100"))),
+        )
+    return _HTTP_CLIENT
+
+
+async def run_sync(func, *args):
+    """在线程池中执行同步函数（复制当前 context，LLM 调用计入本请求的用量日志）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXECUTOR, contextvars.copy_context().run, func, *args)
+
+
+async def fetch_fixtweet_status_async(tweet_id):
+    """异步版 server.fetch_fixtweet_status"""
+    try:
+        response = await get_http_client().get(f"https://api.fxtwitter.com/status/{tweet_id}")
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("code") == 200 and "tweet" in data:
+                return data["tweet"]
+    except Exception:
+        pass
+    raise RuntimeError("fixtweet-failed")
+
+
+async def build_twitter_card_async(url, twitter_cookies):
+    """FixTweet 在事件循环上请求，失败时在线程池中走完整降级链"""
+    tweet_id = server.extract_twitter_id(url)
+    try:
+        title, text, method = server.fixtweet_to_text(await fetch_fixtweet_status_async(tweet_id))
+    except Exception:
+        return await run_sync(server.build_card, url, "Twitter", twitter_cookies)
+    summary_data = await run_sync(server.build_twitter_summary, text)
+    card = server.build_twitter_card(title, text, method, summary_data)
+    server.cache_set(server.get_card_cache_key(url, "Twitter"), card)
+    return card
+
+
+async def build_card_async(url, platform, twitter_cookies):
+    cached = server.cache_get(server.get_card_cache_key(url, platform))
+    if cached:
+        return cached
+    if platform == "Twitter" and server.extract_twitter_id(url):
+        return await build_twitter_card_async(url, twitter_cookies)
+    return await run_sync(server.build_card, url, platform, twitter_cookies)
+
+
+async def build_card_shared(url, platform, twitter_cookies):
+    """同一内容（同一组 cookie）的并发请求只执行一次流水线"""
+    key = (server.get_card_cache_key(url, platform), cookie_key(twitter_cookies))
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(build_card_async(url, platform, twitter_cookies))
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # 某个请求断开不应取消其他请求共用的任务
+    return await asyncio.shield(task)
+
+
+def validate(data):
+    """与 Flask 版相同的参数校验，返回 (status, error)；通过时返回 None"""
+    url = data.get("url")
+    platform = data.get("platform")
+    if not url:
+        return 400, "URL is required"
+    if not platform:
+        return 400, "Platform is required"
+    if platform not in ("YouTube", "Twitter"):
+        return 400, "Unsupported platform"
+    if platform == "YouTube" and not server.extract_youtube_id(url):
+        return 400, "Invalid YouTube URL"
+    return None
+
+
+async def read_body(receive):
+    """读取请求体，超过 MAX_BODY_BYTES 时返回 None"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b""
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        + CORS_HEADERS,
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def parse_content(data, send):
+    error = validate(data)
+    if error:
+        await send_json(send, error[0], {"error": error[1]})
+        return
+    try:
+        card = await build_card_shared(
+            data["url"], data["platform"], server.get_request_twitter_cookies(data)
+        )
+    except Exception as e:
+        await send_json(send, 500, {"error": "extraction-failed", "message": str(e)})
+        return
+    await send_json(send, 200, card)
+
+
+async def stream_youtube_events(url, video_id, cache_key, emit, emit_threadsafe):
+    """与 server.generate_youtube_events 相同的事件顺序"""
+
+    def on_progress(stage, status, detail=None):
+        payload = {"stage": stage, "status": status}
+        if detail:
+            payload["detail"] = detail
+        emit_threadsafe("progress", payload)
+
+    async def load_metadata():
+        metadata = await run_sync(server.fetch_youtube_metadata, video_id, url)
+        emit("meta", {"platform": "YouTube", "title": metadata.get("title", ""), "author": metadata.get("author", "")})
+        return metadata
+
+    metadata_task = asyncio.ensure_future(load_metadata())
+    try:
+        full_text, source, metadata = await run_sync(server.collect_youtube_text, url, video_id, on_progress)
+    except BaseException:
+        metadata_task.cancel()
+        raise
+    try:
+        metadata = metadata or await asyncio.wait_for(asyncio.shield(metadata_task), 5)
+    except Exception:
+        pass
+
+    emit("progress", {"stage": "summary", "status": "running"})
+
+    def summarize():
+        summary_stream = server.stream_summary_with_fallback(full_text, "YouTube")
+        while True:
+            try:
+                item = next(summary_stream)
+            except StopIteration as stop:
+                return stop.value
+            emit_threadsafe(item["type"], item)
+
+    summary_data, used_llm = await run_sync(summarize)
+    card = server.build_youtube_card(full_text, source, metadata, summary_data, used_llm)
+    server.cache_set(cache_key, card)
+    emit("card", card)
+
+
+async def stream_twitter_events(url, data, cache_key, emit):
+    emit("progress", {"stage": "tweet", "status": "running"})
+    title, text, method = await run_sync(server.fetch_twitter_text, url, server.get_request_twitter_cookies(data))
+    emit("meta", {"platform": "Twitter", "title": title, "method": server.TWITTER_METHOD_LABELS.get(method, "未知方式")})
+    summary_data = await run_sync(server.build_twitter_summary, text)
+    card = server.build_twitter_card(title, text, method, summary_data)
+    server.cache_set(cache_key, card)
+    emit("card", card)
+
+
+async def parse_content_stream(data, send):
+    """
+    SSE：事件在事件循环上生成并排入 asyncio.Queue，只有实际执行流水线时才占用线程池，
+    等待进度期间不占线程；超过 5 秒没有事件时发送 keep-alive
+    """
+    error = validate(data)
+    if error:
+        await send_json(send, error[0], {"error": error[1]})
+        return
+    url = data["url"]
+    platform = data["platform"]
+    cache_key = server.get_card_cache_key(url, platform)
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    done = object()
+
+    def emit(event, payload):
+        events.put_nowait(server.format_sse(event, payload))
+
+    def emit_threadsafe(event, payload):
+        loop.call_soon_threadsafe(emit, event, payload)
+
+    async def produce():
+        try:
+            cached = server.cache_get(cache_key)
+            if cached:
+                emit("meta", {"platform": platform, "title": cached.get("title", "")})
+                emit("card", cached)
+            elif platform == "YouTube":
+                await stream_youtube_events(url, server.extract_youtube_id(url), cache_key, emit, emit_threadsafe)
+            else:
+                await stream_twitter_events(url, data, cache_key, emit)
+        except Exception as e:
+            emit("error", {"error": "extraction-failed", "message": str(e)})
+        finally:
+            # 线程中排队的回调先于结束标记执行，事件不会丢失
+            loop.call_soon_threadsafe(events.put_nowait, done)
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ] + CORS_HEADERS,
+    })
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), 5)
+            except asyncio.TimeoutError:
+                event = ": keep-alive\n\n"
+            if event is done:
+                break
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        producer.cancel()
+
+
+ROUTES = {
+    "/api/parse": parse_content,
+    "/api/magic": parse_content,
+    "/api/parse/stream": parse_content_stream,
+    "/api/magic/stream": parse_content_stream,
+}
+
+
+async def lifespan(receive, send):
+    global _HTTP_CLIENT
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _HTTP_CLIENT is not None:
+                await _HTTP_CLIENT.aclose()
+                _HTTP_CLIENT = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"].rstrip("/") or "/"
+    method = scope["method"]
+    handler = ROUTES.get(path)
+    if handler is None:
+        await _FLASK_APP(scope, receive, send)
+        return
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    if method == "GET" and handler is parse_content_stream:
+        data = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    elif method == "POST":
+        body = await read_body(receive)
+        if body is None:
+            await send_json(send, 413, {"error": "Request body too large"})
+            return
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+    else:
+        await send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    begin_request()
+    try:
+        await handler(data, send)
+    finally:
+        write_request_log(path)
@@ -0,0 +1,370 @@
+"""
+长音频分段转写
+ffmpeg 按固定时长把音频切成首尾重叠的片段，有界线程池并发转写，
+再在重叠区内找最长公共片段去重拼接；每个片段的结果通过回调读写缓存，
+失败重试时只转写尚未完成的片段
+流式模式下边下载边切分：字节流写入 ffmpeg 的 segment 复用器，每切出一段立即开始转写
+"""
+import contextvars
+import csv
+import difflib
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+_LATIN_EDGE_RE = re.compile(r"[A-Za-z0-9]")
+
+
+class AudioTooLargeError(RuntimeError):
+    pass
+
+
+def is_ffmpeg_available(require_probe=False):
+    """按文件分段需要 ffprobe 读取时长，流式切分只需要 ffmpeg"""
+    if require_probe and not shutil.which("ffprobe"):
+        return False
+    return bool(shutil.which("ffmpeg"))
+
+
+def probe_duration(path):
+    """返回音频时长（秒），无法识别时返回 None"""
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", path],
+            capture_output=True,
+            check=True,
+            timeout=30,
+        ).stdout
+        return float(json.loads(output)["format"]["duration"])
+    except Exception:
+        return None
+
+
+def plan_segments(duration, segment_seconds, overlap_seconds):
+    """
+    第 i 段覆盖 [i*segment_seconds - overlap_seconds, (i+1)*segment_seconds)，
+    即每段向前多取 overlap_seconds 秒，与流式切分的片段边界一致，两种模式可共用片段缓存
+
+    Returns:
+        list: [(start, length), ...]
+    """
+    segment_seconds = max(1.0, float(segment_seconds))
+    overlap_seconds = max(0.0, min(float(overlap_seconds), segment_seconds / 2))
+    segments = []
+    boundary = 0.0
+    while boundary < duration:
+        start = max(0.0, boundary - overlap_seconds)
+        segments.append((start, min(boundary + segment_seconds, duration) - start))
+        boundary += segment_seconds
+    return segments or [(0.0, float(duration))]
+
+
+def extract_segment(path, out_dir, index, start, length):
+    """直接拷贝音频流，不重新编码；输出扩展名沿用源文件，Whisper 可识别"""
+    ext = os.path.splitext(path)[1] or ".m4a"
+    out_path = os.path.join(out_dir, f"segment-{index:04d}{ext}")
+    subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-v", "error", "-y",
+            "-ss", f"{start:.3f}", "-t", f"{length:.3f}",
+            "-i", path, "-vn", "-c:a", "copy", out_path,
+        ],
+        capture_output=True,
+        check=True,
+        timeout=max(60, int(length)),
+    )
+    return out_path
+
+
+def _join(left, right):
+    if left and right and _LATIN_EDGE_RE.match(left[-1]) and _LATIN_EDGE_RE.match(right[0]):
+        return f"{left} {right}"
+    return left + right
+
+
+def merge_overlap(left, right, window_chars, min_match=8):
+    """
+    拼接相邻片段的转写结果：在 left 末尾与 right 开头各取 window_chars 个字符，
+    找到最长公共片段后从该处接上，避免重叠区的内容重复；找不到足够长的公共片段时直接拼接
+    window_chars 应与重叠区的文字量相当，窗口过大时重复性强的口语容易错配
+    """
+    left = left.rstrip()
+    right = right.lstrip()
+    if not left or not right:
+        return left or right
+    tail = left[-window_chars:]
+    head = right[:window_chars]
+    match = difflib.SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(
+        0, len(tail), 0, len(head)
+    )
+    if match.size < min_match:
+        return _join(left, right)
+    return left[: len(left) - len(tail) + match.a] + right[match.b :]
+
+
+def stitch_segments(texts, segments, overlap_seconds, min_match=8):
+    """按前一片段的语速估算重叠区字数，取两倍作为搜索窗口"""
+    merged = ""
+    for text, (_, length) in zip(texts, segments):
+        text = text or ""
+        if merged:
+            chars_per_second = len(previous) / max(previous_length, 1.0)
+            window_chars = int(overlap_seconds * chars_per_second * 2) + min_match * 2
+            merged = merge_overlap(merged, text, window_chars, min_match)
+        else:
+            merged = text.strip()
+        previous, previous_length = text, length
+    return merged
+
+
+def segment_key(start, length):
+    return f"{start:.0f}+{length:.0f}"
+
+
+def transcribe_in_segments(
+    path,
+    transcribe,
+    executor,
+    work_dir,
+    segment_seconds=600,
+    overlap_seconds=5,
+    load_cached=None,
+    save_cached=None,
+    on_progress=None,
+):
+    """
+    Args:
+        transcribe: transcribe(segment_path) -> str
+        executor: 共享的有界线程池
+        load_cached / save_cached: 以 segment_key 读写单个片段的转写结果
+        on_progress: on_progress(done, total)
+
+    Returns:
+        str: 去重拼接后的全文；任一片段失败时抛出其异常（已完成的片段已缓存）
+    """
+    duration = probe_duration(path)
+    if not duration:
+        raise RuntimeError("无法识别音频时长。")
+    segments = plan_segments(duration, segment_seconds, overlap_seconds)
+    texts = [None] * len(segments)
+    for index, (start, length) in enumerate(segments):
+        if load_cached:
+            texts[index] = load_cached(segment_key(start, length))
+
+    total = len(segments)
+    done = sum(1 for text in texts if text is not None)
+    if on_progress:
+        on_progress(done, total)
+
+    def run(index, start, length):
+        if total == 1:
+            segment_path = path
+        else:
+            segment_path = extract_segment(path, work_dir, index, start, length)
+        try:
+            text = transcribe(segment_path)
+        finally:
+            if segment_path != path:
+                os.remove(segment_path)
+        if save_cached and text:
+            save_cached(segment_key(start, length), text)
+        return index, text
+
+    futures = [
+        executor.submit(contextvars.copy_context().run, run, index, start, length)
+        for index, (start, length) in enumerate(segments)
+        if texts[index] is None
+    ]
+    pending = set(futures)
+    while pending:
+        # 每完成一段就上报进度；任一段失败时取消其余尚未开始的片段
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            if future.exception() is not None:
+                for other in pending:
+                    other.cancel()
+                raise future.exception()
+            index, text = future.result()
+            texts[index] = text
+            done += 1
+            if on_progress:
+                on_progress(done, total)
+
+    return stitch_segments(texts, segments, overlap_seconds)
+
+
+def get_stream_work_dir():
+    """流式切分的临时目录：优先使用内存文件系统 /dev/shm"""
+    configured = os.getenv("AUDIO_STREAM_DIR", "").strip()
+    if configured:
+        return configured
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _concat_with_overlap(work_dir, index, previous, current, overlap_seconds):
+    """把上一段末尾 overlap_seconds 秒与当前段拼成一个文件（流拷贝）"""
+    prev_path, prev_start, prev_end = previous
+    path, _, _ = current
+    list_path = os.path.join(work_dir, f"concat-{index:04d}.txt")
+    inpoint = max(0.0, prev_end - prev_start - overlap_seconds)
+    with open(list_path, "w", encoding="utf-8") as list_file:
+        list_file.write(f"file '{prev_path}'\ninpoint {inpoint:.3f}\nfile '{path}'\n")
+    out_path = os.path.join(work_dir, f"segment-{index:04d}{os.path.splitext(path)[1]}")
+    try:
+        subprocess.run(
+            [
+                "ffmpeg", "-nostdin", "-v", "error", "-y",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-c", "copy", out_path,
+            ],
+            capture_output=True,
+            check=True,
+            timeout=120,
+        )
+    finally:
+        os.remove(list_path)
+    return out_path
+
+
+def transcribe_stream(
+    chunks,
+    transcribe,
+    executor,
+    ext="m4a",
+    segment_seconds=600,
+    overlap_seconds=5,
+    max_bytes=None,
+    expected_duration=None,
+    load_cached=None,
+    save_cached=None,
+    on_progress=None,
+):
+    """
+    边下载边转写：chunks 为音频字节块的迭代器，写入 ffmpeg stdin 后按 segment_seconds 切段，
+    ffmpeg 每写完一段会在 segment 列表中追加一行，此时把上一段末尾 overlap_seconds 秒
+    拼到这一段前面提交转写，下载与转写重叠进行
+
+    Args:
+        max_bytes: 下载字节上限，超过时立即停止并抛出 AudioTooLargeError
+        expected_duration: 已知时长时用于估算总段数（进度显示）
+
+    Returns:
+        str: 去重拼接后的全文
+    """
+    work_dir = tempfile.mkdtemp(dir=get_stream_work_dir(), prefix="audio-stream-")
+    list_path = os.path.join(work_dir, "segments.csv")
+    process = subprocess.Popen(
+        [
+            "ffmpeg", "-nostdin", "-v", "error", "-i", "pipe:0", "-vn", "-c:a", "copy",
+            "-f", "segment", "-segment_time", f"{segment_seconds:g}", "-reset_timestamps", "1",
+            "-segment_list", list_path, "-segment_list_type", "csv",
+            os.path.join(work_dir, f"piece-%04d.{ext}"),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    pieces = []
+    segments = []
+    texts = []
+    futures = []
+    total = max(1, math.ceil(expected_duration / segment_seconds)) if expected_duration else None
+    state = {"list_offset": 0, "done": 0}
+
+    def report():
+        if on_progress:
+            on_progress(state["done"], max(total or 0, len(segments)) or None)
+
+    def run(index, previous, current):
+        if previous is None:
+            segment_path = current[0]
+        else:
+            segment_path = _concat_with_overlap(work_dir, index, previous, current, overlap_seconds)
+        try:
+            text = transcribe(segment_path)
+        finally:
+            if segment_path != current[0]:
+                os.remove(segment_path)
+        if save_cached and text:
+            save_cached(segment_key(*segments[index]), text)
+        return text
+
+    def collect_finished_pieces():
+        if not os.path.exists(list_path):
+            return
+        with open(list_path, encoding="utf-8") as list_file:
+            list_file.seek(state["list_offset"])
+            data = list_file.read()
+        # 只处理已写完整的行
+        complete = data[: data.rfind("\n") + 1]
+        state["list_offset"] += len(complete.encode("utf-8"))
+        for name, start, end in csv.reader(complete.splitlines()):
+            current = (os.path.join(work_dir, name), float(start), float(end))
+            index = len(pieces)
+            previous = pieces[-1] if pieces else None
+            pieces.append(current)
+            if previous is None:
+                segments.append((0.0, current[2] - current[1]))
+            else:
+                overlap = min(overlap_seconds, previous[2] - previous[1])
+                segments.append((current[1] - overlap, current[2] - current[1] + overlap))
+            cached = load_cached(segment_key(*segments[index])) if load_cached else None
+            if cached:
+                texts.append(cached)
+                state["done"] += 1
+                report()
+                continue
+            texts.append(None)
+            futures.append((index, executor.submit(contextvars.copy_context().run, run, index, previous, current)))
+
+    def collect_results(block):
+        for index, future in list(futures):
+            if not block and not future.done():
+                continue
+            texts[index] = future.result()
+            futures.remove((index, future))
+            state["done"] += 1
+            report()
+
+    received = 0
+    try:
+        report()
+        try:
+            for chunk in chunks:
+                received += len(chunk)
+                if max_bytes and received > max_bytes:
+                    raise AudioTooLargeError(
+                        f"音频超过 {max_bytes // (1024 * 1024)}MB 上限，已停止下载。"
+                    )
+                process.stdin.write(chunk)
+                collect_finished_pieces()
+                collect_results(block=False)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+        if process.wait(timeout=120) != 0:
+            raise RuntimeError(f"ffmpeg 切分音频失败（exit {process.returncode}）。")
+        collect_finished_pieces()
+        collect_results(block=True)
+        if not pieces:
+            raise RuntimeError("音频流为空。")
+        return stitch_segments(texts, segments, overlap_seconds)
+    except BaseException:
+        for _, future in futures:
+            future.cancel()
+        raise
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        # 失败时仍在运行的转写任务会因片段文件被删除而自行结束
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,216 @@
+"""
+离线批量摘要（夜间回填）
+先并发收集每个视频的文本（写入字幕存储），再把摘要请求打包提交到
+OpenAI Batch API，轮询完成后用与交互路径相同的 parse_summary_content 解析，
+结果写入摘要缓存（SQLite，跨进程持久）；web 进程处理同一视频时字幕存储与摘要缓存都会命中，
+不再重新抓取或调用 LLM
+"""
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+from extractive import summarize_extractive
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchTimeoutError(RuntimeError):
+    def __init__(self, batch_id, status, timeout_seconds):
+        super().__init__(f"批量任务 {batch_id} 在 {timeout_seconds} 秒内未完成（状态：{status}）。")
+        self.batch_id = batch_id
+        self.status = status
+
+
+def collect_batch_item(url):
+    """
+    获取单个视频的文本与摘要输入；已有摘要缓存时标记 cached，不再提交
+    """
+    video_id = server.extract_youtube_id(url)
+    if not video_id:
+        return {"url": url, "error": "Invalid YouTube URL"}
+    try:
+        full_text, source, metadata = server.run_with_background_priority(
+            server.collect_youtube_text, url, video_id
+        )
+    except Exception as exc:
+        return {"url": url, "video_id": video_id, "error": str(exc)}
+    llm_input = server.prepare_summary_input(full_text)
+    return {
+        "url": url,
+        "video_id": video_id,
+        "full_text": full_text,
+        "source": source,
+        "metadata": metadata,
+        "snippet": server.get_summary_snippet(llm_input),
+        "cached": server.load_any_cached_summary(llm_input, "YouTube"),
+    }
+
+
+def collect_batch_items(urls, workers=4):
+    seen = set()
+    unique_urls = []
+    for url in urls:
+        if url and url not in seen:
+            seen.add(url)
+            unique_urls.append(url)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(collect_batch_item, unique_urls))
+
+
+def build_batch_request(custom_id, snippet, model, platform="YouTube"):
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": server.SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": server.build_summary_user_prompt(platform, snippet)},
+            ],
+            "response_format": {"type": "json_object"},
+        },
+    }
+
+
+def submit_openai_batch(client, requests_lines):
+    payload = "\n".join(json.dumps(line, ensure_ascii=False) for line in requests_lines).encode("utf-8")
+    input_file = client.files.create(file=("summary-batch.jsonl", io.BytesIO(payload)), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"prompt": f"{server.SUMMARY_PROMPT_NAME}:{server.SUMMARY_PROMPT_VERSION}"},
+    )
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_seconds=30, timeout_seconds=24 * 3600, on_poll=None):
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if on_poll:
+            on_poll(batch)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if time.monotonic() >= deadline:
+            raise BatchTimeoutError(batch_id, batch.status, timeout_seconds)
+        time.sleep(poll_seconds)
+
+
+def read_batch_output(client, batch):
+    """
+    Returns:
+        dict: custom_id -> 模型输出文本（该条失败时为 None）
+    """
+    outputs = {}
+    if getattr(batch, "output_file_id", None):
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            content = None
+            if response.get("status_code") == 200:
+                choices = (response.get("body") or {}).get("choices") or []
+                if choices:
+                    content = (choices[0].get("message") or {}).get("content")
+            outputs[record.get("custom_id")] = content
+    if getattr(batch, "error_file_id", None):
+        for line in client.files.content(batch.error_file_id).text.splitlines():
+            if line.strip():
+                outputs.setdefault(json.loads(line).get("custom_id"), None)
+    return outputs
+
+
+def finalize_item(item, summary_data, used_llm):
+    return server.build_youtube_card(
+        item["full_text"], item["source"], item["metadata"], summary_data, used_llm
+    )
+
+
+def run_batch(urls, poll_seconds=30, timeout_seconds=24 * 3600, chunk_size=None, workers=4, on_progress=None):
+    """
+    批量生成摘要
+
+    Args:
+        urls: YouTube 链接列表
+        chunk_size: 单个批量任务最多包含的请求数
+        on_progress: 回调 on_progress(message)
+
+    Returns:
+        dict: 每个链接的处理结果与汇总计数；某个批量任务超时时，此前已完成的任务照常写入缓存，
+        超时任务的条目标记为 timeout（附 batch_id），其后的条目标记为 skipped 不再提交
+    """
+    def report(message):
+        if on_progress:
+            on_progress(message)
+
+    client = server.get_openai_client()
+    if not client:
+        raise RuntimeError("未配置 OPENAI_API_KEY 或 OpenAI SDK 未安装，无法提交批量任务。")
+    model = server.get_openai_model_name()
+    chunk_size = chunk_size or int(os.getenv("BATCH_MAX_REQUESTS", "1000"))
+
+    items = collect_batch_items(urls, workers=workers)
+    report(f"collected {len(items)} items")
+    results = {}
+    pending = []
+    for item in items:
+        if item.get("error"):
+            results[item["url"]] = {"status": "error", "error": item["error"]}
+        elif item.get("cached"):
+            finalize_item(item, item["cached"], True)
+            results[item["url"]] = {"status": "cached"}
+        else:
+            pending.append(item)
+
+    timed_out = None
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start : start + chunk_size]
+        if timed_out:
+            for item in chunk:
+                results[item["url"]] = {"status": "skipped"}
+            continue
+        by_id = {f"{start + offset}-{item['video_id']}": item for offset, item in enumerate(chunk)}
+        batch_id = submit_openai_batch(
+            client, [build_batch_request(custom_id, item["snippet"], model) for custom_id, item in by_id.items()]
+        )
+        report(f"submitted batch {batch_id} with {len(by_id)} requests")
+        try:
+            batch = wait_for_batch(
+                client,
+                batch_id,
+                poll_seconds=poll_seconds,
+                timeout_seconds=timeout_seconds,
+                on_poll=lambda b: report(f"batch {b.id}: {b.status}"),
+            )
+        except BatchTimeoutError as exc:
+            report(str(exc))
+            timed_out = exc
+            for item in chunk:
+                results[item["url"]] = {"status": "timeout", "batch_id": exc.batch_id, "batch_status": exc.status}
+            continue
+        outputs = read_batch_output(client, batch) if batch.status == "completed" else {}
+        for custom_id, item in by_id.items():
+            summary_data = server.parse_summary_content(outputs.get(custom_id))
+            if summary_data:
+                server.store_cached_summary(item["snippet"], "YouTube", "openai", model, summary_data)
+                finalize_item(item, summary_data, True)
+                results[item["url"]] = {"status": "summarized"}
+            else:
+                # 失败的条目不写摘要缓存，下次回填会重新提交
+                finalize_item(item, summarize_extractive(item["full_text"]), False)
+                results[item["url"]] = {"status": "fallback", "batch_status": batch.status}
+
+    counts = {}
+    for value in results.values():
+        counts[value["status"]] = counts.get(value["status"], 0) + 1
+    report_data = {"results": results, "counts": counts}
+    if timed_out:
+        report_data["timed_out_batch"] = timed_out.batch_id
+    return report_data
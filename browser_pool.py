@@ -0,0 +1,328 @@
+"""
+常驻 Playwright 浏览器池（Twitter DOM 兜底抓取）
+每个 worker 进程一个常驻 Chromium，运行在独立的事件循环线程上（异步 API，任意线程都可以提交任务）；
+每个请求使用独立的 BrowserContext（cookie 互不影响），拦截图片 / 字体 / 媒体请求，
+并发页面数有上限；浏览器服务满 N 个页面或内存超过上限后退役，新请求使用新浏览器，
+旧浏览器在其页面全部结束后关闭
+传入 context_key 时复用该键对应的常驻 BrowserContext（cookie 只在创建时写入一次），
+常驻 context 数量与浏览器内存各有上限，空闲超时、数量超出上限或内存超过上限时关闭最久未用的
+"""
+import asyncio
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+def _descendant_rss_bytes():
+    """当前进程所有子孙进程（Playwright 驱动与 Chromium）的 RSS 之和，无 /proc 时返回 0"""
+    try:
+        parents = {}
+        rss = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "rb") as stat_file:
+                    fields = stat_file.read().rsplit(b")", 1)[1].split()
+            except OSError:
+                continue
+            parents[int(entry)] = int(fields[1])
+            rss[int(entry)] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+    root = os.getpid()
+    total = 0
+    for pid in rss:
+        ancestor = parents.get(pid)
+        while ancestor and ancestor != root:
+            ancestor = parents.get(ancestor)
+        if ancestor == root:
+            total += rss[pid]
+    return total
+
+
+async def _measure_rss():
+    """在线程池中扫描 /proc，避免阻塞浏览器事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(None, _descendant_rss_bytes)
+
+
+class _BrowserEntry:
+    __slots__ = ("browser", "served", "active", "retired")
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.served = 0
+        self.active = 0
+        self.retired = False
+
+
+class _ContextEntry:
+    __slots__ = ("context", "browser_entry", "active", "last_used")
+
+    def __init__(self, context, browser_entry):
+        self.context = context
+        self.browser_entry = browser_entry
+        self.active = 0
+        self.last_used = time.monotonic()
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        max_pages=2,
+        recycle_pages=50,
+        recycle_rss_bytes=0,
+        blocked_resource_types=("image", "font", "media"),
+        user_agent=DEFAULT_USER_AGENT,
+        max_contexts=8,
+        context_ttl_seconds=900,
+        context_rss_bytes=0,
+    ):
+        """
+        Args:
+            max_pages: 同时打开的页面上限，超出的请求排队
+            recycle_pages: 浏览器服务多少个页面后退役
+            recycle_rss_bytes: 浏览器相关进程的 RSS 超过该值时退役（0 表示不检查）
+            max_contexts: 常驻（按 context_key 复用）的 BrowserContext 数量上限
+            context_ttl_seconds: 常驻 context 的空闲超时
+            context_rss_bytes: 浏览器相关进程的 RSS 超过该值时关闭最久未用的空闲常驻 context
+                （0 表示不检查；应低于 recycle_rss_bytes，先释放 context 再退役浏览器）
+        """
+        self.max_pages = max(1, max_pages)
+        self.recycle_pages = recycle_pages
+        self.recycle_rss_bytes = recycle_rss_bytes
+        self.blocked_resource_types = frozenset(blocked_resource_types)
+        self.user_agent = user_agent
+        self.max_contexts = max(0, max_contexts)
+        self.context_ttl_seconds = context_ttl_seconds
+        self.context_rss_bytes = context_rss_bytes
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._playwright = None
+        self._current = None
+        self._semaphore = None
+        self._launching = None
+        self.stats = {
+            "launches": 0, "recycled": 0, "pages": 0, "blocked_requests": 0,
+            "contexts": 0, "context_reuses": 0, "contexts_evicted": 0, "contexts_evicted_rss": 0,
+            "disconnected": 0,
+        }
+
+    def _ensure_loop(self):
+        with self._lock:
+            # fork 之后父进程的事件循环线程不存在，重新创建
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True)
+                thread.start()
+                self._loop = loop
+                self._pid = os.getpid()
+                self._playwright = None
+                self._current = None
+                self._launching = None
+                self._semaphore = None
+                self._contexts = OrderedDict()
+                atexit.register(self.close)
+            return self._loop
+
+    async def _get_browser(self):
+        if self._current and not self._current.retired and not self._current.browser.is_connected():
+            self._mark_disconnected(self._current)
+        if self._current and not self._current.retired:
+            return self._current
+        # 多个请求同时发现需要新浏览器时只启动一次
+        if self._launching is None:
+            self._launching = asyncio.ensure_future(self._launch())
+        try:
+            return await asyncio.shield(self._launching)
+        finally:
+            if self._launching is not None and self._launching.done():
+                self._launching = None
+
+    async def _launch(self):
+        if self._playwright is None:
+            from playwright.async_api import async_playwright
+
+            self._playwright = await async_playwright().start()
+        browser = await self._playwright.chromium.launch(headless=True)
+        entry = _BrowserEntry(browser)
+        # Chromium 崩溃或连接断开后立即退役，下一个请求启动新浏览器
+        browser.on("disconnected", lambda _: self._mark_disconnected(entry))
+        self._current = entry
+        self.stats["launches"] += 1
+        return entry
+
+    def _mark_disconnected(self, entry):
+        if entry.retired:
+            return
+        entry.retired = True
+        self.stats["disconnected"] += 1
+        if self._current is entry:
+            self._current = None
+        for key in [key for key, held in self._contexts.items() if held.browser_entry is entry]:
+            del self._contexts[key]
+
+    async def _block_resources(self, route):
+        if route.request.resource_type in self.blocked_resource_types:
+            self.stats["blocked_requests"] += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _retire_if_needed(self, entry):
+        if not entry.retired and (
+            (self.recycle_pages and entry.served >= self.recycle_pages)
+            or (self.recycle_rss_bytes and await _measure_rss() > self.recycle_rss_bytes)
+        ):
+            entry.retired = True
+            self.stats["recycled"] += 1
+            if self._current is entry:
+                self._current = None
+        if entry.retired and entry.active == 0:
+            # 退役浏览器上的常驻 context 随浏览器一起关闭
+            for key in [key for key, held in self._contexts.items() if held.browser_entry is entry]:
+                del self._contexts[key]
+            try:
+                await entry.browser.close()
+            except Exception:
+                # 已断开的浏览器关闭时可能报错
+                pass
+
+    async def _new_context(self, entry, cookies, user_agent):
+        context = await entry.browser.new_context(user_agent=user_agent or self.user_agent)
+        if self.blocked_resource_types:
+            await context.route("**/*", self._block_resources)
+        if cookies:
+            await context.add_cookies(cookies)
+        return context
+
+    async def _evict_contexts(self, reserve=0):
+        """
+        关闭空闲超时的常驻 context；数量超出上限时再关闭最久未用的空闲 context；
+        浏览器内存超过 context_rss_bytes 时继续按最久未用的顺序关闭空闲 context，直到回落到上限以下；
+        内存每轮只测一次，之后只在关闭 context 后重测
+        """
+        now = time.monotonic()
+        for key, held in list(self._contexts.items()):
+            over_limit = len(self._contexts) + reserve > self.max_contexts
+            expired = now - held.last_used >= self.context_ttl_seconds
+            if held.active == 0 and (expired or over_limit):
+                del self._contexts[key]
+                self.stats["contexts_evicted"] += 1
+                await held.context.close()
+        if not self.context_rss_bytes or not any(held.active == 0 for held in self._contexts.values()):
+            return
+        rss = await _measure_rss()
+        for key, held in list(self._contexts.items()):
+            if rss <= self.context_rss_bytes:
+                break
+            if held.active == 0:
+                del self._contexts[key]
+                self.stats["contexts_evicted_rss"] += 1
+                await held.context.close()
+                rss = await _measure_rss()
+
+    async def _acquire_context(self, entry, key, cookies, user_agent):
+        held = self._contexts.get(key)
+        if held and held.browser_entry is not entry:
+            # 浏览器已更换，旧 context 由旧浏览器关闭时一并释放
+            del self._contexts[key]
+            held = None
+        if held:
+            self._contexts.move_to_end(key)
+            self.stats["context_reuses"] += 1
+        else:
+            await self._evict_contexts(reserve=1)
+            held = _ContextEntry(await self._new_context(entry, cookies, user_agent), entry)
+            self._contexts[key] = held
+            self.stats["contexts"] += 1
+        held.active += 1
+        return held
+
+    async def _run(self, page_fn, cookies, user_agent, context_key):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pages)
+        async with self._semaphore:
+            entry = await self._get_browser()
+            entry.active += 1
+            try:
+                if context_key is not None and self.max_contexts:
+                    held = await self._acquire_context(entry, context_key, cookies, user_agent)
+                    page = None
+                    try:
+                        page = await held.context.new_page()
+                        self.stats["pages"] += 1
+                        return await page_fn(page)
+                    finally:
+                        held.active -= 1
+                        held.last_used = time.monotonic()
+                        if page is not None:
+                            await page.close()
+                context = await self._new_context(entry, cookies, user_agent)
+                try:
+                    page = await context.new_page()
+                    self.stats["pages"] += 1
+                    return await page_fn(page)
+                finally:
+                    await context.close()
+            finally:
+                entry.active -= 1
+                entry.served += 1
+                await self._retire_if_needed(entry)
+                await self._evict_contexts()
+
+    def run(self, page_fn, cookies=None, user_agent=None, timeout=60, context_key=None):
+        """
+        在池中的浏览器上执行 page_fn(page)（协程函数），返回其结果；
+        超时或出错时抛出异常（超时会取消页面任务并关闭其页面）
+        context_key 不为空时复用该键的常驻 context，cookies 只在首次创建时写入
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(page_fn, cookies, user_agent, context_key), self._ensure_loop()
+        )
+        try:
+            return future.result(timeout=timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def _close_context(self, key):
+        held = self._contexts.get(key)
+        if held and held.active == 0:
+            del self._contexts[key]
+            await held.context.close()
+
+    def close_context(self, key):
+        """关闭 key 对应的常驻 context（会话失效或被淘汰时调用）；正在使用时留给空闲超时处理"""
+        loop = self._loop
+        if loop is None or self._pid != os.getpid() or not loop.is_running():
+            return
+        asyncio.run_coroutine_threadsafe(self._close_context(key), loop)
+
+    async def _close(self):
+        self._contexts.clear()
+        if self._current:
+            await self._current.browser.close()
+            self._current = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def close(self):
+        loop = self._loop
+        if loop is None or self._pid != os.getpid() or not loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout=10)
+        except Exception:
+            pass
@@ -0,0 +1,227 @@
+"""
+字幕轨道统一选择模块
+把 Player / TimedText / Piped / Lemnos / yt-dlp 各自的轨道描述归一化为同一种记录，
+并按语言偏好一次遍历选出最佳轨道
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+
+def make_track(provider, language, url, name="", kind="", is_translated=False, ext="vtt"):
+    kind = (kind or "").lower()
+    return {
+        "provider": provider,
+        "language": language or "",
+        "name": name or "",
+        "kind": kind,
+        "is_asr": kind == "asr",
+        "is_translated": bool(is_translated),
+        "url": url or "",
+        "ext": ext,
+    }
+
+
+def ensure_vtt_format(caption_url):
+    if caption_url and "fmt=" not in caption_url:
+        sep = "&" if "?" in caption_url else "?"
+        caption_url = f"{caption_url}{sep}fmt=vtt"
+    return caption_url
+
+
+def _track_name(raw):
+    name = raw.get("name") or ""
+    if isinstance(name, dict):
+        name = name.get("simpleText") or "".join(
+            run.get("text", "") for run in name.get("runs", []) if isinstance(run, dict)
+        )
+    return name
+
+
+def normalize_player_tracks(caption_tracks, provider="player"):
+    """ytInitialPlayerResponse / Lemnos 的 captionTracks"""
+    tracks = []
+    for raw in caption_tracks or []:
+        url = ensure_vtt_format(raw.get("baseUrl") or raw.get("url") or "")
+        kind = raw.get("kind") or ("asr" if (raw.get("vssId") or "").startswith("a.") else "")
+        tracks.append(
+            make_track(
+                provider,
+                raw.get("languageCode") or "",
+                url,
+                name=_track_name(raw),
+                kind=kind,
+                is_translated="tlang=" in url,
+            )
+        )
+    return tracks
+
+
+def normalize_timedtext_tracks(track_nodes, base, video_id):
+    """timedtext ?type=list 返回的 <track> 节点"""
+    tracks = []
+    for node in track_nodes or []:
+        lang_code = node.get("lang_code") or ""
+        if not lang_code:
+            continue
+        name = node.get("name") or ""
+        kind = node.get("kind") or ""
+        url = f"{base}?lang={quote(lang_code)}&v={video_id}&fmt=vtt"
+        if name:
+            url = f"{url}&name={quote(name)}"
+        if kind:
+            url = f"{url}&kind={quote(kind)}"
+        tracks.append(make_track("timedtext", lang_code, url, name=name, kind=kind))
+    return tracks
+
+
+def normalize_piped_tracks(captions, base):
+    tracks = []
+    for raw in captions or []:
+        url = raw.get("url") or ""
+        if url.startswith("/"):
+            url = f"{base}{url}"
+        label = raw.get("label") or ""
+        code = raw.get("languageCode") or raw.get("language") or raw.get("code") or ""
+        lowered = label.lower()
+        kind = "asr" if raw.get("autoGenerated") or "auto-generated" in lowered or "自动" in label else ""
+        tracks.append(
+            make_track(
+                "piped",
+                code or label,
+                url,
+                name=label,
+                kind=kind,
+                is_translated="tlang=" in url or "translated" in lowered,
+            )
+        )
+    return tracks
+
+
+def normalize_ytdlp_tracks(info, preferred_ext="vtt"):
+    """yt-dlp info dict 的 subtitles（人工）与 automatic_captions（ASR / 机翻）"""
+    tracks = []
+    for field, kind in (("subtitles", ""), ("automatic_captions", "asr")):
+        for lang, formats in (info.get(field) or {}).items():
+            if lang == "live_chat" or not formats:
+                continue
+            chosen = next((f for f in formats if f.get("ext") == preferred_ext), formats[0])
+            url = chosen.get("url") or ""
+            tracks.append(
+                make_track(
+                    "ytdlp",
+                    lang,
+                    url,
+                    name=chosen.get("name") or "",
+                    kind=kind,
+                    is_translated="tlang=" in url,
+                    ext=chosen.get("ext") or preferred_ext,
+                )
+            )
+    return tracks
+
+
+def _language_prefixes(code):
+    parts = code.replace("_", "-").split("-")
+    return ["-".join(parts[:i]) for i in range(len(parts) - 1, 0, -1)]
+
+
+def _build_preference_index(languages):
+    exact = {}
+    family = {}
+    for index, lang in enumerate(languages):
+        code = lang.lower().replace("_", "-")
+        exact.setdefault(code, index)
+        for prefix in _language_prefixes(code):
+            family.setdefault(prefix, index)
+    return exact, family
+
+
+def rank_key(track, exact, family, position):
+    """
+    排序键（越小越好）：
+    命中偏好语言的原始轨道 > 命中偏好语言的机翻轨道 > 未命中；
+    同一层内按偏好顺序，再按 精确匹配 > 前缀匹配 > 人工字幕 > ASR
+    """
+    code = track["language"].lower().replace("_", "-")
+    pref_index = exact.get(code)
+    match_class = 0
+    if pref_index is None:
+        match_class = 1
+        # 轨道 zh-Hant 命中偏好 zh；轨道 zh 命中偏好 zh-CN
+        for prefix in _language_prefixes(code):
+            if prefix in exact:
+                pref_index = exact[prefix]
+                break
+        else:
+            pref_index = family.get(code)
+    matched = pref_index is not None
+    return (
+        0 if matched else 1,
+        track["is_translated"],
+        pref_index if matched else 0,
+        match_class,
+        track["is_asr"],
+        position,
+    )
+
+
+def select_caption_track(tracks, languages, exclude_urls=None):
+    exact, family = _build_preference_index(languages)
+    exclude_urls = exclude_urls or ()
+    best = None
+    best_key = None
+    for position, track in enumerate(tracks):
+        if not track.get("url") or track["url"] in exclude_urls:
+            continue
+        key = rank_key(track, exact, family, position)
+        if best_key is None or key < best_key:
+            best, best_key = track, key
+    return best
+
+
+class CaptionTrackCache:
+    """
+    每个视频已列出的轨道（小型 LRU，不占用响应缓存的名额），供后续方法直接复用；
+    下载失败的轨道 URL 记录为不可变集合，更新时在锁内整体替换
+    """
+
+    def __init__(self, max_items=128, ttl_seconds=3600):
+        self.max_items = max(1, max_items)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _get_locked(self, video_id):
+        entry = self._entries.get(video_id)
+        if entry is None:
+            return None
+        if self.ttl_seconds > 0 and time.monotonic() - entry[2] > self.ttl_seconds:
+            self._entries.pop(video_id, None)
+            return None
+        self._entries.move_to_end(video_id)
+        return entry
+
+    def get(self, video_id):
+        """返回 (tracks, failed_urls)；未记录或已过期时返回 None"""
+        with self._lock:
+            entry = self._get_locked(video_id)
+        return (entry[0], entry[1]) if entry else None
+
+    def remember(self, video_id, tracks):
+        """已有记录时保留原记录（连同失败的 URL）"""
+        if not tracks or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            if self._get_locked(video_id):
+                return
+            self._entries[video_id] = (tuple(tracks), frozenset(), time.monotonic())
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def mark_failed(self, video_id, url):
+        with self._lock:
+            entry = self._get_locked(video_id)
+            if entry:
+                self._entries[video_id] = (entry[0], entry[1] | {url}, entry[2])
@@ -0,0 +1,328 @@
+"""
+本地抽取式文本压缩 / 摘要模块
+不依赖网络与第三方库，对中英文长文本做句子切分、TF-IDF 打分，
+并在给定字符 / token 预算内抽取最有信息量的句子（保持原文顺序、覆盖全文），
+LLM 不可用时也可直接生成摘要 + 要点
+"""
+import math
+import re
+from collections import Counter
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_CJK_RUN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+# 句子边界两侧为中文字符或全角标点时不加空格
+_CJK_EDGE_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9'\-]*|\d+(?:\.\d+)?")
+_SENTENCE_RE = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*|[^\S\n]*\n")
+_LATIN_END_RE = re.compile(r"(?<=[a-z0-9\)\"'][.])\s+(?=[A-Z0-9\"'])")
+_CLAUSE_RE = re.compile(r"[，,、：:；;（）()【】\[\]“”\"—…。！？!?]+|\s+-+\s+")
+
+_EN_STOPWORDS = frozenset(
+    """
+    a an the and or but if then else of to in on at by for with from as is are was were be been
+    being it its this that these those i you he she we they me him her us them my your his our
+    their so not no do does did have has had will would can could should may might just also
+    than too very there here what which who whom when where why how all any each some such only
+    own same into over out up down about again further once more most other both few s t don
+    yeah uh um oh okay like gonna got get really know think going right well now
+    """.split()
+)
+
+# 只在语气词 / 结构助词处断开中文二元组；“有”“不”“会”“要”这类字常是实词的一部分（没有、不同、会议），保留
+_ZH_FUNCTION_TABLE = str.maketrans(dict.fromkeys("的了着吗呢吧啊呀嘛哦呗", " "))
+
+# 单句过长时（无标点的自动字幕）按此长度再切分
+MAX_SENTENCE_CHARS = 160
+
+
+def contains_cjk(text):
+    return bool(_CJK_RE.search(text or ""))
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：CJK 字符约 1 token，其余约 4 字符 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _chunk_long_sentence(sentence, limit):
+    if len(sentence) <= limit:
+        return [sentence]
+    chunks = []
+    if " " in sentence:
+        current = []
+        size = 0
+        for word in sentence.split():
+            if current and size + len(word) + 1 > limit:
+                chunks.append(" ".join(current))
+                current = []
+                size = 0
+            current.append(word)
+            size += len(word) + 1
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+    return [sentence[i : i + limit] for i in range(0, len(sentence), limit)]
+
+
+def split_sentences(text, max_sentence_chars=MAX_SENTENCE_CHARS):
+    """按中英文标点切句；缺少标点的字幕按长度切块"""
+    sentences = []
+    for match in _SENTENCE_RE.finditer(text or ""):
+        block = match.group(0).strip()
+        if not block:
+            continue
+        for part in _LATIN_END_RE.split(block):
+            part = part.strip()
+            if part:
+                sentences.extend(_chunk_long_sentence(part, max_sentence_chars))
+    return sentences
+
+
+def tokenize(sentence):
+    """英文取小写词（去停用词），中文取相邻字二元组"""
+    tokens = [
+        word
+        for word in (w.lower() for w in _WORD_RE.findall(sentence))
+        if word not in _EN_STOPWORDS and len(word) > 1
+    ]
+    for run in _CJK_RUN_RE.findall(sentence.translate(_ZH_FUNCTION_TABLE)):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _tf_idf_vectors(token_lists):
+    doc_freq = Counter()
+    for tokens in token_lists:
+        doc_freq.update(set(tokens))
+    total = len(token_lists)
+    idf = {term: math.log((1 + total) / (1 + df)) + 1.0 for term, df in doc_freq.items()}
+    vectors = []
+    for tokens in token_lists:
+        counts = Counter(tokens)
+        vectors.append({term: (1.0 + math.log(tf)) * idf[term] for term, tf in counts.items()})
+    return vectors, idf
+
+
+def _score_sentences(sentences):
+    token_lists = [tokenize(s) for s in sentences]
+    vectors, _ = _tf_idf_vectors(token_lists)
+    centroid = Counter()
+    for vector in vectors:
+        centroid.update(vector)
+    centroid_norm = math.sqrt(sum(v * v for v in centroid.values())) or 1.0
+    scores = []
+    for vector in vectors:
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if not norm:
+            scores.append(0.0)
+            continue
+        dot = sum(weight * centroid[term] for term, weight in vector.items())
+        scores.append(dot / (norm * centroid_norm))
+    return scores, vectors, centroid
+
+
+def rank_sentences(sentences):
+    """
+    质心式 TF-IDF 打分（TextRank 的线性近似）：
+    每句向量与全文质心的余弦相似度，避免 O(n²) 的句间相似度矩阵
+
+    Returns:
+        list[float]: 与 sentences 一一对应的分数
+    """
+    scores, _, _ = _score_sentences(sentences)
+    return scores
+
+
+def _separator(left, right):
+    """按句子边界选择分隔符：任一侧是中文字符或全角标点时直接拼接，否则加空格"""
+    if not left or not right or _CJK_EDGE_RE.match(left[-1]) or _CJK_EDGE_RE.match(right[0]):
+        return ""
+    return " "
+
+
+def _join_sentences(sentences):
+    joined = ""
+    for sentence in sentences:
+        joined += _separator(joined, sentence) + sentence
+    return joined
+
+
+def _separator_cost(sentence):
+    # 预算按上限计：不以中文开头的句子可能需要一个空格
+    return 0 if _CJK_EDGE_RE.match(sentence[:1]) else 1
+
+
+def _measure(text, max_tokens):
+    return estimate_tokens(text) if max_tokens else len(text)
+
+
+def _truncate(text, max_chars, max_tokens):
+    if max_tokens:
+        ratio = max_tokens / max(1, estimate_tokens(text))
+        return text[: max(1, int(len(text) * ratio))]
+    return text[:max_chars]
+
+
+def compress_text(text, max_chars=None, max_tokens=None, buckets=None):
+    """
+    将长文本压缩到预算以内：
+    - 按位置把句子分成若干段，每段按分数抽取，保证结尾部分也有代表
+    - 剩余预算按全局分数补齐
+    - 输出保持原文顺序
+
+    Args:
+        text: 原始文本
+        max_chars: 字符预算
+        max_tokens: token 预算（优先于 max_chars）
+
+    Returns:
+        str: 压缩后的文本；文本已在预算内时原样返回
+    """
+    cleaned = (text or "").strip()
+    budget = max_tokens or max_chars
+    if not cleaned or not budget or _measure(cleaned, max_tokens) <= budget:
+        return cleaned
+
+    sentences = split_sentences(cleaned)
+    if len(sentences) <= 1:
+        return _truncate(cleaned, max_chars, max_tokens)
+
+    scores = rank_sentences(sentences)
+    costs = [_measure(s, max_tokens) + _separator_cost(s) for s in sentences]
+
+    if buckets is None:
+        buckets = max(1, min(8, len(sentences) // 12))
+    bucket_size = math.ceil(len(sentences) / buckets)
+    bucket_budget = budget / buckets
+
+    chosen = set()
+    used = 0
+    for start in range(0, len(sentences), bucket_size):
+        indices = sorted(
+            range(start, min(start + bucket_size, len(sentences))),
+            key=lambda i: scores[i],
+            reverse=True,
+        )
+        spent = 0
+        for i in indices:
+            if spent + costs[i] > bucket_budget or used + costs[i] > budget:
+                continue
+            chosen.add(i)
+            spent += costs[i]
+            used += costs[i]
+
+    for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+        if i in chosen or used + costs[i] > budget:
+            continue
+        chosen.add(i)
+        used += costs[i]
+
+    if not chosen:
+        return _truncate(cleaned, max_chars, max_tokens)
+    return _join_sentences([sentences[i] for i in sorted(chosen)])
+
+
+def extract_keywords(text, limit=10):
+    """按全文 TF-IDF 权重返回关键词（英文单词 / 中文二字词）"""
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    _, _, centroid = _score_sentences(sentences)
+    return [term for term, _ in centroid.most_common(limit)]
+
+
+def _leading_phrase(sentence, cjk_chars=12, latin_words=5):
+    """要点标签：取句子开头的分句（跳过“首先”“However”这类过短的引导语），过长时截断"""
+    clauses = [c.strip() for c in _CLAUSE_RE.split(sentence) if c.strip()]
+    if not clauses:
+        return ""
+    phrase = clauses[0]
+    for clause in clauses:
+        if len(_CJK_RE.findall(clause)) >= 4 or len(clause.split()) >= 2:
+            phrase = clause
+            break
+    if contains_cjk(phrase):
+        return phrase if len(phrase) <= cjk_chars else phrase[:cjk_chars] + "…"
+    words = (phrase[:1].upper() + phrase[1:]).split()
+    return " ".join(words) if len(words) <= latin_words else " ".join(words[:latin_words]) + "…"
+
+
+def _overlap(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _clip(text, limit):
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "..."
+
+
+def summarize_extractive(text, highlight_count=3, summary_chars=400, highlight_chars=120):
+    """
+    离线抽取式摘要：分数最高的句子按原文顺序组成摘要，
+    其余高分且互不重复的句子作为要点，要点标签取句子开头的分句
+
+    Returns:
+        dict: {"summary": "...", "highlights": [{"label": "...", "text": "..."}]}
+    """
+    cleaned = (text or "").strip()
+    sentences = split_sentences(cleaned)
+    if len(sentences) <= 1:
+        return {"summary": _clip(cleaned, summary_chars), "highlights": []}
+
+    scores, vectors, _ = _score_sentences(sentences)
+    order = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+
+    summary_ids = []
+    seen = set()
+    used = 0
+    for i in order:
+        cost = len(sentences[i]) + _separator_cost(sentences[i])
+        if sentences[i] in seen or used + cost > summary_chars:
+            continue
+        seen.add(sentences[i])
+        summary_ids.append(i)
+        used += cost
+        if used >= summary_chars * 0.8:
+            break
+    if not summary_ids:
+        summary_ids = [order[0]]
+    summary = _clip(_join_sentences([sentences[i] for i in sorted(summary_ids)]), summary_chars)
+
+    highlights = []
+    labels = set()
+    chosen = set()
+    # 第一轮避开摘要句；要点不足时（短文本）第二轮允许复用摘要句
+    for excluded in (set(summary_ids), set()):
+        picked = [set(vectors[i]) for i in excluded | chosen]
+        seen = {sentences[i] for i in excluded | chosen}
+        budget = max(50, highlight_count * 20)
+        for i in order:
+            if len(highlights) >= highlight_count or budget <= 0:
+                break
+            if sentences[i] in seen or not vectors[i]:
+                continue
+            seen.add(sentences[i])
+            budget -= 1
+            terms = set(vectors[i])
+            if any(_overlap(terms, other) > 0.5 for other in picked):
+                continue
+            label = _leading_phrase(sentences[i])
+            if not label or label in labels:
+                continue
+            labels.add(label)
+            picked.append(terms)
+            chosen.add(i)
+            highlights.append({"label": label, "text": _clip(sentences[i], highlight_chars)})
+        if len(highlights) >= highlight_count:
+            break
+
+    return {"summary": summary, "highlights": highlights}
@@ -3,7 +3,8 @@ Gemini YouTube 视频总结模块
 使用 Google Gemini API 直接处理 YouTube 视频，无需下载字幕
 """
 import os
-import google.generativeai as genai
+
+from llm_clients import get_gemini_model
 
 
 def summarize_youtube_with_gemini(video_url, video_id):
@@ -25,12 +26,12 @@ def summarize_youtube_with_gemini(video_url, video_id):
     if not api_key:
         raise RuntimeError("未配置 GEMINI_API_KEY，无法使用 Gemini 视频总结功能")
     
-    # 配置 Gemini
-    genai.configure(api_key=api_key)
-    
     # 使用 Gemini 1.5 Flash（更快更便宜）或 1.5 Pro（更强大）
+    # 客户端由 llm_clients 按进程复用，只配置一次
     model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    model = genai.GenerativeModel(model_name)
+    model = get_gemini_model(model_name)
+    if model is None:
+        raise RuntimeError("google-generativeai 未安装，无法使用 Gemini 视频总结功能")
     
     # 提示词
     prompt = f"""
@@ -0,0 +1,291 @@
+"""
+本地异步任务队列
+慢路径（字幕、Whisper、Playwright）放到独立的 worker 进程执行，HTTP 请求只负责入队与查询。
+任务保存在 SQLite 中（无需外部 broker），同一台机器上的所有 web / worker 进程共享；
+按规范化的内容 ID 去重：同一内容已有排队中、执行中或近期成功的任务时直接复用。
+worker 领取任务后定期续租，进程崩溃导致租约过期的任务会重新排队
+"""
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    content_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL DEFAULT '',
+    stage_status TEXT NOT NULL DEFAULT '',
+    detail TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS idx_jobs_content_key ON jobs (content_key, created);
+"""
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+_COLUMNS = (
+    "job_id", "content_key", "status", "stage", "stage_status", "detail",
+    "result", "error", "attempts", "version", "created", "updated",
+)
+
+
+class JobQueue:
+    def __init__(self, path, lease_seconds=60, max_attempts=2, reuse_seconds=600, retention_seconds=86400):
+        """
+        Args:
+            lease_seconds: worker 续租间隔的上限，超过未续租视为 worker 已退出
+            max_attempts: 租约过期后最多重新执行几次
+            reuse_seconds: 成功任务在多长时间内可被同一内容的新请求复用
+            retention_seconds: 已结束任务的保留时间
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.reuse_seconds = reuse_seconds
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _row_to_job(row):
+        if not row:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _select(self, conn, where, params):
+        columns = ", ".join(_COLUMNS)
+        return conn.execute(f"SELECT {columns} FROM jobs WHERE {where}", params).fetchone()
+
+    def enqueue(self, content_key, payload):
+        """
+        Returns:
+            tuple: (job, created)；同一内容已有可复用的任务时 created 为 False
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._select(
+                    conn,
+                    "content_key = ? AND (status IN (?, ?) OR (status = ? AND updated >= ?)) "
+                    "ORDER BY created DESC LIMIT 1",
+                    (content_key, STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED, now - self.reuse_seconds),
+                )
+                if row:
+                    conn.execute("COMMIT")
+                    return self._row_to_job(row), False
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (job_id, content_key, payload, status, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, content_key, json.dumps(payload, ensure_ascii=False), STATUS_QUEUED, now, now),
+                )
+                row = self._select(conn, "job_id = ?", (job_id,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._maybe_purge()
+        return self._row_to_job(row), True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._row_to_job(self._select(self._connection(), "job_id = ?", (job_id,)))
+
+    def wait(self, job_id, since_version=None, timeout=0.0, poll_seconds=0.25):
+        """
+        长轮询：任务版本号大于 since_version 或任务已结束时返回，最多等待 timeout 秒
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            job = self.get(job_id)
+            if (
+                job is None
+                or job["status"] in (STATUS_SUCCEEDED, STATUS_FAILED)
+                or since_version is None
+                or job["version"] > since_version
+                or time.monotonic() >= deadline
+            ):
+                return job
+            time.sleep(poll_seconds)
+
+    def claim(self, worker):
+        """领取最早排队的任务；顺带回收租约过期的任务"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, version = version + 1, updated = ? "
+                    "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (STATUS_FAILED, "worker-lost", now, STATUS_RUNNING, now, self.max_attempts),
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = ?, version = version + 1, updated = ? "
+                    "WHERE status = ? AND lease_until < ?",
+                    (STATUS_QUEUED, now, STATUS_RUNNING, now),
+                )
+                row = conn.execute(
+                    "SELECT job_id, payload FROM jobs WHERE status = ? ORDER BY created LIMIT 1",
+                    (STATUS_QUEUED,),
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                        "lease_until = ?, version = version + 1, updated = ? WHERE job_id = ?",
+                        (STATUS_RUNNING, worker, now + self.lease_seconds, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _update(self, job_id, worker, assignments, params):
+        """
+        只更新仍由该 worker 持有的执行中任务：租约过期后任务已被重新排队、交给其他 worker
+        或判定为 worker-lost，原 worker 迟到的写入不再生效
+
+        Returns:
+            bool: 是否更新成功
+        """
+        with self._lock:
+            cursor = self._connection().execute(
+                f"UPDATE jobs SET {assignments}, version = version + 1, updated = ? "
+                "WHERE job_id = ? AND status = ? AND worker = ?",
+                (*params, time.time(), job_id, STATUS_RUNNING, worker),
+            )
+            return cursor.rowcount > 0
+
+    def progress(self, job_id, worker, stage, status, detail=""):
+        return self._update(
+            job_id,
+            worker,
+            "stage = ?, stage_status = ?, detail = ?, lease_until = ?",
+            (stage, status, detail or "", time.time() + self.lease_seconds),
+        )
+
+    def renew(self, job_id, worker):
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND status = ? AND worker = ?",
+                (time.time() + self.lease_seconds, job_id, STATUS_RUNNING, worker),
+            )
+            return cursor.rowcount > 0
+
+    def finish(self, job_id, worker, result):
+        # 载荷里可能有用户 cookie，任务结束后不再保留
+        return self._update(
+            job_id,
+            worker,
+            "status = ?, result = ?, payload = '{}', stage = '', stage_status = '', detail = ''",
+            (STATUS_SUCCEEDED, json.dumps(result, ensure_ascii=False)),
+        )
+
+    def fail(self, job_id, worker, error):
+        return self._update(job_id, worker, "status = ?, error = ?, payload = '{}'", (STATUS_FAILED, str(error)))
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < 300:
+            return
+        self._last_purge = now
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (STATUS_SUCCEEDED, STATUS_FAILED, now - self.retention_seconds),
+            )
+
+
+def _load_handler(handler_path):
+    module_name, func_name = handler_path.split(":", 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def run_worker(path, handler_path, poll_seconds=0.5, stop_event=None, **queue_options):
+    """
+    worker 主循环：handler(payload, report) 返回结果（可 JSON 序列化），
+    report(stage, status, detail=None) 写入进度；抛出异常视为任务失败
+    """
+    job_queue = JobQueue(path, **queue_options)
+    handler = _load_handler(handler_path)
+    worker = f"{os.uname().nodename}:{os.getpid()}"
+    while not (stop_event and stop_event.is_set()):
+        claimed = job_queue.claim(worker)
+        if not claimed:
+            time.sleep(poll_seconds)
+            continue
+        job_id, payload = claimed
+        done = threading.Event()
+
+        def keep_alive():
+            while not done.wait(job_queue.lease_seconds / 3):
+                job_queue.renew(job_id, worker)
+
+        renewer = threading.Thread(target=keep_alive, daemon=True)
+        renewer.start()
+        try:
+            result = handler(
+                payload, lambda stage, status, detail=None: job_queue.progress(job_id, worker, stage, status, detail)
+            )
+        except Exception as exc:
+            job_queue.fail(job_id, worker, exc)
+        else:
+            job_queue.finish(job_id, worker, result)
+        finally:
+            done.set()
+
+
+def start_worker_pool(path, handler_path, workers, **queue_options):
+    """
+    以 spawn 方式启动 worker 进程（避免 fork 继承父进程的线程与连接），随父进程退出
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(max(1, workers)):
+        process = context.Process(
+            target=run_worker,
+            args=(path, handler_path),
+            kwargs=queue_options,
+            name=f"job-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+    return processes
@@ -0,0 +1,128 @@
+"""
+LLM 客户端注册表
+每个 worker 进程按当前配置只构建一次 OpenAI / Gemini 客户端，复用底层 HTTP 连接池；
+所有访问都加锁，可在多线程中共享，同时提供按事件循环隔离的 AsyncOpenAI 客户端
+"""
+import asyncio
+import os
+import threading
+
+_LOCK = threading.Lock()
+_CLIENTS = {}
+
+
+def _http_limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "60")),
+    )
+
+
+def _http_timeout():
+    import httpx
+
+    return httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "60")), connect=10.0)
+
+
+def get_openai_config():
+    api_key = os.getenv("OPENAI_API_KEY")
+    base_url = os.getenv("OPENAI_BASE_URL", "").strip() or None
+    return api_key, base_url
+
+
+def _get_or_create(key, factory):
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = factory()
+            _CLIENTS[key] = client
+        return client
+
+
+def get_openai_client():
+    """
+    返回进程内共享的 OpenAI 客户端；未配置 Key 或未安装 SDK 时返回 None
+    配置变化（Key / Base URL）或 fork 之后会自动构建新的客户端
+    """
+    api_key, base_url = get_openai_config()
+    if not api_key:
+        return None
+    try:
+        import httpx
+        from openai import OpenAI
+    except Exception:
+        return None
+
+    def factory():
+        http_client = httpx.Client(limits=_http_limits(), timeout=_http_timeout())
+        return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    return _get_or_create(("openai", api_key, base_url, os.getpid()), factory)
+
+
+def get_async_openai_client():
+    """
+    返回当前事件循环专用的 AsyncOpenAI 客户端（httpx.AsyncClient 不能跨事件循环共享）
+    """
+    api_key, base_url = get_openai_config()
+    if not api_key:
+        return None
+    try:
+        import httpx
+        from openai import AsyncOpenAI
+    except Exception:
+        return None
+    loop = asyncio.get_running_loop()
+
+    def factory():
+        http_client = httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout())
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    return _get_or_create(("openai-async", api_key, base_url, os.getpid(), id(loop)), factory)
+
+
+def get_gemini_model(model_name):
+    """
+    返回共享的 GenerativeModel；genai.configure 每个 Key 每个进程只调用一次
+    设置 GEMINI_BASE_URL 时改用 REST 传输指向该端点；未配置 Key 或未安装 SDK 时返回 None
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    try:
+        import google.generativeai as genai
+    except Exception:
+        return None
+
+    pid = os.getpid()
+    base_url = os.getenv("GEMINI_BASE_URL", "").strip() or None
+
+    def configure():
+        if base_url:
+            # 自定义端点（本地替身服务 / 代理）只能走 REST 传输
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": base_url})
+        else:
+            genai.configure(api_key=api_key)
+        return True
+
+    _get_or_create(("gemini-config", api_key, base_url, pid), configure)
+    return _get_or_create(
+        ("gemini-model", api_key, base_url, model_name, pid),
+        lambda: genai.GenerativeModel(model_name),
+    )
+
+
+def reset_clients():
+    with _LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if callable(close) and not asyncio.iscoroutinefunction(close):
+            try:
+                close()
+            except Exception:
+                pass
@@ -0,0 +1,212 @@
+"""
+LLM 调用指标
+按 (服务商, 模型, 操作) 统计调用次数、结果状态、延迟分布、prompt / completion token、
+截断后的输入字符数与估算费用；可导出为 Prometheus 文本格式，
+并通过 contextvars 收集单个请求内的全部调用，供请求结束时写日志
+"""
+import contextvars
+import json
+import os
+import threading
+
+# 每百万 token 的美元价格 (输入, 输出)；可用 LLM_PRICING_JSON 覆盖或补充
+# Whisper 按音频时长计价，不在此表中，只统计次数与延迟
+DEFAULT_PRICING = {
+    "openai:gpt-4o-mini": (0.15, 0.60),
+    "openai:gpt-4o": (2.50, 10.00),
+    "openai:gpt-4.1-mini": (0.40, 1.60),
+    "gemini:gemini-1.5-flash": (0.075, 0.30),
+    "gemini:gemini-1.5-pro": (1.25, 5.00),
+    "gemini:gemini-2.0-flash": (0.10, 0.40),
+}
+
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+_LOCK = threading.Lock()
+_SERIES = {}
+_PRICING = None
+_REQUEST_CALLS = contextvars.ContextVar("llm_request_calls", default=None)
+
+
+def get_pricing():
+    global _PRICING
+    if _PRICING is None:
+        pricing = dict(DEFAULT_PRICING)
+        raw = os.getenv("LLM_PRICING_JSON", "").strip()
+        if raw:
+            try:
+                for key, value in json.loads(raw).items():
+                    pricing[key] = (float(value[0]), float(value[1]))
+            except (ValueError, TypeError, IndexError, AttributeError):
+                pass
+        _PRICING = pricing
+    return _PRICING
+
+
+def estimate_cost(provider, model, prompt_tokens, completion_tokens):
+    price = get_pricing().get(f"{provider}:{model}")
+    if not price:
+        return 0.0
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+def extract_usage(response):
+    """
+    从 SDK 响应中读取 token 用量，兼容 Responses API、Chat Completions 与 Gemini
+    返回 {"prompt_tokens", "completion_tokens"}
+    """
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        prompt = getattr(usage, "input_tokens", None)
+        if prompt is None:
+            prompt = getattr(usage, "prompt_tokens", 0)
+        completion = getattr(usage, "output_tokens", None)
+        if completion is None:
+            completion = getattr(usage, "completion_tokens", 0)
+        return {"prompt_tokens": prompt or 0, "completion_tokens": completion or 0}
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None:
+        return {
+            "prompt_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+            "completion_tokens": getattr(metadata, "candidates_token_count", 0) or 0,
+        }
+    return {"prompt_tokens": 0, "completion_tokens": 0}
+
+
+def _new_series():
+    return {
+        "calls": {},
+        "latency_buckets": [0] * len(LATENCY_BUCKETS),
+        "latency_sum": 0.0,
+        "latency_count": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "input_chars": 0,
+        "cost_usd": 0.0,
+    }
+
+
+def record_llm_call(provider, model, operation, latency, status="ok", input_chars=0, usage=None):
+    """
+    记录一次调用；status 取 ok / error / parse_error / rate_limited / cancelled
+    """
+    usage = usage or {}
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    cost = estimate_cost(provider, model, prompt_tokens, completion_tokens)
+    with _LOCK:
+        series = _SERIES.setdefault((provider, model, operation), _new_series())
+        series["calls"][status] = series["calls"].get(status, 0) + 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                series["latency_buckets"][index] += 1
+        series["latency_sum"] += latency
+        series["latency_count"] += 1
+        series["prompt_tokens"] += prompt_tokens
+        series["completion_tokens"] += completion_tokens
+        series["input_chars"] += input_chars
+        series["cost_usd"] += cost
+
+    calls = _REQUEST_CALLS.get()
+    if calls is not None:
+        calls.append({
+            "provider": provider,
+            "model": model,
+            "operation": operation,
+            "status": status,
+            "latency_ms": round(latency * 1000),
+            "input_chars": input_chars,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": round(cost, 6),
+        })
+
+
+def begin_request():
+    """开始收集当前请求内的调用；线程池任务需通过 contextvars.copy_context().run 提交才会计入"""
+    _REQUEST_CALLS.set([])
+
+
+def end_request():
+    """
+    结束收集并返回日志字段；没有任何 LLM 调用时返回 None
+    """
+    calls = _REQUEST_CALLS.get() or []
+    _REQUEST_CALLS.set(None)
+    if not calls:
+        return None
+    return {
+        "llm_calls": len(calls),
+        "llm_latency_ms": sum(call["latency_ms"] for call in calls),
+        "llm_prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+        "llm_completion_tokens": sum(call["completion_tokens"] for call in calls),
+        "llm_cost_usd": round(sum(call["cost_usd"] for call in calls), 6),
+        "llm_detail": calls,
+    }
+
+
+def is_usage_log_enabled():
+    return os.getenv("LLM_USAGE_LOG", "1").lower() in ("1", "true", "yes")
+
+
+def write_request_log(path):
+    """结束收集并输出一行 {"event": "llm_usage", ...} JSON 日志（无 LLM 调用或 LLM_USAGE_LOG=0 时不输出）"""
+    fields = end_request()
+    if fields and is_usage_log_enabled():
+        print(json.dumps({"event": "llm_usage", "path": path, **fields}, ensure_ascii=False), flush=True)
+    return fields
+
+
+def snapshot():
+    with _LOCK:
+        return {key: json.loads(json.dumps(value)) for key, value in _SERIES.items()}
+
+
+def reset_metrics():
+    with _LOCK:
+        _SERIES.clear()
+
+
+def format_labels(**labels):
+    """Prometheus 标签；每个序列都带 pid：gunicorn 多个 worker 各自计数，抓取到的是其中一个进程，
+    查询时按 sum without (pid) 聚合"""
+    parts = [f'pid="{os.getpid()}"']
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus():
+    """Prometheus 文本格式（version 0.0.4）"""
+    data = snapshot()
+    lines = [
+        "# HELP llm_calls_total LLM calls by result status.",
+        "# TYPE llm_calls_total counter",
+    ]
+    for (provider, model, operation), series in sorted(data.items()):
+        for status, count in sorted(series["calls"].items()):
+            lines.append(f"llm_calls_total{format_labels(provider=provider, model=model, operation=operation, status=status)} {count}")
+
+    lines += [
+        "# HELP llm_latency_seconds LLM call latency.",
+        "# TYPE llm_latency_seconds histogram",
+    ]
+    for (provider, model, operation), series in sorted(data.items()):
+        base = dict(provider=provider, model=model, operation=operation)
+        for bound, count in zip(LATENCY_BUCKETS, series["latency_buckets"]):
+            lines.append(f"llm_latency_seconds_bucket{format_labels(**base, le=bound)} {count}")
+        lines.append(f"llm_latency_seconds_bucket{format_labels(**base, le='+Inf')} {series['latency_count']}")
+        lines.append(f"llm_latency_seconds_sum{format_labels(**base)} {series['latency_sum']:.6f}")
+        lines.append(f"llm_latency_seconds_count{format_labels(**base)} {series['latency_count']}")
+
+    for name, field, help_text in (
+        ("llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens reported by the provider."),
+        ("llm_completion_tokens_total", "completion_tokens", "Completion tokens reported by the provider."),
+        ("llm_input_chars_total", "input_chars", "Input characters sent after truncation."),
+        ("llm_cost_usd_total", "cost_usd", "Estimated cost in USD."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (provider, model, operation), series in sorted(data.items()):
+            lines.append(f"{name}{format_labels(provider=provider, model=model, operation=operation)} {series[field]}")
+    return "\n".join(lines) + "\n"
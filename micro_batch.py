@@ -0,0 +1,72 @@
+"""
+请求微批处理
+并发到达的小请求在一个很短的时间窗口内合并成一批交给 handler 处理，
+handler 返回与输入等长的结果列表，再按位置分发回各自的等待者；
+没有批次在处理中时（空闲）新请求立即发出，不等待时间窗口。
+每项提交时复制调用方的 contextvars；一批只发出一次请求，整批在最早提交者的 context 中执行：
+本批的 LLM 调用只计入该请求的用量日志，限流优先级也沿用该请求的设置
+"""
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class MicroBatcher:
+    def __init__(self, handler, window_seconds=0.05, max_items=20, workers=4, name="micro-batch"):
+        """
+        Args:
+            handler: handler(items) -> list，长度与 items 相同，单项失败返回 None
+            window_seconds: 有批次在处理中时，第一项到达后最多等待多久再发出整批
+            max_items: 攒够多少项立即发出
+        """
+        self.handler = handler
+        self.window_seconds = window_seconds
+        self.max_items = max(1, max_items)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._generation = 0
+        self._inflight = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    def submit(self, item):
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((item, future, contextvars.copy_context()))
+            # 空闲时攒批只会增加延迟，直接发出
+            if self._inflight == 0 or len(self._pending) >= self.max_items:
+                batch = self._take()
+            elif len(self._pending) == 1:
+                timer = threading.Timer(self.window_seconds, self._flush, args=(self._generation,))
+                timer.daemon = True
+                timer.start()
+        if batch:
+            self._executor.submit(self._run, batch)
+        return future
+
+    def _take(self):
+        batch = self._pending
+        self._pending = []
+        self._generation += 1
+        self._inflight += 1
+        return batch
+
+    def _flush(self, generation):
+        with self._lock:
+            # 这一批已因攒满提前发出，过期的定时器不再处理
+            if generation != self._generation or not self._pending:
+                return
+            batch = self._take()
+        self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        items = [item for item, _, _ in batch]
+        try:
+            results = list(batch[0][2].run(self.handler, items))
+        except Exception:
+            results = []
+        results += [None] * (len(batch) - len(results))
+        with self._lock:
+            self._inflight -= 1
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,118 @@
+"""
+提示词模板注册表
+每个模板由两部分组成：
+- 固定前缀（指令、输出格式、示例）：逐字节不变，始终放在请求最前面
+- 变量部分：只包含本次的内容，放在固定前缀之后
+注意：目前的固定前缀只有几百 token，低于服务商前缀缓存（OpenAI prompt caching /
+Gemini implicit caching）要求的 1024 token 下限，不会产生缓存命中，也就不单独统计缓存 token；
+若将来前缀增长到下限以上，保持前缀在前即可直接受益
+模板的版本号与固定前缀哈希共同组成 cache_version，参与摘要缓存键，改动前缀后旧缓存自动失效
+"""
+import hashlib
+
+
+class PromptTemplate:
+    def __init__(self, name, version, prefix, user_template):
+        self.name = name
+        self.version = version
+        self.prefix = prefix
+        self.user_template = user_template
+        self.prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:8]
+
+    @property
+    def cache_version(self):
+        return f"{self.version}-{self.prefix_hash}"
+
+    def render_user(self, **variables):
+        return self.user_template.format(**variables)
+
+    def render(self, **variables):
+        """返回 (固定前缀, 变量部分)"""
+        return self.prefix, self.render_user(**variables)
+
+    def render_text(self, **variables):
+        """单段文本形式（Gemini 等只接收一段 prompt 的接口），前缀在前"""
+        return f"{self.prefix}\n\n{self.render_user(**variables)}"
+
+
+_REGISTRY = {}
+
+
+def register_prompt(template):
+    existing = _REGISTRY.get(template.name)
+    if existing and existing.version == template.version and existing.prefix != template.prefix:
+        raise ValueError(f"提示词 {template.name} 内容已修改，请提升版本号（当前 {template.version}）。")
+    _REGISTRY[template.name] = template
+    return template
+
+
+def get_prompt(name):
+    return _REGISTRY[name]
+
+
+def list_prompts():
+    return {name: template.cache_version for name, template in sorted(_REGISTRY.items())}
+
+
+SUMMARY = register_prompt(
+    PromptTemplate(
+        "summary",
+        "v2",
+        (
+            "你是内容总结助手，请用中文输出精简摘要，并给出 3 条要点。\n"
+            "只返回 JSON，格式：{\"summary\":\"...\",\"highlights\":[{\"label\":\"...\",\"text\":\"...\"}]}\n"
+            "label 要简短（2-6 个字）。保留原文专有名词。\n"
+            "示例输出：{\"summary\":\"作者介绍了批处理如何提升推理吞吐量，并比较了量化的利弊。\","
+            "\"highlights\":[{\"label\":\"批处理\",\"text\":\"合并请求可显著提高吞吐量。\"},"
+            "{\"label\":\"量化\",\"text\":\"降低显存占用，但可能影响精度。\"},"
+            "{\"label\":\"延迟\",\"text\":\"解码阶段是主要延迟来源。\"}]}"
+        ),
+        "平台：{platform}\n内容：{content}",
+    )
+)
+
+TWEET_BATCH = register_prompt(
+    PromptTemplate(
+        "tweet_batch",
+        "v2",
+        (
+            "你是内容总结助手。输入是一个推文 JSON 数组，每条包含 id 和 text。\n"
+            "请逐条用中文输出精简摘要，并给出 1-3 条要点。\n"
+            "只返回 JSON，格式：{\"items\":[{\"id\":\"...\",\"summary\":\"...\","
+            "\"highlights\":[{\"label\":\"...\",\"text\":\"...\"}]}]}\n"
+            "每条输入都必须输出一个 id 相同的条目，不要合并或遗漏。label 要简短。保留原文专有名词。"
+        ),
+        "{items}",
+    )
+)
+
+VIDEO_CARD = register_prompt(
+    PromptTemplate(
+        "video_card",
+        "v1",
+        (
+            "你是一个专业的视频内容分析专家，擅长将长视频内容提炼为简洁的要点。\n"
+            "请根据用户提供的视频信息，生成一份简洁、高质量的中文总结卡片，按照以下格式回答：\n\n"
+            "【核心观点】\n用2-3句话概括视频的主要内容\n\n"
+            "【关键亮点】\n1. 第一个重要观点\n2. 第二个重要观点\n3. 第三个重要观点\n\n"
+            "【适用场景】\n说明这个视频适合哪些人观看"
+        ),
+        "{content}",
+    )
+)
+
+VIDEO_CARD_GEMINI = register_prompt(
+    PromptTemplate(
+        "video_card_gemini",
+        "v1",
+        (
+            "请分析用户提供的 YouTube 视频并生成中文总结，提供：\n"
+            "1. **核心观点**：用 2-3 句话概括视频的主要内容\n"
+            "2. **关键亮点**：列出 3-5 个最重要的要点\n"
+            "3. **适用场景**：这个视频适合哪些人观看？\n\n"
+            "请用中文回答，格式如下：\n\n"
+            "【核心观点】\n...\n\n【关键亮点】\n1. ...\n2. ...\n3. ...\n\n【适用场景】\n..."
+        ),
+        "视频链接：{url}",
+    )
+)
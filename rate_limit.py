@@ -0,0 +1,247 @@
+"""
+LLM / Whisper 客户端限流
+每个 (服务商, 模型) 一个令牌桶，同时限制每分钟请求数与每分钟 token 数；
+桶状态保存在 SQLite 中，同一台机器上的多个 worker 进程共享额度。
+进程内的等待者进入有界优先级队列，只有队首向令牌桶申请，
+队列已满或预计等待超过上限时立即返回失败，由调用方走降级逻辑
+"""
+import heapq
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    bucket_key TEXT PRIMARY KEY,
+    request_tokens REAL NOT NULL,
+    token_tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+# 带 cancel_event 的等待者按此间隔检查是否已被取消
+CANCEL_POLL_SECONDS = 0.2
+
+
+class RateLimitExceeded(RuntimeError):
+    """队列已满或等待超时"""
+
+
+def _env_key(value):
+    return re.sub(r"[^A-Za-z0-9]+", "_", value).strip("_").upper()
+
+
+def get_limits(provider, model):
+    """
+    读取限额（0 表示不限）：
+    RATE_LIMIT_<PROVIDER>_<MODEL>_RPM / _TPM 优先，其次 RATE_LIMIT_<PROVIDER>_RPM / _TPM
+    """
+    limits = []
+    for suffix in ("RPM", "TPM"):
+        value = os.getenv(f"RATE_LIMIT_{_env_key(provider)}_{_env_key(model)}_{suffix}")
+        if value is None:
+            value = os.getenv(f"RATE_LIMIT_{_env_key(provider)}_{suffix}", "0")
+        try:
+            limits.append(max(0.0, float(value)))
+        except ValueError:
+            limits.append(0.0)
+    return tuple(limits)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens")
+
+    def __init__(self, priority, seq, tokens):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RateLimiter:
+    def __init__(self, path, max_queue=64, max_wait_seconds=20.0):
+        self.path = path
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._queues = {}
+        self._conditions = {}
+        self._seq = itertools.count()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _try_take(self, key, rpm, tpm, tokens):
+        """
+        原子地补充并扣减令牌；成功返回 0，否则返回还需等待的秒数
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT request_tokens, token_tokens, updated, blocked_until FROM buckets WHERE bucket_key = ?",
+                (key,),
+            ).fetchone()
+            if row:
+                request_tokens, token_tokens, updated, blocked_until = row
+                elapsed = max(0.0, now - updated)
+                request_tokens = min(rpm, request_tokens + elapsed * rpm / 60) if rpm else 0.0
+                token_tokens = min(tpm, token_tokens + elapsed * tpm / 60) if tpm else 0.0
+            else:
+                request_tokens, token_tokens, blocked_until = rpm, tpm, 0.0
+
+            # 单次请求超过每分钟 token 上限时按满桶处理，避免永远等待
+            tokens = min(tokens, tpm) if tpm else 0
+            waits = [blocked_until - now]
+            if rpm and request_tokens < 1:
+                waits.append((1 - request_tokens) * 60 / rpm)
+            if tpm and token_tokens < tokens:
+                waits.append((tokens - token_tokens) * 60 / tpm)
+            wait_seconds = max(waits)
+            if wait_seconds <= 0:
+                request_tokens -= 1 if rpm else 0
+                token_tokens -= tokens
+                wait_seconds = 0.0
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (bucket_key, request_tokens, token_tokens, updated, blocked_until) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, request_tokens, token_tokens, now, blocked_until),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait_seconds
+
+    def _peek_wait(self, key, rpm, tpm, tokens):
+        row = self._connection().execute(
+            "SELECT request_tokens, token_tokens, updated, blocked_until FROM buckets WHERE bucket_key = ?",
+            (key,),
+        ).fetchone()
+        if not row:
+            return 0.0
+        now = time.time()
+        request_tokens, token_tokens, updated, blocked_until = row
+        elapsed = max(0.0, now - updated)
+        waits = [blocked_until - now, 0.0]
+        if rpm:
+            request_tokens = min(rpm, request_tokens + elapsed * rpm / 60)
+            waits.append((1 - request_tokens) * 60 / rpm)
+        if tpm:
+            token_tokens = min(tpm, token_tokens + elapsed * tpm / 60)
+            waits.append((min(tokens, tpm) - token_tokens) * 60 / tpm)
+        return max(waits)
+
+    def expected_delay(self, provider, model, tokens=0):
+        """
+        估算新请求在队列中的等待秒数：令牌桶当前缺口 + 排在前面的请求按速率折算的时间
+        """
+        rpm, tpm = get_limits(provider, model)
+        if not rpm and not tpm:
+            return 0.0
+        key = f"{provider}:{model}"
+        with self._lock:
+            waiting = list(self._queues.get(key, ()))
+            delay = self._peek_wait(key, rpm, tpm, tokens)
+        if rpm:
+            delay += len(waiting) * 60 / rpm
+        if tpm:
+            delay += sum(waiter.tokens for waiter in waiting) * 60 / tpm
+        return delay
+
+    def acquire(self, provider, model, tokens=0, priority=PRIORITY_INTERACTIVE, max_wait=None, cancel_event=None):
+        """
+        阻塞直到拿到额度；返回实际等待秒数
+        队列已满、预计或实际等待超过 max_wait、cancel_event 被置位时抛出 RateLimitExceeded
+        """
+        rpm, tpm = get_limits(provider, model)
+        if not rpm and not tpm:
+            return 0.0
+        max_wait = self.max_wait_seconds if max_wait is None else max_wait
+        if self.expected_delay(provider, model, tokens) > max_wait:
+            raise RateLimitExceeded(f"{provider}:{model} 预计排队时间超过 {max_wait:.1f} 秒")
+
+        key = f"{provider}:{model}"
+        started = time.monotonic()
+        deadline = started + max_wait
+        with self._lock:
+            waiters = self._queues.setdefault(key, [])
+            condition = self._conditions.setdefault(key, threading.Condition(self._lock))
+            if self.max_queue and len(waiters) >= self.max_queue:
+                raise RateLimitExceeded(f"{provider}:{model} 限流队列已满")
+            waiter = _Waiter(priority, next(self._seq), tokens)
+            heapq.heappush(waiters, waiter)
+            # 高优先级请求插队时唤醒当前队首，让新的队首去申请额度
+            condition.notify_all()
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RateLimitExceeded(f"{provider}:{model} 排队已取消")
+                    remaining = deadline - time.monotonic()
+                    poll = CANCEL_POLL_SECONDS if cancel_event is not None else remaining
+                    if waiters[0] is waiter:
+                        wait_seconds = self._try_take(key, rpm, tpm, tokens)
+                        if wait_seconds <= 0:
+                            return time.monotonic() - started
+                        if wait_seconds > remaining:
+                            raise RateLimitExceeded(f"{provider}:{model} 排队超时")
+                        condition.wait(min(wait_seconds, remaining, poll))
+                    else:
+                        if remaining <= 0:
+                            raise RateLimitExceeded(f"{provider}:{model} 排队超时")
+                        condition.wait(min(remaining, poll))
+            finally:
+                waiters.remove(waiter)
+                heapq.heapify(waiters)
+                condition.notify_all()
+
+    def record_usage(self, provider, model, estimated_tokens, actual_tokens):
+        """调用完成后按真实 token 数修正令牌桶（可为负，即退回多扣的额度）"""
+        rpm, tpm = get_limits(provider, model)
+        if not tpm or not actual_tokens:
+            return
+        delta = actual_tokens - min(estimated_tokens, tpm)
+        if not delta:
+            return
+        with self._lock:
+            self._connection().execute(
+                "UPDATE buckets SET token_tokens = MIN(?, token_tokens - ?) WHERE bucket_key = ?",
+                (tpm, delta, f"{provider}:{model}"),
+            )
+
+    def penalize(self, provider, model, seconds):
+        """服务商返回 429 时，让本机所有 worker 暂停该桶一段时间"""
+        rpm, tpm = get_limits(provider, model)
+        if not rpm and not tpm:
+            return
+        key = f"{provider}:{model}"
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (bucket_key, request_tokens, token_tokens, updated, blocked_until) "
+                "VALUES (?, ?, ?, ?, 0)",
+                (key, rpm, tpm, now),
+            )
+            conn.execute(
+                "UPDATE buckets SET blocked_until = MAX(blocked_until, ?) WHERE bucket_key = ?",
+                (now + seconds, key),
+            )
@@ -191,6 +191,94 @@ const requestAiSummary = async ({ url, platform, id }) => {
   return res.json();
 };
 
+const stageLabels = {
+  store: "已命中本地字幕缓存",
+  transcript: "正在获取字幕...",
+  subtitle: "正在通过 yt-dlp 获取字幕...",
+  audio: "正在转写音频...",
+  metadata: "正在读取视频信息...",
+  tweet: "正在抓取推文...",
+  summary: "AI 正在生成摘要...",
+};
+
+// Pull the (possibly unfinished) "summary" string out of streamed JSON text
+const extractPartialSummary = (buffer) => {
+  const match = buffer.match(/"summary"\s*:\s*"((?:[^"\\]|\\.)*)/);
+  if (!match) return "";
+  const body = match[1].replace(/\\(u[0-9a-fA-F]{0,3})?$/, "");
+  try {
+    return JSON.parse(`"${body}"`);
+  } catch (e) {
+    return body;
+  }
+};
+
+const parseSseBlock = (block) => {
+  let event = "message";
+  const dataLines = [];
+  block.split("\n").forEach(line => {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+  });
+  if (!dataLines.length) return null;
+  return { event, data: JSON.parse(dataLines.join("\n")) };
+};
+
+// Returns the final card, or null when the streaming endpoint is unavailable
+const requestAiSummaryStream = async ({ url, platform, id }, onEvent) => {
+  const apiBase = getApiBase();
+  let res;
+  try {
+    res = await fetch(`${apiBase}/api/magic/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+      body: JSON.stringify({ url, platform, id }),
+    });
+  } catch (e) {
+    return null;
+  }
+  const contentType = res.headers.get("content-type") || "";
+  if (!res.ok || !res.body || !contentType.includes("text/event-stream")) return null;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let card = null;
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const parsed = parseSseBlock(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      if (!parsed) continue;
+      if (parsed.event === "error") throw new Error(parsed.data.message || "api-error");
+      if (parsed.event === "card") card = parsed.data;
+      onEvent(parsed.event, parsed.data);
+    }
+  }
+  if (!card) throw new Error("stream-ended");
+  return card;
+};
+
+let renderScheduled = false;
+const scheduleRender = () => {
+  if (renderScheduled) return;
+  renderScheduled = true;
+  requestAnimationFrame(() => {
+    renderScheduled = false;
+    renderGallery();
+  });
+};
+
+const showOutputPanel = () => {
+  if (outputPanel.classList.contains("visible")) return;
+  outputPanel.classList.remove("hidden");
+  outputPanel.classList.add("visible");
+  outputPanel.scrollIntoView({ behavior: "smooth" });
+};
+
 const parseUrl = (input) => {
   const trimmed = input.trim();
   if (!trimmed) return null;
@@ -216,6 +304,7 @@ const handleSubmit = async (e) => {
   }
 
   setStatus("正在解析...", "var(--primary)");
+  appState.data = null;
 
   // Show gallery immediately with loading state (or dummy data)
   // For now we keep using dummy data or previous data? 
@@ -224,11 +313,37 @@ const handleSubmit = async (e) => {
   // renderGallery();
 
   try {
-    const result = await requestAiSummary({
+    const request = {
       url: urlInput.value,
       platform: meta.platform,
       id: meta.id
+    };
+    let streamedText = "";
+
+    // Progressive path: render title first, then the summary as it streams in
+    let result = await requestAiSummaryStream(request, (event, data) => {
+      if (event === "meta") {
+        appState.data = { platform: meta.platform, highlights: [], ...appState.data, title: data.title };
+        scheduleRender();
+        showOutputPanel();
+      } else if (event === "progress") {
+        const label = stageLabels[data.stage] || "正在解析...";
+        setStatus(data.detail ? `${label} (${data.detail})` : label, "var(--primary)");
+      } else if (event === "reset") {
+        streamedText = "";
+      } else if (event === "delta") {
+        streamedText += data.text;
+        const partial = extractPartialSummary(streamedText);
+        if (partial) {
+          appState.data = { platform: meta.platform, highlights: [], ...appState.data, summary: partial };
+          scheduleRender();
+          showOutputPanel();
+        }
+      }
     });
+    if (!result) {
+      result = await requestAiSummary(request);
+    }
 
     appState.data = {
       platform: meta.platform,
@@ -237,9 +352,7 @@ const handleSubmit = async (e) => {
 
     renderGallery();
     setStatus("生成成功", "#087c78");
-    outputPanel.classList.remove("hidden");
-    outputPanel.classList.add("visible");
-    outputPanel.scrollIntoView({ behavior: "smooth" });
+    showOutputPanel();
 
   } catch (err) {
     console.error(err);
@@ -0,0 +1,58 @@
+"""
+夜间批量回填：读取链接列表，通过 OpenAI Batch API 生成摘要并写入缓存
+
+用法：
+    python scripts/batch_summarize.py urls.txt
+    python scripts/batch_summarize.py urls.txt --fake   # 使用本地替身服务
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def read_urls(path):
+    lines = Path(path).read_text(encoding="utf-8").splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize many YouTube videos through the provider batch API")
+    parser.add_argument("url_file", help="text file with one YouTube URL per line")
+    parser.add_argument("--poll-seconds", type=float, default=30)
+    parser.add_argument("--timeout-hours", type=float, default=24)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent transcript fetches")
+    parser.add_argument("--fake", action="store_true", help="run against scripts/fake_llm_server.py")
+    args = parser.parse_args()
+
+    fake_server = None
+    if args.fake:
+        from fake_llm_server import start_server
+
+        fake_server, base_url = start_server(batch_seconds=1.0)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+        args.poll_seconds = min(args.poll_seconds, 0.5)
+
+    from batch_summary import run_batch
+
+    report = run_batch(
+        read_urls(args.url_file),
+        poll_seconds=args.poll_seconds,
+        timeout_seconds=args.timeout_hours * 3600,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        on_progress=lambda message: print(f"[batch] {message}", file=sys.stderr),
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if fake_server:
+        fake_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+摘要链路压测（离线）
+启动本地 LLM 替身服务（scripts/fake_llm_server.py），用合成字幕驱动
+build_summary_with_fallback（--mode function）或真实 HTTP 的 /api/magic（--mode http），
+输出吞吐量与延迟分位数。摘要缓存与结果缓存在压测期间关闭
+
+用法：
+    python scripts/bench_summary.py --requests 200 --concurrency 16 --latency-ms 800 --jitter-ms 300
+    python scripts/bench_summary.py --mode http --error-rate 0.05 --race-mode hedge
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_llm_server import start_server
+
+ZH_WORDS = "模型 推理 延迟 吞吐量 批处理 量化 显存 缓存 调度 解码 精度 成本 部署 服务 并发 请求".split()
+EN_WORDS = "model latency throughput batching quantization memory cache decoding accuracy cost deploy".split()
+
+
+def make_transcript(index, chars, seed):
+    """生成确定的合成字幕；每条都不同，避免命中任何缓存"""
+    rng = random.Random(seed * 100003 + index)
+    sentences = []
+    size = 0
+    while size < chars:
+        if rng.random() < 0.5:
+            sentence = "".join(rng.choice(ZH_WORDS) for _ in range(rng.randint(4, 9))) + "。"
+        else:
+            words = [rng.choice(EN_WORDS) for _ in range(rng.randint(6, 14))]
+            sentence = " ".join(words).capitalize() + ". "
+        sentences.append(sentence)
+        size += len(sentence)
+    return f"第 {index} 期。" + "".join(sentences)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # 最近秩法：第 ceil(pct/100 * n) 个值
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def configure_environment(base_url, args):
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "fake-key"
+    # 显式置空，避免 server 导入时 load_dotenv 从 .env 读入真实 Key
+    os.environ["GEMINI_API_KEY"] = "fake-key" if args.gemini else ""
+    os.environ["GEMINI_BASE_URL"] = base_url[: -len("/v1")]
+    os.environ["SUMMARY_PROVIDER_ORDER"] = args.providers
+    os.environ["SUMMARY_RACE_MODE"] = args.race_mode
+    os.environ["SUMMARY_CACHE_MAX_MB"] = "0"
+    os.environ["CACHE_TTL_SECONDS"] = "0"
+    os.environ["LLM_USAGE_LOG"] = "0"
+    os.environ["ENABLE_AUDIO_TRANSCRIPT"] = "0"
+    os.environ["TRANSCRIPT_STORE_DIR"] = tempfile.mkdtemp(prefix="bench-transcripts-")
+    os.environ["RATE_LIMIT_DB_PATH"] = os.path.join(os.environ["TRANSCRIPT_STORE_DIR"], "ratelimit.sqlite3")
+
+
+def run_function_mode(server, texts, concurrency):
+    def call(text):
+        started = time.perf_counter()
+        try:
+            _, used_llm = server.build_summary_with_fallback(text, "YouTube")
+            return time.perf_counter() - started, True, used_llm
+        except Exception:
+            return time.perf_counter() - started, False, False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(call, texts))
+
+
+def run_http_mode(server, texts, concurrency):
+    import requests
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    video_ids = [f"bench{index:06d}" for index in range(len(texts))]
+    for video_id, text in zip(video_ids, texts):
+        server.save_transcript(video_id, "transcript", text)
+
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    endpoint = f"http://127.0.0.1:{httpd.server_port}/api/magic"
+    local = threading.local()
+
+    def call(video_id):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                endpoint,
+                json={"url": f"https://www.youtube.com/watch?v={video_id}", "platform": "YouTube"},
+                timeout=300,
+            )
+            payload = response.json()
+            ok = response.status_code == 200
+            return time.perf_counter() - started, ok, ok and "AI" in payload.get("confidence", "")
+        except Exception:
+            return time.perf_counter() - started, False, False
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(call, video_ids))
+    finally:
+        httpd.shutdown()
+
+
+def summarize_results(results, wall_seconds):
+    latencies = [latency for latency, ok, _ in results if ok]
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, ok, _ in results if not ok),
+        "llm_summaries": sum(1 for _, ok, used_llm in results if ok and used_llm),
+        "extractive_fallbacks": sum(1 for _, ok, used_llm in results if ok and not used_llm),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(results) / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_ms": {
+            name: round(percentile(latencies, pct) * 1000, 1)
+            for name, pct in (("p50", 50), ("p90", 90), ("p95", 95), ("p99", 99), ("max", 100))
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the summarization path against a local fake LLM")
+    parser.add_argument("--mode", choices=("function", "http"), default="function")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--chars", type=int, default=6000, help="synthetic transcript length")
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--race-mode", choices=("sequential", "hedge", "parallel"), default="sequential")
+    parser.add_argument("--providers", default="openai", help="SUMMARY_PROVIDER_ORDER for the run")
+    parser.add_argument("--gemini", action="store_true", help="also configure Gemini against the fake server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON only")
+    args = parser.parse_args()
+
+    fake_server, base_url = start_server(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    configure_environment(base_url, args)
+
+    import server
+    from llm_metrics import snapshot
+
+    texts = [make_transcript(index, args.chars, args.seed) for index in range(args.requests)]
+    started = time.perf_counter()
+    if args.mode == "function":
+        results = run_function_mode(server, texts, args.concurrency)
+    else:
+        results = run_http_mode(server, texts, args.concurrency)
+    report = summarize_results(results, time.perf_counter() - started)
+    report["config"] = {
+        key: getattr(args, key)
+        for key in ("mode", "concurrency", "chars", "latency_ms", "jitter_ms", "error_rate", "rate_limit_rate", "race_mode")
+    }
+    report["fake_server"] = dict(fake_server.state.stats)
+    report["llm_calls"] = {
+        f"{provider}:{model}:{operation}": series["calls"]
+        for (provider, model, operation), series in snapshot().items()
+    }
+    fake_server.shutdown()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    latency = report["latency_ms"]
+    print(f"mode={args.mode} requests={report['requests']} concurrency={args.concurrency}")
+    print(f"throughput: {report['throughput_rps']} req/s over {report['wall_seconds']}s")
+    print(
+        f"latency ms: p50={latency['p50']} p90={latency['p90']} p95={latency['p95']} "
+        f"p99={latency['p99']} max={latency['max']}"
+    )
+    print(
+        f"errors={report['errors']} llm={report['llm_summaries']} "
+        f"extractive_fallback={report['extractive_fallbacks']}"
+    )
+    print(f"fake server: {report['fake_server']}")
+    print(f"llm calls: {json.dumps(report['llm_calls'], ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
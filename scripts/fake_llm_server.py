@@ -0,0 +1,534 @@
+"""
+本地 LLM 替身服务（OpenAI / Gemini 兼容）
+用于离线测试与压测：
+- OpenAI：OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+- Gemini：GEMINI_BASE_URL=http://127.0.0.1:<port>（google-generativeai 走 REST 传输）
+
+支持：
+- POST /v1/chat/completions（含 stream=True 与 stream_options.include_usage）
+- POST /v1/responses
+- POST /v1/files、GET /v1/files/<id>/content
+- POST /v1/batches、GET /v1/batches/<id>（创建后 --batch-seconds 秒完成）
+- POST /v1beta/models/<model>:generateContent、:streamGenerateContent
+
+可配置延迟（--latency-ms / --jitter-ms）、错误率（--error-rate 返回 500，--rate-limit-rate 返回 429）
+与固定 JSON（--response-file）；摘要内容默认由本地抽取式摘要生成，--seed 固定时结果完全确定。
+同一 system 前缀第二次出现且不少于 1024 token 时按前缀长度返回 cached_tokens，模拟服务商的前缀缓存
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from extractive import estimate_tokens, summarize_extractive
+
+# 服务商前缀缓存的最小长度（OpenAI / Gemini 均为 1024 token）
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+class FakeState:
+    def __init__(
+        self,
+        batch_seconds=2.0,
+        canned_response=None,
+        latency_ms=0.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        stream_chunks=8,
+        seed=None,
+    ):
+        self.batch_seconds = batch_seconds
+        self.canned_response = canned_response
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self.files = {}
+        self.batches = {}
+        self.seen_prefixes = set()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+
+    def next_id(self, prefix):
+        return f"{prefix}-{next(self._ids)}"
+
+    def roll(self):
+        """按配置决定本次请求的结果：None / "error" / "rate_limited"，以及延迟秒数"""
+        with self.lock:
+            self.stats["requests"] += 1
+            value = self._random.random()
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            outcome = None
+            if value < self.rate_limit_rate:
+                outcome = "rate_limited"
+            elif value < self.rate_limit_rate + self.error_rate:
+                outcome = "error"
+            if outcome:
+                self.stats["errors" if outcome == "error" else "rate_limited"] += 1
+        return outcome, delay
+
+    def cached_tokens(self, prefix):
+        """前缀第一次出现时写入“缓存”，之后返回前缀的 token 数；与服务商一致，不足 1024 token 的前缀不缓存"""
+        if not prefix or estimate_tokens(prefix) < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        with self.lock:
+            if digest in self.seen_prefixes:
+                return estimate_tokens(prefix)
+            self.seen_prefixes.add(digest)
+        return 0
+
+
+def _message_text(content):
+    if isinstance(content, list):
+        return " ".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return str(content or "")
+
+
+def build_summary_json(system_text, user_text, canned_response=None):
+    """
+    生成确定的 JSON 输出：推文批量请求（user 为 [{id, text}] 数组）返回 items，
+    其余按 “内容：” 之后的文本做抽取式摘要
+    """
+    if canned_response is not None:
+        return json.dumps(canned_response, ensure_ascii=False)
+    try:
+        items = json.loads(user_text)
+    except ValueError:
+        items = None
+    if isinstance(items, list) and '"items"' in system_text:
+        outputs = []
+        for item in items:
+            if isinstance(item, dict):
+                outputs.append({"id": item.get("id"), **_summarize(str(item.get("text", "")))})
+        return json.dumps({"items": outputs}, ensure_ascii=False)
+    return json.dumps(_summarize(user_text.split("内容：", 1)[-1]), ensure_ascii=False)
+
+
+def _summarize(content):
+    result = summarize_extractive(content)
+    summary = result["summary"] or "无内容"
+    highlights = result["highlights"] or [{"label": "要点", "text": summary[:60]}]
+    return {"summary": summary, "highlights": highlights}
+
+
+def _split_chunks(text, count):
+    size = max(1, -(-len(text) // count))
+    return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _usage(state, system_text, user_text, content):
+    prompt_tokens = estimate_tokens(system_text) + estimate_tokens(user_text)
+    completion_tokens = estimate_tokens(content)
+    return prompt_tokens, completion_tokens, state.cached_tokens(system_text)
+
+
+def openai_messages(body):
+    system_text = "\n".join(
+        _message_text(m.get("content")) for m in body.get("messages") or body.get("input") or []
+        if isinstance(m, dict) and m.get("role") == "system"
+    )
+    user_text = "\n".join(
+        _message_text(m.get("content")) for m in body.get("messages") or body.get("input") or []
+        if isinstance(m, dict) and m.get("role") == "user"
+    )
+    if isinstance(body.get("input"), str):
+        user_text = body["input"]
+    return system_text, user_text
+
+
+def build_chat_completion(body, state):
+    system_text, user_text = openai_messages(body)
+    content = build_summary_json(system_text, user_text, state.canned_response)
+    prompt_tokens, completion_tokens, cached = _usage(state, system_text, user_text, content)
+    return {
+        "id": state.next_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake-model"),
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        },
+    }
+
+
+def iter_chat_chunks(body, state):
+    completion = build_chat_completion(body, state)
+    base = {
+        "id": completion["id"],
+        "object": "chat.completion.chunk",
+        "created": completion["created"],
+        "model": completion["model"],
+    }
+    content = completion["choices"][0]["message"]["content"]
+    yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+    for piece in _split_chunks(content, state.stream_chunks):
+        yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield {**base, "choices": [], "usage": completion["usage"]}
+
+
+def build_response_object(body, state):
+    system_text, user_text = openai_messages(body)
+    if body.get("instructions"):
+        system_text = body["instructions"]
+    content = build_summary_json(system_text, user_text, state.canned_response)
+    prompt_tokens, completion_tokens, cached = _usage(state, system_text, user_text, content)
+    return {
+        "id": state.next_id("resp"),
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "fake-model"),
+        "status": "completed",
+        "output": [
+            {
+                "id": state.next_id("msg"),
+                "type": "message",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": content, "annotations": []}],
+            }
+        ],
+        "usage": {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "input_tokens_details": {"cached_tokens": cached},
+        },
+    }
+
+
+def gemini_texts(body):
+    texts = []
+    for content in body.get("contents") or []:
+        for part in content.get("parts") or []:
+            if "text" in part:
+                texts.append(part["text"])
+    system = body.get("systemInstruction") or body.get("system_instruction") or {}
+    system_text = "".join(part.get("text", "") for part in system.get("parts") or [])
+    prompt = "\n".join(texts)
+    if not system_text:
+        # 单段 prompt：模板前缀与内容之间以 “平台：” / 推文数组分隔
+        marker = prompt.find("平台：")
+        if marker == -1:
+            marker = prompt.find("[{")
+        if marker > 0:
+            system_text, prompt = prompt[:marker], prompt[marker:]
+    return system_text, prompt
+
+
+def build_gemini_response(body, state, text=None, usage=True):
+    system_text, user_text = gemini_texts(body)
+    content = build_summary_json(system_text, user_text, state.canned_response) if text is None else text
+    payload = {
+        "candidates": [
+            {"content": {"parts": [{"text": content}], "role": "model"}, "finishReason": "STOP", "index": 0}
+        ],
+    }
+    if usage:
+        prompt_tokens, completion_tokens, cached = _usage(state, system_text, user_text, content)
+        payload["usageMetadata"] = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": prompt_tokens + completion_tokens,
+            "cachedContentTokenCount": cached,
+        }
+    return payload
+
+
+def iter_gemini_chunks(body, state):
+    full = build_gemini_response(body, state)
+    content = full["candidates"][0]["content"]["parts"][0]["text"]
+    pieces = _split_chunks(content, state.stream_chunks)
+    for index, piece in enumerate(pieces):
+        chunk = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}]}
+        if index == len(pieces) - 1:
+            chunk["candidates"][0]["finishReason"] = "STOP"
+            chunk["usageMetadata"] = full["usageMetadata"]
+        yield chunk
+
+
+def run_batch(state, batch_id):
+    with state.lock:
+        batch = state.batches[batch_id]
+        input_file = state.files[batch["input_file_id"]]
+    lines = []
+    failed = 0
+    for raw in input_file["content"].decode("utf-8").splitlines():
+        if not raw.strip():
+            continue
+        request_line = json.loads(raw)
+        if request_line.get("url") != "/v1/chat/completions":
+            failed += 1
+            response = {"status_code": 400, "body": {"error": {"message": "unsupported endpoint"}}}
+        else:
+            response = {"status_code": 200, "body": build_chat_completion(request_line.get("body") or {}, state)}
+        lines.append(json.dumps({"id": state.next_id("batch_req"), "custom_id": request_line.get("custom_id"), "response": response}, ensure_ascii=False))
+    output_id = state.next_id("file")
+    with state.lock:
+        state.files[output_id] = {
+            "id": output_id,
+            "filename": f"{batch_id}_output.jsonl",
+            "purpose": "batch_output",
+            "content": "\n".join(lines).encode("utf-8"),
+        }
+        batch["output_file_id"] = output_id
+        batch["request_counts"] = {"total": len(lines), "completed": len(lines) - failed, "failed": failed}
+
+
+def file_object(record):
+    return {
+        "id": record["id"],
+        "object": "file",
+        "bytes": len(record["content"]),
+        "created_at": int(time.time()),
+        "filename": record["filename"],
+        "purpose": record["purpose"],
+        "status": "processed",
+    }
+
+
+def batch_object(batch, batch_seconds):
+    elapsed = time.time() - batch["created_at"]
+    status = "completed" if elapsed >= batch_seconds else ("in_progress" if elapsed >= batch_seconds / 2 else "validating")
+    payload = {key: value for key, value in batch.items() if key != "output_file_id"}
+    payload["status"] = status
+    payload["output_file_id"] = batch.get("output_file_id") if status == "completed" else None
+    if status == "completed":
+        payload["completed_at"] = int(batch["created_at"] + batch_seconds)
+    return payload
+
+
+def parse_multipart(headers, body):
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {headers.get('Content-Type')}\r\n\r\n".encode("latin-1") + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _send_json(self, payload, status=200, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_error(self, status, message, error_type="invalid_request_error", headers=None):
+            self._send_json({"error": {"message": message, "type": error_type, "code": status}}, status, headers)
+
+        def _send_stream(self, chunks, sse=True, done_marker=False):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write(data):
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            chunk_delay = state.latency_ms / 1000 / max(2, state.stream_chunks * 2)
+            if not sse:
+                write(b"[")
+            for index, chunk in enumerate(chunks):
+                text = json.dumps(chunk, ensure_ascii=False)
+                if sse:
+                    write(f"data: {text}\n\n".encode("utf-8"))
+                else:
+                    write((("," if index else "") + text).encode("utf-8"))
+                time.sleep(chunk_delay)
+            if done_marker:
+                write(b"data: [DONE]\n\n")
+            if not sse:
+                write(b"]")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _simulate(self):
+            """注入延迟与错误；返回 True 表示已经发送了错误响应"""
+            outcome, delay = state.roll()
+            time.sleep(delay)
+            if outcome == "rate_limited":
+                self._send_error(429, "Rate limit reached (fake)", "rate_limit_error", {"Retry-After": "1"})
+                return True
+            if outcome == "error":
+                self._send_error(500, "Internal error (fake)", "server_error")
+                return True
+            return False
+
+        def do_POST(self):
+            path, _, query = self.path.partition("?")
+            body = self._read_body()
+            if path == "/v1/chat/completions":
+                request_body = json.loads(body or b"{}")
+                if self._simulate():
+                    return None
+                if request_body.get("stream"):
+                    return self._send_stream(iter_chat_chunks(request_body, state), done_marker=True)
+                return self._send_json(build_chat_completion(request_body, state))
+            if path == "/v1/responses":
+                request_body = json.loads(body or b"{}")
+                if self._simulate():
+                    return None
+                return self._send_json(build_response_object(request_body, state))
+            if path.startswith("/v1beta/models/") and ":" in path:
+                action = path.rsplit(":", 1)[1]
+                request_body = json.loads(body or b"{}")
+                if self._simulate():
+                    return None
+                if action == "generateContent":
+                    return self._send_json(build_gemini_response(request_body, state))
+                if action == "streamGenerateContent":
+                    return self._send_stream(iter_gemini_chunks(request_body, state), sse="alt=sse" in query)
+                return self._send_error(404, f"unknown action {action}")
+            if path == "/v1/files":
+                fields = parse_multipart(self.headers, body)
+                filename, content = fields.get("file", ("upload.jsonl", b""))
+                purpose = (fields.get("purpose") or (None, b"batch"))[1].decode("utf-8")
+                record = {"id": state.next_id("file"), "filename": filename, "purpose": purpose, "content": content or b""}
+                with state.lock:
+                    state.files[record["id"]] = record
+                return self._send_json(file_object(record))
+            if path == "/v1/batches":
+                request_body = json.loads(body or b"{}")
+                if request_body.get("input_file_id") not in state.files:
+                    return self._send_error(404, "input file not found")
+                batch_id = state.next_id("batch")
+                batch = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": request_body.get("endpoint"),
+                    "input_file_id": request_body["input_file_id"],
+                    "completion_window": request_body.get("completion_window", "24h"),
+                    "created_at": time.time(),
+                    "metadata": request_body.get("metadata"),
+                    "error_file_id": None,
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                }
+                with state.lock:
+                    state.batches[batch_id] = batch
+                run_batch(state, batch_id)
+                return self._send_json(batch_object(batch, state.batch_seconds))
+            return self._send_error(404, f"unknown path {path}")
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            parts = path.strip("/").split("/")
+            if path == "/stats":
+                with state.lock:
+                    return self._send_json(dict(state.stats))
+            if len(parts) == 3 and parts[:2] == ["v1", "batches"]:
+                batch = state.batches.get(parts[2])
+                if not batch:
+                    return self._send_error(404, "batch not found")
+                return self._send_json(batch_object(batch, state.batch_seconds))
+            if len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "content":
+                record = state.files.get(parts[2])
+                if not record:
+                    return self._send_error(404, "file not found")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(record["content"])))
+                self.end_headers()
+                self.wfile.write(record["content"])
+                return None
+            return self._send_error(404, f"unknown path {path}")
+
+    return Handler
+
+
+def start_server(host="127.0.0.1", port=0, batch_seconds=2.0, canned_response=None, **options):
+    """
+    在后台线程启动服务，返回 (server, base_url)；port=0 时自动分配端口
+    options 透传给 FakeState（latency_ms / jitter_ms / error_rate / rate_limit_rate / stream_chunks / seed）
+    """
+    state = FakeState(batch_seconds=batch_seconds, canned_response=canned_response, **options)
+    httpd = ThreadingHTTPServer((host, port), make_handler(state))
+    httpd.daemon_threads = True
+    httpd.state = state
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd, f"http://{host}:{httpd.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI/Gemini-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-seconds", type=float, default=2.0)
+    parser.add_argument("--response-file", help="JSON file returned as every summary")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--stream-chunks", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    canned = None
+    if args.response_file:
+        canned = json.loads(Path(args.response_file).read_text(encoding="utf-8"))
+    httpd, base_url = start_server(
+        args.host,
+        args.port,
+        args.batch_seconds,
+        canned,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        stream_chunks=args.stream_chunks,
+        seed=args.seed,
+    )
+    print(f"Fake LLM server listening on {base_url}")
+    print(f"  OPENAI_BASE_URL={base_url}")
+    print(f"  GEMINI_BASE_URL={base_url[: -len('/v1')]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
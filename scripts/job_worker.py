@@ -0,0 +1,48 @@
+"""
+独立运行异步任务 worker（与 web 进程共享 JOBS_DB_PATH）
+web 进程设置 JOBS_EMBEDDED_WORKERS=0 时使用
+
+用法：
+    python scripts/job_worker.py --workers 4
+"""
+import argparse
+import os
+import signal
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background workers for /api/jobs")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS", "2")))
+    args = parser.parse_args()
+
+    from jobs import start_worker_pool
+    from server import get_job_queue
+
+    job_queue = get_job_queue()
+    processes = start_worker_pool(
+        job_queue.path,
+        "server:run_job",
+        args.workers,
+        lease_seconds=job_queue.lease_seconds,
+        max_attempts=job_queue.max_attempts,
+        reuse_seconds=job_queue.reuse_seconds,
+    )
+    print(f"[jobs] {len(processes)} workers on {job_queue.path}", file=sys.stderr)
+
+    def stop(*_):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
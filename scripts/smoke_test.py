@@ -1,11 +1,27 @@
+import asyncio
+import contextvars
+import json
+import os
 import re
 import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
 
 import server
+import browser_pool
+from audio_chunks import plan_segments, stitch_segments
+from caption_tracks import CaptionTrackCache, make_track, select_caption_track
+from jobs import JobQueue
+from micro_batch import MicroBatcher
+from rate_limit import PRIORITY_BACKGROUND, RateLimiter, RateLimitExceeded
+from summary_cache import SummaryCache, make_cache_key
+from transcript_store import TranscriptStore
+from twitter_sessions import TwitterSessionManager, cookie_key
 
 
 def assert_equal(actual, expected, label):
@@ -54,6 +70,719 @@ def run_backend_smoke_tests():
     return "backend ok"
 
 
+def run_transcript_store_smoke_tests():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TranscriptStore(tmp, max_bytes=0)
+        text = "第一段字幕。" * 200 + "hello world " * 200
+        digest = store.put("vid1", "zh", "captions", text)
+        assert_equal(store.get("vid1", "zh", "captions"), text, "transcript round trip")
+        assert_equal(store.get("vid1", "en", "captions"), None, "missing transcript")
+
+        # 相同正文只存一份
+        assert_equal(store.put("vid2", "zh", "whisper", text), digest, "same text same digest")
+        stats = store.stats()
+        assert_equal((stats["entries"], stats["blobs"]), (2, 1), "duplicate text stored once")
+        assert_true(stats["bytes"] < stats["raw_bytes"], "transcript compressed")
+
+        # 超过容量上限时淘汰最久未访问的正文
+        store.max_bytes = stats["bytes"] + 1
+        time.sleep(0.01)
+        other = "第二段字幕。" * 200 + "hello again " * 200
+        store.put("vid3", "en", "captions", other)
+        assert_equal(store.get("vid1", "zh", "captions"), None, "oldest transcript evicted")
+        assert_equal(store.get("vid3", "en", "captions"), other, "newest transcript kept")
+
+        # 正文文件丢失时删除索引，让调用方重新获取
+        blob_dir = Path(tmp) / "blobs"
+        for blob in blob_dir.rglob("*.*"):
+            blob.unlink()
+        assert_equal(store.get("vid3", "en", "captions"), None, "missing blob treated as miss")
+        assert_equal(store.stats()["entries"], 0, "missing blob index dropped")
+
+    return "transcript store ok"
+
+
+def run_summary_cache_smoke_tests():
+    key = make_cache_key("hello  world\n", "YouTube", "openai", "gpt-4o-mini", "summary", "v2")
+    assert_equal(
+        make_cache_key("hello world", "YouTube", "openai", "gpt-4o-mini", "summary", "v2"), key,
+        "whitespace-normalized input same key",
+    )
+    assert_true(
+        make_cache_key("hello world", "YouTube", "openai", "gpt-4o-mini", "summary", "v3") != key,
+        "prompt version changes key",
+    )
+
+    value = {"summary": "摘要", "highlights": [{"label": "要点", "text": "内容"}]}
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SummaryCache(os.path.join(tmp, "summaries.sqlite3"), max_bytes=0)
+        cache.set(key, value, "openai", "gpt-4o-mini", "summary", "v2")
+        assert_equal(cache.get(key), value, "summary cache round trip")
+        assert_equal(cache.get("missing"), None, "summary cache miss")
+
+        # 提示词版本变化时删除旧版本结果，每个版本只执行一次
+        cache.set("new", value, "openai", "gpt-4o-mini", "summary", "v3")
+        assert_equal(cache.purge_stale_versions("summary", "v3"), 1, "stale versions purged")
+        assert_equal(cache.get(key), None, "stale version gone")
+        assert_equal(cache.get("new"), value, "current version kept")
+        assert_equal(cache.purge_stale_versions("summary", "v3"), 0, "purge runs once per version")
+
+        # 超过容量上限时淘汰最久未访问的结果
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        cache.max_bytes = size * 2
+        time.sleep(0.01)
+        cache.set("second", value, "openai", "gpt-4o-mini", "summary", "v3")
+        time.sleep(0.01)
+        cache.set("third", value, "openai", "gpt-4o-mini", "summary", "v3")
+        assert_equal(cache.get("new"), None, "oldest summary evicted")
+        assert_equal(cache.get("third"), value, "newest summary kept")
+
+        expiring = SummaryCache(os.path.join(tmp, "expiring.sqlite3"), max_bytes=0, ttl_seconds=0.05)
+        expiring.set(key, value, "openai", "gpt-4o-mini", "summary", "v2")
+        time.sleep(0.1)
+        assert_equal(expiring.get(key), None, "expired summary dropped")
+
+    return "summary cache ok"
+
+
+def run_job_queue_smoke_tests():
+    client = server.app.test_client()
+
+    resp = client.post("/api/jobs", json={})
+    assert_equal(resp.status_code, 400, "jobs missing url status")
+    assert_equal(resp.get_json().get("error"), "URL is required", "jobs missing url error")
+
+    resp = client.post("/api/jobs", json={"url": "https://example.com", "platform": "Foo"})
+    assert_equal(resp.status_code, 400, "jobs unsupported platform status")
+
+    resp = client.get("/api/jobs/does-not-exist")
+    assert_equal(resp.status_code, 404, "unknown job status")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = JobQueue(os.path.join(tmp, "jobs.sqlite3"), lease_seconds=0.2, max_attempts=2)
+        job, created = queue.enqueue("youtube:abc", {"url": "u"})
+        assert_true(created, "job created")
+        duplicate, created = queue.enqueue("youtube:abc", {"url": "u"})
+        assert_true(not created and duplicate["job_id"] == job["job_id"], "duplicate job reused")
+
+        job_id, payload = queue.claim("worker-a")
+        assert_equal(payload, {"url": "u"}, "claimed payload")
+        assert_true(queue.progress(job_id, "worker-a", "subtitle", "running"), "lease holder reports progress")
+        assert_equal(queue.claim("worker-b"), None, "leased job not claimed twice")
+
+        # 租约过期后重新排队，原 worker 迟到的写入不再生效
+        time.sleep(0.3)
+        claimed = queue.claim("worker-b")
+        assert_equal(claimed and claimed[0], job_id, "expired lease requeued")
+        assert_true(not queue.finish(job_id, "worker-a", {"title": "stale"}), "stale worker finish rejected")
+        assert_true(queue.finish(job_id, "worker-b", {"title": "ok"}), "current worker finish accepted")
+        job = queue.get(job_id)
+        assert_equal(job["status"], "succeeded", "job succeeded")
+        assert_equal(job["result"], {"title": "ok"}, "job result")
+        assert_equal(job["attempts"], 2, "job attempts")
+
+        job, _ = queue.enqueue("youtube:def", {"url": "v"})
+        queue.claim("worker-c")
+        time.sleep(0.3)
+        assert_equal(queue.claim("worker-d")[0], job["job_id"], "second attempt claimed")
+        time.sleep(0.3)
+        assert_equal(queue.claim("worker-e"), None, "job past max attempts not requeued")
+        assert_equal(queue.get(job["job_id"])["status"], "failed", "job failed after max attempts")
+        assert_equal(queue.get(job["job_id"])["error"], "worker-lost", "job failed as worker-lost")
+
+    return "job queue ok"
+
+
+def run_caption_track_smoke_tests():
+    tracks = [
+        make_track("player", "en", "https://example.com/en-asr", kind="asr"),
+        make_track("player", "en", "https://example.com/en"),
+        make_track("player", "zh-Hans", "https://example.com/zh-Hans-tr", is_translated=True),
+        make_track("player", "zh-Hant", "https://example.com/zh-Hant"),
+    ]
+    languages = ["zh", "en"]
+
+    best = select_caption_track(tracks, languages)
+    assert_equal(best["url"], "https://example.com/zh-Hant", "original zh track preferred")
+
+    best = select_caption_track(tracks, languages, {"https://example.com/zh-Hant"})
+    assert_equal(best["url"], "https://example.com/en", "original en beats translated zh")
+
+    best = select_caption_track(tracks, languages, {"https://example.com/zh-Hant", "https://example.com/en"})
+    assert_equal(best["url"], "https://example.com/en-asr", "asr en beats translated zh")
+
+    best = select_caption_track(tracks[2:3], languages)
+    assert_equal(best["url"], "https://example.com/zh-Hans-tr", "translated track as last resort")
+
+    cache = CaptionTrackCache(max_items=2)
+    cache.remember("a", tracks)
+    cache.mark_failed("a", "https://example.com/zh-Hant")
+    cache.remember("a", tracks[:1])
+    cached_tracks, failed = cache.get("a")
+    assert_equal(len(cached_tracks), 4, "remembered tracks kept")
+    assert_equal(failed, frozenset({"https://example.com/zh-Hant"}), "failed track recorded")
+    cache.remember("b", tracks)
+    cache.get("a")
+    cache.remember("c", tracks)
+    assert_true(cache.get("b") is None and cache.get("a"), "least recently used video evicted")
+
+    return "caption tracks ok"
+
+
+def run_audio_segment_smoke_tests():
+    segments = plan_segments(25, 10, 2)
+    assert_equal(segments, [(0.0, 10.0), (8.0, 12.0), (18.0, 7.0)], "segment plan")
+    assert_equal(plan_segments(0, 10, 2), [(0.0, 0.0)], "empty audio plan")
+
+    texts = [
+        "The first segment talks about decoding latency in detail",
+        "latency in detail and then moves on to batching strategies",
+        "batching strategies and closes with quantization",
+    ]
+    stitched = stitch_segments(texts, plan_segments(30, 10, 2), 2)
+    assert_equal(
+        stitched,
+        "The first segment talks about decoding latency in detail and then moves on to "
+        "batching strategies and closes with quantization",
+        "overlap removed when stitching",
+    )
+    assert_equal(stitch_segments(["今天天气", "很好"], [(0, 10), (8, 12)], 2), "今天天气很好", "no overlap match")
+
+    return "audio segments ok"
+
+
+def run_rate_limit_smoke_tests():
+    os.environ["RATE_LIMIT_SMOKE_RPM"] = "2"
+    os.environ["RATE_LIMIT_QUEUE_TPM"] = "600"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            limiter = RateLimiter(os.path.join(tmp, "ratelimit.sqlite3"), max_wait_seconds=0.1)
+            assert_true(limiter.acquire("smoke", "test") < 0.05, "first request from full bucket")
+            limiter.acquire("smoke", "test")
+            assert_true(limiter.expected_delay("smoke", "test") > 20, "empty bucket reports delay")
+            try:
+                limiter.acquire("smoke", "test")
+            except RateLimitExceeded:
+                pass
+            else:
+                raise AssertionError("empty bucket: RateLimitExceeded not raised")
+            assert_true(limiter.acquire("smoke", "other-model") < 0.05, "each model has its own bucket")
+
+            # 桶被暂停期间排队：后到的交互请求插到后台请求之前，先拿走整桶 token，
+            # 后台请求随后发现剩余等待超过上限而放弃
+            limiter.max_wait_seconds = 5
+            limiter.penalize("queue", "test", 0.3)
+            outcomes = {}
+
+            def acquire_background():
+                try:
+                    limiter.acquire("queue", "test", tokens=600, priority=PRIORITY_BACKGROUND)
+                    outcomes["background"] = "acquired"
+                except RateLimitExceeded:
+                    outcomes["background"] = "rejected"
+
+            background = threading.Thread(target=acquire_background)
+            background.start()
+            time.sleep(0.05)
+            limiter.acquire("queue", "test", tokens=600, max_wait=120)
+            background.join()
+            assert_equal(outcomes, {"background": "rejected"}, "interactive request jumps the queue")
+
+            cancel_event = threading.Event()
+            threading.Timer(0.2, cancel_event.set).start()
+            limiter.penalize("queue", "test", 10)
+            started = time.monotonic()
+            try:
+                limiter.acquire("queue", "test", cancel_event=cancel_event, max_wait=30)
+            except RateLimitExceeded:
+                pass
+            else:
+                raise AssertionError("cancelled waiter: RateLimitExceeded not raised")
+            assert_true(time.monotonic() - started < 1, "cancelled waiter stops promptly")
+    finally:
+        os.environ.pop("RATE_LIMIT_SMOKE_RPM", None)
+        os.environ.pop("RATE_LIMIT_QUEUE_TPM", None)
+
+    return "rate limit ok"
+
+
+async def call_asgi(app, method, path, body=b"", query=b""):
+    """以最小的 ASGI scope 调用 app，返回 (status, body)"""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query, "root_path": "",
+        "headers": [(b"content-type", b"application/json")], "scheme": "http",
+        "server": ("testserver", 80), "http_version": "1.1",
+    }
+    await app(scope, receive, send)
+    return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+
+def run_batch_smoke_tests():
+    client = server.app.test_client()
+
+    resp = client.post("/api/batch", json={"items": []})
+    assert_equal(resp.status_code, 400, "batch empty items status")
+    assert_equal(resp.get_json().get("error"), "items is required", "batch empty items error")
+
+    calls = []
+
+    def fake_build_card(url, platform, twitter_cookies=None, on_progress=None):
+        calls.append((url, server._LLM_PRIORITY.get()))
+        if "status/2" in url:
+            raise RuntimeError("tweet-text-not-found")
+        return {"title": url}
+
+    original = server.build_card
+    server.build_card = fake_build_card
+    try:
+        items = [
+            {"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "platform": "YouTube"},
+            {"url": "https://x.com/a/status/2", "platform": "Twitter"},
+            {"url": "https://youtu.be/dQw4w9WgXcQ", "platform": "YouTube"},
+            {"url": "https://example.com", "platform": "Foo"},
+            {"platform": "YouTube"},
+        ]
+        resp = client.post("/api/batch", json={"items": items})
+        assert_equal(resp.mimetype, "application/x-ndjson", "batch content type")
+        body = resp.get_data(as_text=True)
+        assert_true(body.endswith("\n"), "batch ends with newline")
+        lines = [json.loads(line) for line in body.splitlines()]
+        assert_equal(lines[-1], {"done": True, "total": 5, "unique": 2, "failed": 3}, "batch done line")
+        by_index = {line["index"]: line for line in lines[:-1]}
+        assert_equal(sorted(by_index), [0, 1, 2, 3, 4], "one line per item")
+        assert_equal(by_index[3]["message"], "Unsupported platform", "invalid platform inline")
+        assert_equal(by_index[4]["message"], "URL is required", "missing url inline")
+        assert_equal(by_index[1]["category"], "TWEET_NOT_FOUND", "failed item classified")
+        assert_equal(by_index[0]["card"], by_index[2]["card"], "duplicate links share one result")
+        assert_equal(len(calls), 2, "duplicate content built once")
+        assert_true(all(priority == PRIORITY_BACKGROUND for _, priority in calls), "batch runs at background priority")
+    finally:
+        server.build_card = original
+
+    # 响应缓存为 LRU：超出上限时淘汰最久未用的
+    previous = server._CACHE_MAX_ITEMS
+    server._CACHE_MAX_ITEMS = 2
+    try:
+        server.cache_set("smoke:a", 1)
+        server.cache_set("smoke:b", 2)
+        server.cache_get("smoke:a")
+        server.cache_set("smoke:c", 3)
+        assert_equal(
+            [server.cache_get(key) for key in ("smoke:a", "smoke:b", "smoke:c")], [1, None, 3], "cache evicts LRU"
+        )
+    finally:
+        server._CACHE_MAX_ITEMS = previous
+        for key in ("smoke:a", "smoke:c"):
+            server._CACHE.pop(key, None)
+
+    return "batch ok"
+
+
+def run_twitter_bulk_smoke_tests():
+    client = server.app.test_client()
+
+    resp = client.post("/api/twitter/bulk", json={})
+    assert_equal(resp.status_code, 400, "bulk missing ids status")
+    assert_equal(resp.get_json().get("error"), "ids or thread is required", "bulk missing ids error")
+
+    resp = client.post("/api/twitter/bulk", json={"ids": ["not-a-tweet"]})
+    assert_equal(resp.status_code, 400, "bulk invalid id status")
+    assert_equal(resp.get_json().get("error"), "Invalid tweet ID or URL", "bulk invalid id error")
+
+    resp = client.post("/api/twitter/bulk", json={"thread": "not-a-tweet"})
+    assert_equal(resp.status_code, 400, "bulk invalid thread status")
+
+    original_resolve = server.resolve_twitter_thread
+    original_build = server.build_bulk_tweet_item
+    built = []
+
+    def fake_build(tweet_id, twitter_cookies, known):
+        built.append(tweet_id)
+        return {"id": tweet_id, "url": f"https://x.com/i/status/{tweet_id}", "card": {"title": tweet_id}}
+
+    server.resolve_twitter_thread = lambda tweet_id, known, max_items: ["101", "102", tweet_id]
+    server.build_bulk_tweet_item = fake_build
+    try:
+        # thread 模式：items 从线程首条开始，anchor_id 为传入的最后一条
+        resp = client.post("/api/twitter/bulk", json={"thread": "https://x.com/user/status/103"})
+        body = resp.get_json()
+        assert_equal([item["id"] for item in body["items"]], ["101", "102", "103"], "thread items in order")
+        assert_equal(body.get("anchor_id"), "103", "thread anchor id")
+
+        # 重复 ID 只抓取一次，结果按输入顺序返回；ids 模式不带 anchor_id
+        built.clear()
+        resp = client.post("/api/twitter/bulk", json={"ids": ["7", "https://x.com/a/status/8", "7"]})
+        body = resp.get_json()
+        assert_equal([item["id"] for item in body["items"]], ["7", "8", "7"], "bulk items in input order")
+        assert_equal(sorted(built), ["7", "8"], "duplicate ids fetched once")
+        assert_true("anchor_id" not in body, "ids mode has no anchor id")
+
+        resp = client.post("/api/twitter/bulk", json={"thread": "103", "stream": True})
+        events = re.findall(r"^event: (\w+)\ndata: (.*)$", resp.get_data(as_text=True), re.M)
+        assert_equal([name for name, _ in events], ["item", "item", "item", "done"], "bulk stream events")
+        assert_equal(json.loads(events[-1][1]), {"count": 3, "anchor_id": "103"}, "bulk stream done event")
+    finally:
+        server.resolve_twitter_thread = original_resolve
+        server.build_bulk_tweet_item = original_build
+
+    return "twitter bulk ok"
+
+
+def run_asgi_smoke_tests():
+    try:
+        import asgi
+    except ImportError:
+        return "asgi skipped (asgiref not installed)"
+
+    def fake_collect(url, video_id, on_progress):
+        on_progress("transcript", "running")
+        time.sleep(0.05)
+        on_progress("transcript", "done")
+        return "transcript text " * 20, "transcript", {}
+
+    def fake_summary_stream(text, platform):
+        yield {"type": "delta", "text": "partial"}
+        return {"summary": "ok", "highlights": []}, True
+
+    originals = (server.collect_youtube_text, server.fetch_youtube_metadata, server.stream_summary_with_fallback)
+    server.collect_youtube_text = fake_collect
+    server.fetch_youtube_metadata = lambda video_id, url: {"title": "Title", "author": "Author"}
+    server.stream_summary_with_fallback = fake_summary_stream
+    query = b"url=https://youtu.be/smokeTest01&platform=YouTube"
+    try:
+        status, body = asyncio.run(call_asgi(asgi.app, "POST", "/api/parse", b"{}"))
+        assert_equal(status, 400, "asgi validation status")
+
+        # 未在 asgi.py 中实现的路径经 WSGI 适配器交给 Flask
+        status, body = asyncio.run(call_asgi(asgi.app, "GET", "/api/jobs/does-not-exist"))
+        assert_equal(status, 404, "asgi flask fallback status")
+        assert_equal(json.loads(body).get("error"), "Job not found", "asgi flask fallback error")
+
+        status, body = asyncio.run(call_asgi(asgi.app, "GET", "/api/magic/stream", query=query))
+        events = re.findall(r"^event: (\w+)", body.decode("utf-8"), re.M)
+        assert_equal(status, 200, "asgi stream status")
+        assert_equal(events[-1], "card", "asgi stream ends with card")
+        assert_true(events.index("delta") > events.index("progress"), "asgi stream progress before delta")
+        assert_true("meta" in events, "asgi stream meta event")
+
+        status, body = asyncio.run(call_asgi(asgi.app, "GET", "/api/magic/stream", query=query))
+        events = re.findall(r"^event: (\w+)", body.decode("utf-8"), re.M)
+        assert_equal(events, ["meta", "card"], "asgi stream served from cache")
+    finally:
+        server.collect_youtube_text, server.fetch_youtube_metadata, server.stream_summary_with_fallback = originals
+        server._CACHE.pop(server.get_card_cache_key("https://youtu.be/smokeTest01", "YouTube"), None)
+
+    return "asgi ok"
+
+
+def run_summary_race_smoke_tests():
+    calls = []
+    cancelled = threading.Event()
+
+    def fake_streamer(provider):
+        def stream(text, platform, timeout=None, cancel_event=None, usage=None):
+            calls.append(provider)
+            yield ""
+            if provider == "slow":
+                if cancel_event.wait(2):
+                    cancelled.set()
+                return None
+            if provider == "broken":
+                raise RuntimeError("provider failed")
+            time.sleep(0.05)
+            return {"summary": provider, "highlights": []}
+
+        return stream
+
+    originals = (server.get_summary_streamer, server.get_expected_queue_delay, server.get_provider_timeout)
+    previous_hedge = os.environ.get("SUMMARY_HEDGE_MS")
+    server.get_summary_streamer = fake_streamer
+    server.get_expected_queue_delay = lambda provider, tokens=0: 0.0
+    server.get_provider_timeout = lambda provider: 2
+    os.environ["SUMMARY_HEDGE_MS"] = "100"
+    try:
+        text = "race smoke text"
+
+        # parallel：同时启动，第一个成功的胜出，其余请求被取消
+        before = server.get_summary_race_stats()
+        result = server.race_summary_providers(text, "YouTube", ["slow", "fast"], "parallel")
+        assert_equal(result, {"summary": "fast", "highlights": []}, "parallel race winner")
+        assert_true(cancelled.wait(1), "losing attempt cancelled")
+        time.sleep(0.05)
+        after = server.get_summary_race_stats()
+        assert_equal(after["discarded"].get("slow", 0) - before["discarded"].get("slow", 0), 1, "loser accounted")
+
+        # hedge：主服务商在对冲时间内返回时不启动下一个
+        calls.clear()
+        result = server.race_summary_providers(text, "YouTube", ["fast", "slow"], "hedge")
+        assert_equal((result["summary"], calls), ("fast", ["fast"]), "hedge primary wins alone")
+
+        # hedge：主服务商超时未返回时启动下一个，主服务商被取消
+        calls.clear()
+        cancelled.clear()
+        started = time.monotonic()
+        result = server.race_summary_providers(text, "YouTube", ["slow", "fast"], "hedge")
+        assert_equal((result["summary"], calls), ("fast", ["slow", "fast"]), "hedge fires after delay")
+        assert_true(time.monotonic() - started < 1, "hedge does not wait for slow primary")
+        assert_true(cancelled.wait(1), "slow primary cancelled")
+
+        # hedge：主服务商失败时立即启动下一个，不等对冲时间
+        calls.clear()
+        os.environ["SUMMARY_HEDGE_MS"] = "2000"
+        started = time.monotonic()
+        result = server.race_summary_providers(text, "YouTube", ["broken", "fast"], "hedge")
+        assert_equal((result["summary"], calls), ("fast", ["broken", "fast"]), "failed primary falls through")
+        assert_true(time.monotonic() - started < 1, "failed primary does not wait for hedge delay")
+    finally:
+        server.get_summary_streamer, server.get_expected_queue_delay, server.get_provider_timeout = originals
+        if previous_hedge is None:
+            os.environ.pop("SUMMARY_HEDGE_MS", None)
+        else:
+            os.environ["SUMMARY_HEDGE_MS"] = previous_hedge
+
+    return "summary race ok"
+
+
+def run_stream_smoke_tests():
+    client = server.app.test_client()
+
+    resp = client.get("/api/magic/stream")
+    assert_equal(resp.status_code, 400, "magic stream missing url status")
+
+    resp = client.get("/api/magic/stream?url=https://www.youtube.com/watch?v=short&platform=YouTube")
+    assert_equal(resp.status_code, 400, "magic stream invalid youtube status")
+    assert_equal(resp.get_json().get("error"), "Invalid YouTube URL", "magic stream invalid youtube error")
+
+    calls = []
+
+    def fake_streamer(provider, succeed):
+        def stream(text, platform, timeout=None, cancel_event=None, usage=None):
+            calls.append(provider)
+            yield f"{provider}-delta"
+            return {"summary": provider, "highlights": []} if succeed else None
+        return stream
+
+    env_keys = ("SUMMARY_PROVIDER_ORDER", "SUMMARY_RACE_MODE", "GEMINI_API_KEY", "OPENAI_API_KEY")
+    saved_env = {key: os.environ.get(key) for key in env_keys}
+    originals = (
+        server.stream_summary_with_gemini, server.stream_summary_with_openai,
+        server.race_summary_providers, server.load_any_cached_summary,
+    )
+    server.stream_summary_with_gemini = fake_streamer("gemini", True)
+    server.stream_summary_with_openai = fake_streamer("openai", False)
+    server.load_any_cached_summary = lambda text, platform: None
+    server.race_summary_providers = lambda text, platform, providers, mode: {"summary": f"{mode}:{providers}"}
+
+    def run(text="text " * 50):
+        stream = server.stream_summary_with_fallback(text, "YouTube")
+        items = []
+        while True:
+            try:
+                items.append(next(stream))
+            except StopIteration as stop:
+                return items, stop.value
+
+    try:
+        os.environ.update({"SUMMARY_PROVIDER_ORDER": "openai,gemini", "SUMMARY_RACE_MODE": "sequential"})
+        os.environ.update({"GEMINI_API_KEY": "key", "OPENAI_API_KEY": "key"})
+        items, (summary, used_llm) = run()
+        assert_equal(calls, ["openai", "gemini"], "stream follows SUMMARY_PROVIDER_ORDER")
+        assert_equal([item["type"] for item in items], ["delta", "reset", "delta"], "failed provider resets deltas")
+        assert_equal((summary["summary"], used_llm), ("gemini", True), "stream falls back to next provider")
+
+        calls.clear()
+        os.environ["GEMINI_API_KEY"] = ""
+        items, (summary, used_llm) = run()
+        assert_equal(calls, ["openai"], "unconfigured provider skipped")
+        assert_true(not used_llm, "extractive fallback after all providers fail")
+
+        os.environ.update({"GEMINI_API_KEY": "key", "SUMMARY_RACE_MODE": "hedge"})
+        items, (summary, used_llm) = run()
+        assert_equal(summary["summary"], "hedge:['openai', 'gemini']", "stream honours SUMMARY_RACE_MODE")
+    finally:
+        (
+            server.stream_summary_with_gemini, server.stream_summary_with_openai,
+            server.race_summary_providers, server.load_any_cached_summary,
+        ) = originals
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    return "stream ok"
+
+
+def run_micro_batch_smoke_tests():
+    request_id = contextvars.ContextVar("smoke_request_id", default=None)
+    release = threading.Event()
+    batches = []
+
+    def handler(items):
+        batches.append((list(items), request_id.get()))
+        if items == ["first"]:
+            release.wait(2)
+        if "boom" in items:
+            raise RuntimeError("handler failed")
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(handler, window_seconds=0.05, max_items=3, workers=2)
+
+    # 空闲时立即发出，不等待时间窗口
+    started = time.monotonic()
+    request_id.set("request-1")
+    first = batcher.submit("first")
+    time.sleep(0.02)
+    assert_equal(batches, [(["first"], "request-1")], "idle batcher sends at once with caller context")
+
+    # 有批次在处理中时攒批：窗口到期或攒满 max_items 时发出
+    request_id.set("request-2")
+    second = batcher.submit("a")
+    request_id.set("request-3")
+    third = batcher.submit("b")
+    assert_equal(second.result(timeout=2), "A", "windowed item result")
+    assert_equal(third.result(timeout=2), "B", "windowed item result")
+    assert_equal(batches[1], (["a", "b"], "request-2"), "batch runs in earliest submitter context")
+    release.set()
+    assert_equal(first.result(timeout=2), "FIRST", "first item result")
+    assert_true(time.monotonic() - started < 1, "batches not delayed")
+
+    release.clear()
+    blocker = batcher.submit("first")
+    full = [batcher.submit(item) for item in ("c", "d", "e")]
+    assert_equal([future.result(timeout=1) for future in full], ["C", "D", "E"], "full batch results")
+    assert_equal(batches[-1][0], ["c", "d", "e"], "max_items items sent as one batch")
+    release.set()
+    blocker.result(timeout=2)
+
+    assert_equal(batcher.submit("boom").result(timeout=2), None, "handler failure yields None")
+
+    return "micro batch ok"
+
+
+def run_twitter_session_smoke_tests():
+    class FakePool:
+        def __init__(self):
+            self.closed = []
+            self.runs = []
+
+        def close_context(self, key):
+            self.closed.append(key)
+
+        def run(self, page_fn, cookies=None, timeout=60, context_key=None):
+            self.runs.append(context_key)
+            return page_fn(None)
+
+    pool = FakePool()
+    manager = TwitterSessionManager(ttl_seconds=60, max_sessions=2, browser_pool=pool)
+    alice = {"auth_token": "a", "ct0": "csrf-a"}
+    bob = {"auth_token": "b"}
+    carol = {"auth_token": "c"}
+
+    # 同一组 cookie 复用同一个会话，CSRF 头已设置
+    http = manager.http_session(alice)
+    assert_true(manager.http_session(dict(alice)) is http, "same cookies reuse session")
+    assert_equal(http.headers.get("x-csrf-token"), "csrf-a", "csrf header set from ct0")
+    assert_equal(http.cookies.get("auth_token", domain=".x.com"), "a", "cookie set for x.com")
+    assert_equal((manager.stats["created"], manager.stats["reused"]), (1, 1), "session stats")
+
+    # 超出上限时淘汰最久未用的会话并关闭其浏览器 context
+    manager.http_session(bob)
+    manager.http_session(carol)
+    assert_equal(pool.closed, [cookie_key(alice)], "oldest session evicted with its context")
+    assert_true(manager.http_session(alice) is not http, "evicted session recreated")
+
+    # run_page 以 cookie 哈希为 context_key，无 cookie 时不复用 context
+    assert_equal(manager.run_page(lambda page: "page", carol), "page", "run_page result")
+    assert_equal(manager.run_page(lambda page: "anon", {}), "anon", "run_page without cookies")
+    assert_equal(pool.runs, [cookie_key(carol), None], "run_page context keys")
+
+    # 登录态失效时丢弃会话
+    manager.forget(carol)
+    assert_equal(pool.closed[-1], cookie_key(carol), "forget closes context")
+    try:
+        manager.http_session({})
+        raise AssertionError("empty cookies should raise")
+    except ValueError:
+        pass
+
+    # 空闲超时的会话在下次访问时淘汰
+    short = TwitterSessionManager(ttl_seconds=0.05, browser_pool=pool)
+    first = short.http_session(bob)
+    time.sleep(0.06)
+    assert_true(short.http_session(bob) is not first, "expired session recreated")
+    assert_equal(pool.closed[-1], cookie_key(bob), "expired session context closed")
+
+    return "twitter sessions ok"
+
+
+def run_browser_pool_smoke_tests():
+    class FakeContext:
+        def __init__(self):
+            self.closed = False
+
+        async def close(self):
+            self.closed = True
+
+    readings = [300, 200, 100]
+    scans = []
+
+    def fake_rss():
+        scans.append(readings[len(scans)] if len(scans) < len(readings) else 0)
+        return scans[-1]
+
+    original = browser_pool._descendant_rss_bytes
+    browser_pool._descendant_rss_bytes = fake_rss
+    try:
+        pool = browser_pool.BrowserPool(max_contexts=8, context_rss_bytes=150)
+        held = {}
+        for key in ("old", "busy", "mid", "new"):
+            held[key] = browser_pool._ContextEntry(FakeContext(), None)
+            pool._contexts[key] = held[key]
+        held["busy"].active = 1
+
+        # 每轮只测一次内存，关闭 context 后才重测；使用中的 context 不关闭
+        asyncio.run(pool._evict_contexts())
+        assert_equal(list(pool._contexts), ["busy", "new"], "idle contexts closed oldest first until under cap")
+        assert_equal(len(scans), 3, "rss measured once per pass plus once per close")
+        assert_true(held["old"].context.closed and held["mid"].context.closed, "evicted contexts closed")
+
+        # 没有空闲 context 时不扫描
+        held["new"].active = 1
+        asyncio.run(pool._evict_contexts())
+        assert_equal(len(scans), 3, "no rss scan without idle contexts")
+    finally:
+        browser_pool._descendant_rss_bytes = original
+
+    return "browser pool ok"
+
+
+def run_summary_fallback_smoke_tests():
+    text = (
+        "今天我们来聊聊大模型的推理成本。首先，推理延迟主要来自解码阶段。"
+        "其次，批处理可以显著提高吞吐量。另外，量化能够降低显存占用，但可能影响精度。"
+        "最后，缓存前缀可以减少重复计算。总之，成本优化需要系统性的方法。"
+    ) * 40
+    result = server.summarize_extractive(text)
+    assert_true(result.get("summary"), "extractive summary exists")
+    assert_true(len(result["summary"]) <= 403, "extractive summary within limit")
+    assert_equal(len(result.get("highlights", [])), 3, "extractive highlight count")
+
+    compressed = server.compress_text(text, max_chars=500)
+    assert_true(len(compressed) <= 500, "compressed text within budget")
+
+    return "summary fallback ok"
+
+
 def run_frontend_smoke_tests():
     html = (REPO_ROOT / "index.html").read_text(encoding="utf-8")
     js = (REPO_ROOT / "script.js").read_text(encoding="utf-8")
@@ -73,7 +802,23 @@ def run_frontend_smoke_tests():
 
 def main():
     results = []
+    # 以下检查不需要网络
+    results.append(run_transcript_store_smoke_tests())
+    results.append(run_summary_cache_smoke_tests())
+    results.append(run_job_queue_smoke_tests())
+    results.append(run_caption_track_smoke_tests())
+    results.append(run_audio_segment_smoke_tests())
+    results.append(run_rate_limit_smoke_tests())
+    results.append(run_batch_smoke_tests())
+    results.append(run_twitter_bulk_smoke_tests())
+    results.append(run_asgi_smoke_tests())
+    results.append(run_summary_race_smoke_tests())
+    results.append(run_stream_smoke_tests())
+    results.append(run_micro_batch_smoke_tests())
+    results.append(run_twitter_session_smoke_tests())
+    results.append(run_browser_pool_smoke_tests())
     results.append(run_backend_smoke_tests())
+    results.append(run_summary_fallback_smoke_tests())
     results.append(run_frontend_smoke_tests())
     print("PASS:", ", ".join(results))
 
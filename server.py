@@ -1,17 +1,52 @@
-import base64
+import contextvars
+import hmac
 import html
+import importlib.util
 import json
 import os
+import queue
 import re
 import tempfile
+import threading
 import time
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from urllib.parse import quote, urlparse
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from youtube_transcript_api import YouTubeTranscriptApi
 import requests
 
+from audio_chunks import AudioTooLargeError, is_ffmpeg_available, transcribe_in_segments, transcribe_stream
+from browser_pool import DEFAULT_USER_AGENT, BrowserPool
+from caption_tracks import (
+    CaptionTrackCache,
+    normalize_piped_tracks,
+    normalize_player_tracks,
+    normalize_timedtext_tracks,
+    normalize_ytdlp_tracks,
+    select_caption_track,
+)
+from extractive import compress_text, estimate_tokens, summarize_extractive
+from jobs import JobQueue, start_worker_pool
+from llm_clients import get_gemini_model, get_openai_client
+from llm_metrics import (
+    begin_request,
+    extract_usage,
+    format_labels,
+    record_llm_call,
+    render_prometheus,
+    write_request_log,
+)
+from micro_batch import MicroBatcher
+from prompts import get_prompt
+from rate_limit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimiter, RateLimitExceeded
+from summary_cache import SummaryCache, make_cache_key
+from transcript_store import TranscriptStore
+from twitter_sessions import TwitterSessionManager
+from ytdlp_context import YtDlpContext
+
 # Load environment variables from .env file if available
 try:
     from dotenv import load_dotenv
@@ -24,7 +59,9 @@ except ImportError:
 app = Flask(__name__)
 CORS(app)
 
-_CACHE = {}
+# 响应缓存：LRU，多个请求线程与批量 / 流式线程池同时读写，统一在锁内操作
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
 _CACHE_TTL = int(os.getenv("CACHE_TTL_SECONDS", "3600"))
 _CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "256"))
 
@@ -32,23 +69,142 @@ _CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "256"))
 def cache_get(key):
     if _CACHE_TTL <= 0:
         return None
-    item = _CACHE.get(key)
-    if not item:
-        return None
-    value, ts = item
-    if time.time() - ts > _CACHE_TTL:
-        _CACHE.pop(key, None)
-        return None
-    return value
+    with _CACHE_LOCK:
+        item = _CACHE.get(key)
+        if not item:
+            return None
+        value, ts = item
+        if time.time() - ts > _CACHE_TTL:
+            _CACHE.pop(key, None)
+            return None
+        _CACHE.move_to_end(key)
+        return value
 
 
 def cache_set(key, value):
     if _CACHE_TTL <= 0:
         return
-    if _CACHE_MAX_ITEMS > 0 and len(_CACHE) >= _CACHE_MAX_ITEMS:
-        oldest_key = min(_CACHE.items(), key=lambda item: item[1][1])[0]
-        _CACHE.pop(oldest_key, None)
-    _CACHE[key] = (value, time.time())
+    with _CACHE_LOCK:
+        _CACHE[key] = (value, time.time())
+        _CACHE.move_to_end(key)
+        while _CACHE_MAX_ITEMS > 0 and len(_CACHE) > _CACHE_MAX_ITEMS:
+            _CACHE.popitem(last=False)
+
+
+_TRANSCRIPT_STORE = None
+_TRANSCRIPT_STORE_LOCK = threading.Lock()
+
+
+def get_transcript_store():
+    global _TRANSCRIPT_STORE
+    max_mb = int(os.getenv("TRANSCRIPT_STORE_MAX_MB", "256"))
+    if max_mb <= 0:
+        return None
+    with _TRANSCRIPT_STORE_LOCK:
+        if _TRANSCRIPT_STORE is None:
+            root = os.getenv("TRANSCRIPT_STORE_DIR", "").strip() or os.path.join(
+                tempfile.gettempdir(), "magic-card", "transcripts"
+            )
+            try:
+                _TRANSCRIPT_STORE = TranscriptStore(root, max_mb * 1024 * 1024)
+            except OSError:
+                return None
+        return _TRANSCRIPT_STORE
+
+
+def get_transcript_language_key(source):
+    # 音频转写及其分段缓存（audio:<起点>+<时长>）与语言偏好无关
+    if source == "audio" or source.startswith("audio:"):
+        return "auto"
+    return ",".join(get_preferred_transcript_languages())
+
+
+def load_stored_transcript(video_id, sources):
+    store = get_transcript_store()
+    if not store:
+        return None, None
+    for source in sources:
+        try:
+            text = store.get(video_id, get_transcript_language_key(source), source)
+        except Exception as exc:
+            if is_debug_enabled():
+                print(f"[DEBUG] transcript store read failed: {exc}")
+            return None, None
+        if text:
+            return text, source
+    return None, None
+
+
+def save_transcript(video_id, source, text):
+    store = get_transcript_store()
+    if not store or not text:
+        return
+    try:
+        store.put(video_id, get_transcript_language_key(source), source, text)
+    except Exception as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] transcript store write failed: {exc}")
+
+
+# 提示词模板见 prompts.py；缓存版本包含固定前缀的哈希，修改提示词后旧缓存自动失效
+SUMMARY_PROMPT = get_prompt("summary")
+SUMMARY_PROMPT_NAME = SUMMARY_PROMPT.name
+SUMMARY_PROMPT_VERSION = SUMMARY_PROMPT.cache_version
+TWEET_PROMPT = get_prompt("tweet_batch")
+TWEET_PROMPT_NAME = TWEET_PROMPT.name
+TWEET_PROMPT_VERSION = TWEET_PROMPT.cache_version
+
+_SUMMARY_CACHE = None
+_SUMMARY_CACHE_LOCK = threading.Lock()
+
+
+def get_summary_cache():
+    global _SUMMARY_CACHE
+    max_mb = int(os.getenv("SUMMARY_CACHE_MAX_MB", "64"))
+    if max_mb <= 0:
+        return None
+    with _SUMMARY_CACHE_LOCK:
+        if _SUMMARY_CACHE is None:
+            path = os.getenv("SUMMARY_CACHE_PATH", "").strip() or os.path.join(
+                tempfile.gettempdir(), "magic-card", "summaries.sqlite3"
+            )
+            ttl = int(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "0"))
+            try:
+                _SUMMARY_CACHE = SummaryCache(path, max_mb * 1024 * 1024, ttl)
+            except OSError:
+                return None
+        return _SUMMARY_CACHE
+
+
+def load_cached_summary(
+    snippet, platform, provider, model, prompt_name=SUMMARY_PROMPT_NAME, prompt_version=SUMMARY_PROMPT_VERSION
+):
+    summary_cache = get_summary_cache()
+    if not summary_cache:
+        return None
+    try:
+        summary_cache.purge_stale_versions(prompt_name, prompt_version)
+        key = make_cache_key(snippet, platform, provider, model, prompt_name, prompt_version)
+        return summary_cache.get(key)
+    except Exception as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] summary cache read failed: {exc}")
+        return None
+
+
+def store_cached_summary(
+    snippet, platform, provider, model, result, prompt_name=SUMMARY_PROMPT_NAME, prompt_version=SUMMARY_PROMPT_VERSION
+):
+    summary_cache = get_summary_cache()
+    if not summary_cache or not result:
+        return
+    try:
+        key = make_cache_key(snippet, platform, provider, model, prompt_name, prompt_version)
+        summary_cache.set(key, result, provider, model, prompt_name, prompt_version)
+    except Exception as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] summary cache write failed: {exc}")
+
 
 def extract_youtube_id(url):
     pattern = r'(?:v=|\/)([0-9A-Za-z_-]{11}).*'
@@ -218,7 +374,52 @@ def extract_json_object(text, marker):
     return None
 
 
+_CAPTION_TRACKS = CaptionTrackCache(
+    max_items=int(os.getenv("CAPTION_TRACK_CACHE_ITEMS", "128")), ttl_seconds=_CACHE_TTL
+)
+
+
+def remember_caption_tracks(video_id, tracks):
+    _CAPTION_TRACKS.remember(video_id, tracks)
+
+
+def download_caption_track(video_id, track):
+    caption_url = track["url"]
+    try:
+        response = requests.get(caption_url, headers=get_youtube_headers(), timeout=10)
+        if not response.ok:
+            raise RuntimeError(f"{caption_url} -> {response.status_code}")
+        transcript = parse_caption_payload(response.text)
+        if not transcript:
+            raise RuntimeError(f"{caption_url} -> empty transcript")
+        return transcript
+    except Exception:
+        _CAPTION_TRACKS.mark_failed(video_id, caption_url)
+        raise
+
+
+def fetch_cached_caption_track(video_id, languages):
+    """其他方法已列出的轨道直接复用，不再重复发现"""
+    entry = _CAPTION_TRACKS.get(video_id)
+    if not entry:
+        return None
+    tracks, failed = entry
+    track = select_caption_track(tracks, languages, failed)
+    if not track:
+        return None
+    try:
+        return download_caption_track(video_id, track)
+    except Exception as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] cached caption track failed ({track['provider']}): {exc}")
+        return None
+
+
 def fetch_youtube_transcript_player(video_id, languages):
+    cached = fetch_cached_caption_track(video_id, languages)
+    if cached:
+        return cached
+
     headers = get_youtube_headers()
     cookies = {"CONSENT": "YES+cb.20210328-17-p0.en+FX+111"}
     watch_url = f"https://www.youtube.com/watch?v={video_id}"
@@ -241,31 +442,19 @@ def fetch_youtube_transcript_player(video_id, languages):
     if not captions:
         raise RuntimeError(f"{watch_url} -> empty captionTracks")
 
-    def pick_match():
-        for lang in languages:
-            for track in captions:
-                code = track.get("languageCode") or ""
-                if code.lower().startswith(lang.lower()):
-                    return track
-        return captions[0]
-
-    track = pick_match()
-    caption_url = track.get("baseUrl") or track.get("url")
-    if not caption_url:
+    tracks = normalize_player_tracks(captions)
+    remember_caption_tracks(video_id, tracks)
+    track = select_caption_track(tracks, languages)
+    if not track:
         raise RuntimeError(f"{watch_url} -> missing baseUrl")
-    if "fmt=" not in caption_url:
-        sep = "&" if "?" in caption_url else "?"
-        caption_url = f"{caption_url}{sep}fmt=vtt"
-    response = requests.get(caption_url, headers=headers, timeout=10)
-    if not response.ok:
-        raise RuntimeError(f"{caption_url} -> {response.status_code}")
-    transcript = parse_caption_payload(response.text)
-    if transcript:
-        return transcript
-    raise RuntimeError(f"{caption_url} -> empty transcript")
+    return download_caption_track(video_id, track)
 
 
 def fetch_youtube_transcript_timedtext(video_id, languages):
+    cached = fetch_cached_caption_track(video_id, languages)
+    if cached:
+        return cached
+
     headers = get_youtube_headers()
     bases = [
         "https://video.google.com/timedtext",
@@ -284,39 +473,13 @@ def fetch_youtube_transcript_timedtext(video_id, languages):
                 errors.append(RuntimeError(f"{list_url} -> empty response"))
                 continue
             root = ET.fromstring(response.text)
-            tracks = root.findall("track")
+            tracks = normalize_timedtext_tracks(root.findall("track"), base, video_id)
             if not tracks:
                 errors.append(RuntimeError(f"{list_url} -> empty tracks"))
                 continue
-
-            def pick_match():
-                for lang in languages:
-                    for track in tracks:
-                        code = track.get("lang_code") or ""
-                        if code.lower().startswith(lang.lower()):
-                            return track
-                return tracks[0]
-
-            track = pick_match()
-            lang_code = track.get("lang_code")
-            name = track.get("name")
-            kind = track.get("kind")
-            if not lang_code:
-                errors.append(RuntimeError(f"{list_url} -> missing lang_code"))
-                continue
-            caption_url = f"{base}?lang={quote(lang_code)}&v={video_id}&fmt=vtt"
-            if name:
-                caption_url = f"{caption_url}&name={quote(name)}"
-            if kind:
-                caption_url = f"{caption_url}&kind={quote(kind)}"
-            response = requests.get(caption_url, headers=headers, timeout=10)
-            if not response.ok:
-                errors.append(RuntimeError(f"{caption_url} -> {response.status_code}"))
-                continue
-            transcript = parse_caption_payload(response.text)
-            if transcript:
-                return transcript
-            errors.append(RuntimeError(f"{caption_url} -> empty transcript"))
+            remember_caption_tracks(video_id, tracks)
+            track = select_caption_track(tracks, languages)
+            return download_caption_track(video_id, track)
         except Exception as exc:
             errors.append(exc)
 
@@ -342,6 +505,10 @@ def fetch_youtube_transcript_timedtext(video_id, languages):
 
 
 def fetch_youtube_transcript_piped(video_id, languages):
+    cached = fetch_cached_caption_track(video_id, languages)
+    if cached:
+        return cached
+
     instances = get_piped_instances()
     last_error = None
     errors = []
@@ -363,38 +530,14 @@ def fetch_youtube_transcript_piped(video_id, languages):
                 errors.append(last_error)
                 continue
 
-            def pick_match():
-                for lang in languages:
-                    for track in captions:
-                        code = (
-                            track.get("languageCode")
-                            or track.get("language")
-                            or track.get("code")
-                            or ""
-                        )
-                        label = (track.get("label") or "").lower()
-                        if code.lower() == lang.lower() or label.startswith(lang.lower()):
-                            return track
-                return captions[0]
-
-            track = pick_match()
-            caption_url = track.get("url") or ""
-            if not caption_url:
+            tracks = normalize_piped_tracks(captions, base)
+            track = select_caption_track(tracks, languages)
+            if not track:
                 last_error = RuntimeError(f"{meta_url} -> missing url")
                 errors.append(last_error)
                 continue
-            if caption_url.startswith("/"):
-                caption_url = f"{base}{caption_url}"
-            response = requests.get(caption_url, timeout=10)
-            if not response.ok:
-                last_error = RuntimeError(f"{caption_url} -> {response.status_code}")
-                errors.append(last_error)
-                continue
-            transcript = parse_caption_text(response.text)
-            if transcript:
-                return transcript
-            last_error = RuntimeError(f"{caption_url} -> empty transcript")
-            errors.append(last_error)
+            remember_caption_tracks(video_id, tracks)
+            return download_caption_track(video_id, track)
         except Exception as exc:
             last_error = exc
             errors.append(exc)
@@ -404,6 +547,10 @@ def fetch_youtube_transcript_piped(video_id, languages):
 
 
 def fetch_youtube_transcript_lemnos(video_id, languages):
+    cached = fetch_cached_caption_track(video_id, languages)
+    if cached:
+        return cached
+
     meta_url = f"https://yt.lemnoslife.com/videos?part=captionTracks&id={video_id}"
     response = requests.get(meta_url, timeout=10)
     if not response.ok:
@@ -412,32 +559,16 @@ def fetch_youtube_transcript_lemnos(video_id, languages):
     items = data.get("items", [])
     if not items:
         raise RuntimeError(f"{meta_url} -> empty items")
-    tracks = items[0].get("captionTracks") or []
-    if not tracks:
+    captions = items[0].get("captionTracks") or []
+    if not captions:
         raise RuntimeError(f"{meta_url} -> empty captionTracks")
 
-    def pick_match():
-        for lang in languages:
-            for track in tracks:
-                code = track.get("languageCode") or ""
-                if code.lower().startswith(lang.lower()):
-                    return track
-        return tracks[0]
-
-    track = pick_match()
-    caption_url = track.get("baseUrl") or ""
-    if not caption_url:
+    tracks = normalize_player_tracks(captions, provider="lemnos")
+    remember_caption_tracks(video_id, tracks)
+    track = select_caption_track(tracks, languages)
+    if not track:
         raise RuntimeError(f"{meta_url} -> missing baseUrl")
-    if "fmt=" not in caption_url:
-        sep = "&" if "?" in caption_url else "?"
-        caption_url = f"{caption_url}{sep}fmt=vtt"
-    response = requests.get(caption_url, timeout=10)
-    if not response.ok:
-        raise RuntimeError(f"{caption_url} -> {response.status_code}")
-    transcript = parse_caption_text(response.text)
-    if transcript:
-        return transcript
-    raise RuntimeError(f"{caption_url} -> empty transcript")
+    return download_caption_track(video_id, track)
 
 
 def fetch_youtube_transcript(video_id):
@@ -510,29 +641,65 @@ def transcript_to_text(transcript_data):
     return " ".join([extract_text(item) for item in transcript_data if extract_text(item)])
 
 
-def summarize_with_openai(text, platform):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+# 固定前缀作为 system 消息放在最前面，变量内容只出现在 user 消息里
+SUMMARY_SYSTEM_PROMPT = SUMMARY_PROMPT.prefix
+
+
+def build_summary_user_prompt(platform, snippet):
+    return SUMMARY_PROMPT.render_user(platform=platform, content=snippet)
+
+
+def parse_summary_data(data):
+    if not isinstance(data, dict):
+        return None
+    summary = str(data.get("summary", "")).strip()
+    raw_highlights = data.get("highlights", [])
+    if not summary or not isinstance(raw_highlights, list):
+        return None
+
+    highlights = []
+    for item in raw_highlights:
+        if not isinstance(item, dict):
+            continue
+        label = str(item.get("label", "")).strip()
+        text_item = str(item.get("text", "")).strip()
+        if label and text_item:
+            highlights.append({"label": label, "text": text_item})
+
+    if not highlights:
         return None
 
+    return {"summary": summary, "highlights": highlights[:3]}
+
+
+def parse_summary_content(content):
+    json_text = extract_json_block(content or "")
+    if not json_text:
+        return None
     try:
-        from openai import OpenAI
+        data = json.loads(json_text)
     except Exception:
         return None
+    return parse_summary_data(data)
 
-    base_url = os.getenv("OPENAI_BASE_URL", "").strip() or None
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    max_chars = int(os.getenv("SUMMARY_INPUT_CHARS", "12000"))
-    snippet = text[:max_chars]
 
-    system_prompt = (
-        "你是内容总结助手，请用中文输出精简摘要，并给出 3 条要点。"
-        "返回 JSON 格式：{\"summary\":\"...\",\"highlights\":[{\"label\":\"...\",\"text\":\"...\"}]}"
-        "label 要简短。保留原文专有名词。"
-    )
-    user_prompt = f"平台：{platform}\n内容：{snippet}"
+def call_openai_json(system_prompt, user_prompt, parse, operation="summary", timeout=None, input_chars=0):
+    """
+    以 JSON 模式调用 OpenAI（优先 Responses API，失败回退 Chat Completions），
+    返回 parse(content) 的结果；限流、指标统计都在这里完成
+    """
+    client = get_openai_client()
+    if not client:
+        return None
 
+    model = get_openai_model_name()
+    timeout = timeout or get_provider_timeout("openai")
+    estimated_tokens = estimate_prompt_tokens(system_prompt, user_prompt)
+    if not acquire_provider_slot("openai", model, estimated_tokens):
+        observe_llm_call("openai", model, operation, time.monotonic(), input_chars, status="rate_limited")
+        return None
+
+    started = time.monotonic()
     try:
         response = client.responses.create(
             model=model,
@@ -541,9 +708,13 @@ def summarize_with_openai(text, platform):
                 {"role": "user", "content": user_prompt},
             ],
             response_format={"type": "json_object"},
+            timeout=timeout,
         )
         content = response.output_text
-    except Exception:
+    except Exception as exc:
+        if note_rate_limit_error("openai", model, exc):
+            observe_llm_call("openai", model, operation, started, input_chars, status="rate_limited")
+            return None
         try:
             response = client.chat.completions.create(
                 model=model,
@@ -552,34 +723,110 @@ def summarize_with_openai(text, platform):
                     {"role": "user", "content": user_prompt},
                 ],
                 response_format={"type": "json_object"},
+                timeout=timeout,
             )
             content = response.choices[0].message.content
-        except Exception:
+        except Exception as exc:
+            status = "rate_limited" if note_rate_limit_error("openai", model, exc) else "error"
+            observe_llm_call("openai", model, operation, started, input_chars, status=status)
             return None
 
-    try:
-        data = json.loads(content)
-    except Exception:
-        return None
+    result = parse(content)
+    observe_llm_call(
+        "openai",
+        model,
+        operation,
+        started,
+        input_chars,
+        usage=extract_usage(response),
+        status="ok" if result else "parse_error",
+        estimated_tokens=estimated_tokens,
+    )
+    return result
 
-    summary = str(data.get("summary", "")).strip()
-    raw_highlights = data.get("highlights", [])
-    if not summary or not isinstance(raw_highlights, list):
-        return None
 
-    highlights = []
-    for item in raw_highlights:
-        if not isinstance(item, dict):
-            continue
-        label = str(item.get("label", "")).strip()
-        text_item = str(item.get("text", "")).strip()
-        if label and text_item:
-            highlights.append({"label": label, "text": text_item})
+def summarize_with_openai(text, platform, timeout=None):
+    snippet = get_summary_snippet(text)
+    result = call_openai_json(
+        SUMMARY_SYSTEM_PROMPT,
+        build_summary_user_prompt(platform, snippet),
+        parse_summary_content,
+        timeout=timeout,
+        input_chars=len(snippet),
+    )
+    store_cached_summary(snippet, platform, "openai", get_openai_model_name(), result)
+    return result
 
-    if not highlights:
+
+def stream_summary_with_openai(text, platform, timeout=None, cancel_event=None, usage=None):
+    """
+    流式调用 OpenAI，逐段 yield 文本增量；生成器返回值为解析后的摘要（失败为 None）
+    cancel_event 被置位时关闭连接并放弃结果；usage 字典会写入 token 用量
+    """
+    client = get_openai_client()
+    if not client:
         return None
 
-    return {"summary": summary, "highlights": highlights[:3]}
+    model = get_openai_model_name()
+    snippet = get_summary_snippet(text)
+    usage = {} if usage is None else usage
+    parts = []
+    options = {}
+    if os.getenv("OPENAI_STREAM_USAGE", "1").lower() in ("1", "true", "yes"):
+        options["stream_options"] = {"include_usage": True}
+    estimated_tokens = estimate_summary_tokens(snippet)
+    if not acquire_provider_slot("openai", model, estimated_tokens, cancel_event):
+        status = "cancelled" if cancel_event is not None and cancel_event.is_set() else "rate_limited"
+        observe_llm_call("openai", model, "summary_stream", time.monotonic(), len(snippet), status=status)
+        return None
+    started = time.monotonic()
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": build_summary_user_prompt(platform, snippet)},
+            ],
+            response_format={"type": "json_object"},
+            stream=True,
+            timeout=timeout or get_provider_timeout("openai"),
+            **options,
+        )
+        for chunk in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                stream.close()
+                break
+            if getattr(chunk, "usage", None):
+                usage.update(extract_usage(chunk))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as exc:
+        status = "rate_limited" if note_rate_limit_error("openai", model, exc) else "error"
+        observe_llm_call("openai", model, "summary_stream", started, len(snippet), usage, status)
+        return None
+    finally:
+        usage.setdefault("streamed_text", "".join(parts))
+
+    if cancel_event is not None and cancel_event.is_set():
+        observe_llm_call("openai", model, "summary_stream", started, len(snippet), usage, "cancelled")
+        return None
+    result = parse_summary_content("".join(parts))
+    observe_llm_call(
+        "openai",
+        model,
+        "summary_stream",
+        started,
+        len(snippet),
+        usage,
+        "ok" if result else "parse_error",
+        estimated_tokens,
+    )
+    store_cached_summary(snippet, platform, "openai", model, result)
+    return result
 
 
 def extract_json_block(text):
@@ -670,264 +917,930 @@ def classify_youtube_error(*errors):
     return "UNKNOWN"
 
 
-def summarize_with_gemini(text, platform):
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
+def call_gemini_json(system_prompt, user_prompt, parse, operation="summary", timeout=None, input_chars=0):
+    """Gemini 版 call_openai_json，返回 parse(content) 的结果"""
+    model_name = get_gemini_model_name()
+    model = get_gemini_model(model_name)
+    if not model:
+        return None
+
+    prompt = f"{system_prompt}\n{user_prompt}"
+    request_options = {"timeout": timeout or get_provider_timeout("gemini")}
+    estimated_tokens = estimate_prompt_tokens(system_prompt, user_prompt)
+    if not acquire_provider_slot("gemini", model_name, estimated_tokens):
+        observe_llm_call("gemini", model_name, operation, time.monotonic(), input_chars, status="rate_limited")
         return None
 
+    started = time.monotonic()
     try:
-        import google.generativeai as genai
-    except Exception:
+        response = model.generate_content(prompt, request_options=request_options)
+        content = response.text or ""
+    except Exception as exc:
+        status = "rate_limited" if note_rate_limit_error("gemini", model_name, exc) else "error"
+        observe_llm_call("gemini", model_name, operation, started, input_chars, status=status)
         return None
 
-    genai.configure(api_key=api_key)
-    model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    model = genai.GenerativeModel(model_name)
-    max_chars = int(os.getenv("SUMMARY_INPUT_CHARS", "12000"))
-    snippet = text[:max_chars]
+    result = parse(content)
+    observe_llm_call(
+        "gemini",
+        model_name,
+        operation,
+        started,
+        input_chars,
+        usage=extract_usage(response),
+        status="ok" if result else "parse_error",
+        estimated_tokens=estimated_tokens,
+    )
+    return result
+
 
-    prompt = (
-        "你是内容总结助手，请用中文输出精简摘要，并给出 3 条要点。"
-        "返回 JSON 格式：{\"summary\":\"...\",\"highlights\":[{\"label\":\"...\",\"text\":\"...\"}]}"
-        "label 要简短。保留原文专有名词。"
-        f"\n平台：{platform}\n内容：{snippet}"
+def summarize_with_gemini(text, platform, timeout=None):
+    snippet = get_summary_snippet(text)
+    result = call_gemini_json(
+        SUMMARY_SYSTEM_PROMPT,
+        build_summary_user_prompt(platform, snippet),
+        parse_summary_content,
+        timeout=timeout,
+        input_chars=len(snippet),
     )
+    store_cached_summary(snippet, platform, "gemini", get_gemini_model_name(), result)
+    return result
 
-    try:
-        response = model.generate_content(prompt)
-        content = response.text or ""
-    except Exception:
-        return None
 
-    json_text = extract_json_block(content)
-    if not json_text:
+def stream_summary_with_gemini(text, platform, timeout=None, cancel_event=None, usage=None):
+    """
+    流式调用 Gemini，逐段 yield 文本增量；生成器返回值为解析后的摘要（失败为 None）
+    cancel_event 被置位时停止读取并放弃结果；usage 字典会写入 token 用量
+    """
+    model_name = get_gemini_model_name()
+    model = get_gemini_model(model_name)
+    if not model:
         return None
 
+    snippet = get_summary_snippet(text)
+    prompt = f"{SUMMARY_SYSTEM_PROMPT}\n{build_summary_user_prompt(platform, snippet)}"
+    request_options = {"timeout": timeout or get_provider_timeout("gemini")}
+    usage = {} if usage is None else usage
+    estimated_tokens = estimate_summary_tokens(snippet)
+    if not acquire_provider_slot("gemini", model_name, estimated_tokens, cancel_event):
+        status = "cancelled" if cancel_event is not None and cancel_event.is_set() else "rate_limited"
+        observe_llm_call("gemini", model_name, "summary_stream", time.monotonic(), len(snippet), status=status)
+        return None
+    started = time.monotonic()
+    parts = []
     try:
-        data = json.loads(json_text)
-    except Exception:
+        for chunk in model.generate_content(prompt, stream=True, request_options=request_options):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if getattr(chunk, "usage_metadata", None):
+                usage.update(extract_usage(chunk))
+            delta = getattr(chunk, "text", "") or ""
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as exc:
+        status = "rate_limited" if note_rate_limit_error("gemini", model_name, exc) else "error"
+        observe_llm_call("gemini", model_name, "summary_stream", started, len(snippet), usage, status)
         return None
+    finally:
+        usage.setdefault("streamed_text", "".join(parts))
 
-    summary = str(data.get("summary", "")).strip()
-    raw_highlights = data.get("highlights", [])
-    if not summary or not isinstance(raw_highlights, list):
+    if cancel_event is not None and cancel_event.is_set():
+        observe_llm_call("gemini", model_name, "summary_stream", started, len(snippet), usage, "cancelled")
         return None
+    result = parse_summary_content("".join(parts))
+    observe_llm_call(
+        "gemini",
+        model_name,
+        "summary_stream",
+        started,
+        len(snippet),
+        usage,
+        "ok" if result else "parse_error",
+        estimated_tokens,
+    )
+    store_cached_summary(snippet, platform, "gemini", model_name, result)
+    return result
 
-    highlights = []
-    for item in raw_highlights:
-        if not isinstance(item, dict):
-            continue
-        label = str(item.get("label", "")).strip()
-        text_item = str(item.get("text", "")).strip()
-        if label and text_item:
-            highlights.append({"label": label, "text": text_item})
 
-    if not highlights:
-        return None
+def is_extractive_compression_enabled():
+    return os.getenv("ENABLE_EXTRACTIVE_COMPRESSION", "1").lower() in ("1", "true", "yes")
 
-    return {"summary": summary, "highlights": highlights[:3]}
 
+def prepare_summary_input(text):
+    if not is_extractive_compression_enabled():
+        return text
+    max_chars = int(os.getenv("SUMMARY_INPUT_CHARS", "12000"))
+    max_tokens = int(os.getenv("SUMMARY_INPUT_TOKENS", "0")) or None
+    return compress_text(text, max_chars=max_chars, max_tokens=max_tokens)
 
-def build_summary_with_fallback(text, platform):
-    llm_summary = summarize_with_gemini(text, platform) or summarize_with_openai(text, platform)
-    if llm_summary:
-        return llm_summary, True
-    cleaned = text.strip()
-    if len(cleaned) > 400:
-        cleaned = cleaned[:400].rstrip() + "..."
-    return {"summary": cleaned, "highlights": []}, False
 
+def get_summary_snippet(text):
+    max_chars = int(os.getenv("SUMMARY_INPUT_CHARS", "12000"))
+    return text[:max_chars]
 
-def build_youtube_summary(text):
-    summary, _ = build_summary_with_fallback(text, "YouTube")
-    return summary
 
+def get_openai_model_name():
+    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-def build_twitter_summary(text):
-    summary = text.strip()
-    return {"summary": summary, "highlights": []}
 
+def get_gemini_model_name():
+    return os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
-def is_audio_transcription_enabled():
-    return os.getenv("ENABLE_AUDIO_TRANSCRIPT", "").lower() in ("1", "true", "yes")
 
+def load_any_cached_summary(
+    text, platform, prompt_name=SUMMARY_PROMPT_NAME, prompt_version=SUMMARY_PROMPT_VERSION, snippet=None
+):
+    snippet = get_summary_snippet(text) if snippet is None else snippet
+    providers = []
+    if os.getenv("GEMINI_API_KEY"):
+        providers.append(("gemini", get_gemini_model_name()))
+    if os.getenv("OPENAI_API_KEY"):
+        providers.append(("openai", get_openai_model_name()))
+    for provider, model in providers:
+        cached = load_cached_summary(snippet, platform, provider, model, prompt_name, prompt_version)
+        if cached:
+            return cached
+    return None
 
-def is_subtitle_dlp_enabled():
-    return os.getenv("ENABLE_SUBTITLE_DLP", "1").lower() in ("1", "true", "yes")
 
+def get_provider_timeout(provider):
+    return float(os.getenv(f"{provider.upper()}_TIMEOUT_SECONDS", "30"))
 
-def transcribe_audio_with_openai(file_path):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("未配置 OPENAI_API_KEY，无法进行音频转写。")
-    try:
-        from openai import OpenAI
-    except Exception:
-        raise RuntimeError("OpenAI SDK 未安装，无法进行音频转写。")
-    base_url = os.getenv("OPENAI_BASE_URL", "").strip() or None
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    model = os.getenv("WHISPER_MODEL", "whisper-1")
-    with open(file_path, "rb") as audio_file:
-        result = client.audio.transcriptions.create(
-            model=model,
-            file=audio_file,
-            response_format="text",
-        )
-    if isinstance(result, str):
-        return result
-    return getattr(result, "text", "") or ""
 
+_RATE_LIMITER = None
+_RATE_LIMITER_LOCK = threading.Lock()
+# 当前调用链在本地限流队列中的优先级；后台任务（/api/jobs、/api/batch、离线批量、分段转写）用 PRIORITY_BACKGROUND
+_LLM_PRIORITY = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
 
-def transcribe_youtube_audio(video_url):
+
+def run_with_background_priority(func, *args, **kwargs):
+    """执行 func，期间发出的 LLM / Whisper 请求在限流队列中排在交互请求之后"""
+    token = _LLM_PRIORITY.set(PRIORITY_BACKGROUND)
     try:
-        from yt_dlp import YoutubeDL
-    except Exception:
-        raise RuntimeError("yt-dlp 未安装，无法下载视频音频。")
+        return func(*args, **kwargs)
+    finally:
+        _LLM_PRIORITY.reset(token)
 
-    max_mb = os.getenv("YOUTUBE_AUDIO_MAX_MB")
-    max_bytes = None
-    if max_mb and max_mb.isdigit():
-        max_bytes = int(max_mb) * 1024 * 1024
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        output_template = os.path.join(tmp_dir, "%(id)s.%(ext)s")
-        ydl_opts = {
-            "format": "bestaudio[ext=m4a]/bestaudio",
-            "outtmpl": output_template,
-            "noplaylist": True,
-            "quiet": True,
-            "no_warnings": True,
-            "socket_timeout": 10,
-        }
-        if max_bytes:
-            ydl_opts["max_filesize"] = max_bytes
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=True)
-            file_path = ydl.prepare_filename(info)
-            if not os.path.exists(file_path):
-                file_path = os.path.join(
-                    tmp_dir, f"{info.get('id', 'audio')}.{info.get('ext', 'm4a')}"
+def get_rate_limiter():
+    global _RATE_LIMITER
+    with _RATE_LIMITER_LOCK:
+        if _RATE_LIMITER is None:
+            path = os.getenv("RATE_LIMIT_DB_PATH", "").strip() or os.path.join(
+                tempfile.gettempdir(), "magic-card", "ratelimit.sqlite3"
+            )
+            try:
+                _RATE_LIMITER = RateLimiter(
+                    path,
+                    max_queue=int(os.getenv("RATE_LIMIT_QUEUE_SIZE", "64")),
+                    max_wait_seconds=float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "20")),
                 )
-        if not os.path.exists(file_path):
-            raise RuntimeError("下载音频失败，未找到输出文件。")
-        transcript = transcribe_audio_with_openai(file_path)
-        if not transcript.strip():
-            raise RuntimeError("音频转写结果为空。")
-        return transcript
+            except OSError:
+                return None
+        return _RATE_LIMITER
 
 
-def fetch_youtube_subtitles_ytdlp(video_url):
-    try:
-        from yt_dlp import YoutubeDL
-    except Exception:
-        raise RuntimeError("yt-dlp 未安装，无法下载字幕。")
+def get_provider_model_name(provider):
+    return get_gemini_model_name() if provider == "gemini" else get_openai_model_name()
 
-    languages = get_preferred_transcript_languages()
-    clients = [c.strip() for c in os.getenv("YOUTUBE_DLP_CLIENTS", "").split(",") if c.strip()]
-    proxy = os.getenv("YOUTUBE_PROXY", "").strip()
-    cookies_b64 = os.getenv("YOUTUBE_COOKIES_B64", "").strip()
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        cookie_path = None
-        if cookies_b64:
-            try:
-                cookie_path = os.path.join(tmp_dir, "cookies.txt")
-                with open(cookie_path, "wb") as cookie_file:
-                    cookie_file.write(base64.b64decode(cookies_b64))
-            except Exception as exc:
-                raise RuntimeError(f"cookie decode failed: {exc}")
-
-        ydl_opts = {
-            "skip_download": True,
-            "quiet": True,
-            "no_warnings": True,
-            "writesubtitles": True,
-            "writeautomaticsub": True,
-            "subtitlesformat": "vtt",
-            "outtmpl": os.path.join(tmp_dir, "%(id)s.%(ext)s"),
-            "socket_timeout": 10,
-        }
-        if clients:
-            ydl_opts["extractor_args"] = {"youtube": {"player_client": clients}}
-        if proxy:
-            ydl_opts["proxy"] = proxy
-        if cookie_path:
-            ydl_opts["cookiefile"] = cookie_path
-
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.extract_info(video_url, download=True)
-
-        vtt_files = [f for f in os.listdir(tmp_dir) if f.endswith(".vtt")]
-        if not vtt_files:
-            raise RuntimeError("yt-dlp 未生成字幕文件。")
-
-        def pick_best(files):
-            for lang in languages:
-                for name in files:
-                    if f".{lang}." in name or name.endswith(f".{lang}.vtt"):
-                        return name
-            return files[0]
-
-        chosen = pick_best(vtt_files)
-        with open(os.path.join(tmp_dir, chosen), "r", encoding="utf-8", errors="ignore") as f:
-            raw_text = f.read()
-        transcript = parse_caption_payload(raw_text)
-        if not transcript:
-            raise RuntimeError("yt-dlp 字幕解析为空。")
-        return transcript
+def estimate_prompt_tokens(system_prompt, user_prompt):
+    """预估一次调用消耗的 token（提示词 + 预留的输出）"""
+    output_tokens = int(os.getenv("SUMMARY_OUTPUT_TOKENS_ESTIMATE", "600"))
+    return estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + output_tokens
 
 
-def fetch_twitter_via_fixtweet(tweet_id):
+def estimate_summary_tokens(snippet):
+    return estimate_prompt_tokens(SUMMARY_SYSTEM_PROMPT, snippet)
+
+
+def acquire_provider_slot(provider, model, tokens=0, cancel_event=None):
     """
-    使用 FixTweet API 获取推文内容（免费、稳定、无需API Key）
-    https://github.com/FixTweet/FixTweet/wiki/API
+    在本地令牌桶中排队等待额度；排队超限或 cancel_event 被置位时返回 False（调用方直接降级），
+    限流存储本身出错时放行
     """
-    url = f"https://api.fxtwitter.com/status/{tweet_id}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"
-    }
-    
+    limiter = get_rate_limiter()
+    if not limiter:
+        return True
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.ok:
-            data = response.json()
-            
-            # 检查响应格式
-            if data.get("code") == 200 and "tweet" in data:
-                tweet = data["tweet"]
-                text = tweet.get("text", "")
-                
-                if text:
-                    author = tweet.get("author", {})
-                    display_name = author.get("name", "User")
-                    screen_name = author.get("screen_name", "")
-                    title = f"{display_name} @{screen_name}".strip()
-                    return title, text, "fixtweet"
+        waited = limiter.acquire(
+            provider, model, tokens, priority=_LLM_PRIORITY.get(), cancel_event=cancel_event
+        )
+    except RateLimitExceeded as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] rate limit: {exc}")
+        return False
+    except Exception as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] rate limiter unavailable: {exc}")
+        return True
+    if waited and is_debug_enabled():
+        print(f"[DEBUG] rate limit: waited {waited:.2f}s for {provider}:{model}")
+    return True
+
+
+def get_expected_queue_delay(provider, tokens=0):
+    limiter = get_rate_limiter()
+    if not limiter:
+        return 0.0
+    try:
+        return limiter.expected_delay(provider, get_provider_model_name(provider), tokens)
     except Exception:
+        return 0.0
+
+
+def is_rate_limit_error(exc):
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return status == 429 or type(exc).__name__ in ("RateLimitError", "ResourceExhausted")
+
+
+def note_rate_limit_error(provider, model, exc):
+    """服务商返回 429：按 Retry-After（缺省 RATE_LIMIT_BACKOFF_SECONDS）暂停本机该桶"""
+    if not is_rate_limit_error(exc):
+        return False
+    backoff = float(os.getenv("RATE_LIMIT_BACKOFF_SECONDS", "10"))
+    response = getattr(exc, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        backoff = float(retry_after) if retry_after else backoff
+    except (TypeError, ValueError):
         pass
-    
-    raise RuntimeError("fixtweet-failed")
+    limiter = get_rate_limiter()
+    if limiter:
+        try:
+            limiter.penalize(provider, model, backoff)
+        except Exception:
+            pass
+    return True
 
 
-def fetch_twitter_text(url, cookie_map=None):
+def observe_llm_call(provider, model, operation, started, input_chars, usage=None, status="ok", estimated_tokens=0):
+    """记录调用指标，并按服务商返回的真实 token 数修正限流令牌桶"""
+    usage = usage or {}
+    record_llm_call(provider, model, operation, time.monotonic() - started, status, input_chars, usage)
+    actual_tokens = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+    limiter = get_rate_limiter()
+    if limiter and estimated_tokens and actual_tokens:
+        try:
+            limiter.record_usage(provider, model, estimated_tokens, actual_tokens)
+        except Exception:
+            pass
+
+
+def get_summary_providers():
+    """按 SUMMARY_PROVIDER_ORDER 返回已配置 Key 的服务商，第一个为主服务商"""
+    order = os.getenv("SUMMARY_PROVIDER_ORDER", "gemini,openai")
+    providers = []
+    for name in [p.strip().lower() for p in order.split(",") if p.strip()]:
+        if name == "gemini" and os.getenv("GEMINI_API_KEY"):
+            providers.append(name)
+        elif name == "openai" and os.getenv("OPENAI_API_KEY"):
+            providers.append(name)
+    return providers
+
+
+def get_summary_race_mode():
+    mode = os.getenv("SUMMARY_RACE_MODE", "sequential").strip().lower()
+    return mode if mode in ("sequential", "hedge", "parallel") else "sequential"
+
+
+def get_summary_streamer(provider):
+    return stream_summary_with_gemini if provider == "gemini" else stream_summary_with_openai
+
+
+def get_summary_function(provider):
+    return summarize_with_gemini if provider == "gemini" else summarize_with_openai
+
+
+_LLM_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_RACE_WORKERS", "8")), thread_name_prefix="llm-race"
+)
+_RACE_STATS_LOCK = threading.Lock()
+_RACE_STATS = {
+    "races": 0,
+    "hedges_fired": 0,
+    "wins": {},
+    "discarded": {},
+    "wasted_prompt_tokens": 0,
+    "wasted_completion_tokens": 0,
+}
+
+
+def get_summary_race_stats():
+    with _RACE_STATS_LOCK:
+        return json.loads(json.dumps(_RACE_STATS))
+
+
+def _bump_race_stat(key, provider=None):
+    with _RACE_STATS_LOCK:
+        if provider:
+            _RACE_STATS[key][provider] = _RACE_STATS[key].get(provider, 0) + 1
+        else:
+            _RACE_STATS[key] += 1
+
+
+def _account_discarded_attempt(provider, text, usage):
+    # 被取消的请求拿不到服务商的用量统计时按字符估算
+    prompt_tokens = usage.get("prompt_tokens") or estimate_tokens(get_summary_snippet(text))
+    completion_tokens = usage.get("completion_tokens") or estimate_tokens(usage.get("streamed_text", ""))
+    with _RACE_STATS_LOCK:
+        _RACE_STATS["discarded"][provider] = _RACE_STATS["discarded"].get(provider, 0) + 1
+        _RACE_STATS["wasted_prompt_tokens"] += prompt_tokens
+        _RACE_STATS["wasted_completion_tokens"] += completion_tokens
+
+
+def _run_summary_attempt(provider, text, platform, cancel_event, usage):
+    stream = get_summary_streamer(provider)(
+        text,
+        platform,
+        timeout=get_provider_timeout(provider),
+        cancel_event=cancel_event,
+        usage=usage,
+    )
+    while True:
+        try:
+            next(stream)
+        except StopIteration as stop:
+            return stop.value
+
+
+def race_summary_providers(text, platform, providers, mode):
     """
-    多级降级策略抓取推文：
-    1. FixTweet API（最优先，免费稳定）
-    2. Syndication API（不稳定，作为降级）
-    3. snscrape（需额外安装）
-    4. Playwright（最后兜底，需浏览器内核）
+    hedge：先调用主服务商，SUMMARY_HEDGE_MS 内没有结果（或已失败）再启动下一个；
+    parallel：同时调用全部服务商。
+    第一个解析成功的 JSON 胜出，其余请求通过 cancel_event 关闭连接，浪费的 token 计入统计
     """
-    tweet_id = extract_twitter_id(url)
-    if not tweet_id:
-        raise RuntimeError("invalid-twitter-url")
+    hedge_seconds = float(os.getenv("SUMMARY_HEDGE_MS", "3000")) / 1000
+    tokens = estimate_summary_tokens(get_summary_snippet(text))
+    # 本地限流的预计排队时间计入截止时间
+    queue_delays = {p: get_expected_queue_delay(p, tokens) for p in providers}
+    deadline = time.monotonic() + hedge_seconds * len(providers) + max(
+        get_provider_timeout(p) + queue_delays[p] for p in providers
+    )
+    attempts = {}
+    pending = list(providers)
+    running = set()
+
+    def launch(provider):
+        cancel_event = threading.Event()
+        usage = {}
+        future = _LLM_EXECUTOR.submit(
+            contextvars.copy_context().run, _run_summary_attempt, provider, text, platform, cancel_event, usage
+        )
+        attempts[future] = (provider, cancel_event, usage)
+        running.add(future)
+
+    _bump_race_stat("races")
+    launch(pending.pop(0))
+    while mode == "parallel" and pending:
+        launch(pending.pop(0))
+    if pending and queue_delays[providers[0]] > hedge_seconds:
+        # 主服务商预计排队就超过对冲时间：不必等待，立即启动下一个
+        _bump_race_stat("hedges_fired")
+        launch(pending.pop(0))
+
+    winner = None
+    while running:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        wait_for = min(hedge_seconds, remaining) if pending else remaining
+        finished, still_running = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+        running.clear()
+        running.update(still_running)
+        for future in finished:
+            provider, _, usage = attempts[future]
+            try:
+                result = future.result()
+            except Exception:
+                result = None
+            if result and not winner:
+                winner = result
+                _bump_race_stat("wins", provider)
+            elif result:
+                _account_discarded_attempt(provider, text, usage)
+        if winner or deadline <= time.monotonic():
+            break
+        if pending:
+            # 超过对冲时间仍未返回（或已有请求失败）：启动下一个服务商
+            if running:
+                _bump_race_stat("hedges_fired")
+            launch(pending.pop(0))
+
+    for future in running:
+        provider, cancel_event, usage = attempts[future]
+        cancel_event.set()
+        future.add_done_callback(lambda _, p=provider, u=usage: _account_discarded_attempt(p, text, u))
+    return winner
+
+
+def summarize_with_providers(text, platform):
+    providers = get_summary_providers()
+    if not providers:
+        return None
+    mode = get_summary_race_mode()
+    if mode == "sequential" or len(providers) == 1:
+        for provider in providers:
+            result = get_summary_function(provider)(text, platform, timeout=get_provider_timeout(provider))
+            if result:
+                return result
+        return None
+    return race_summary_providers(text, platform, providers, mode)
+
+
+def build_summary_with_fallback(text, platform):
+    llm_input = prepare_summary_input(text)
+    llm_summary = load_any_cached_summary(llm_input, platform) or summarize_with_providers(llm_input, platform)
+    if llm_summary:
+        return llm_summary, True
+    return summarize_extractive(text), False
+
+
+def stream_summary_with_fallback(text, platform):
+    """
+    流式版 build_summary_with_fallback，服务商顺序与竞速模式同 summarize_with_providers：
+    sequential（或只有一个服务商）时按顺序逐个调用并 yield {"type": "delta", "text": ...}，
+    某个服务商中途失败时 yield {"type": "reset"}；hedge / parallel 时多个服务商同时输出，
+    不推送增量文本，只返回胜出的结果
+    生成器返回 (summary_data, used_llm)
+    """
+    llm_input = prepare_summary_input(text)
+    cached = load_any_cached_summary(llm_input, platform)
+    if cached:
+        return cached, True
+
+    providers = get_summary_providers()
+    if len(providers) > 1 and get_summary_race_mode() != "sequential":
+        result = race_summary_providers(llm_input, platform, providers, get_summary_race_mode())
+        return (result, True) if result else (summarize_extractive(text), False)
+
+    for provider in providers:
+        stream = get_summary_streamer(provider)(llm_input, platform, timeout=get_provider_timeout(provider))
+        streamed = False
+        while True:
+            try:
+                delta = next(stream)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            streamed = True
+            yield {"type": "delta", "text": delta}
+        if result:
+            return result, True
+        if streamed:
+            yield {"type": "reset"}
+
+    return summarize_extractive(text), False
 
-    # 1. 优先：FixTweet API（推荐方案）
+
+def build_youtube_summary(text):
+    summary, _ = build_summary_with_fallback(text, "YouTube")
+    return summary
+
+
+TWEET_BATCH_SYSTEM_PROMPT = TWEET_PROMPT.prefix
+
+
+def is_twitter_llm_enabled():
+    return os.getenv("ENABLE_TWITTER_LLM", "1").lower() in ("1", "true", "yes")
+
+
+def get_tweet_snippet(text):
+    return text.strip()[: int(os.getenv("TWEET_INPUT_CHARS", "2000"))]
+
+
+def build_tweet_batch_user_prompt(items):
+    payload = json.dumps([{"id": item_id, "text": text} for item_id, text in items], ensure_ascii=False)
+    return TWEET_PROMPT.render_user(items=payload)
+
+
+def parse_tweet_batch_content(content):
+    """解析多条推文的批量输出，返回 {id: summary_data}；没有任何可用条目时返回 None"""
+    json_text = extract_json_block(content or "")
+    if not json_text:
+        return None
     try:
-        return fetch_twitter_via_fixtweet(tweet_id)
+        data = json.loads(json_text)
+    except Exception:
+        return None
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return None
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        summary_data = parse_summary_data(item)
+        if summary_data:
+            results[str(item.get("id", ""))] = summary_data
+    return results or None
+
+
+def summarize_tweet_batch(texts):
+    """
+    MicroBatcher 的处理函数：把一批推文放进同一个请求，
+    按 id 拆分结果；某个服务商漏掉的条目交给下一个服务商，仍失败的返回 None
+    """
+    results = [None] * len(texts)
+    pending = list(range(len(texts)))
+    for provider in get_summary_providers():
+        if not pending:
+            break
+        items = [(f"t{i}", texts[i]) for i in pending]
+        call = call_gemini_json if provider == "gemini" else call_openai_json
+        parsed = call(
+            TWEET_BATCH_SYSTEM_PROMPT,
+            build_tweet_batch_user_prompt(items),
+            parse_tweet_batch_content,
+            operation="tweet_batch",
+            timeout=get_provider_timeout(provider),
+            input_chars=sum(len(text) for _, text in items),
+        ) or {}
+        model = get_provider_model_name(provider)
+        for i in pending:
+            summary_data = parsed.get(f"t{i}")
+            if summary_data:
+                results[i] = summary_data
+                store_cached_summary(
+                    texts[i], "Twitter", provider, model, summary_data, TWEET_PROMPT_NAME, TWEET_PROMPT_VERSION
+                )
+        pending = [i for i in pending if results[i] is None]
+    return results
+
+
+_TWEET_BATCHER = None
+_TWEET_BATCHER_LOCK = threading.Lock()
+
+
+def get_tweet_batcher():
+    global _TWEET_BATCHER
+    with _TWEET_BATCHER_LOCK:
+        if _TWEET_BATCHER is None:
+            _TWEET_BATCHER = MicroBatcher(
+                summarize_tweet_batch,
+                window_seconds=float(os.getenv("TWEET_BATCH_WINDOW_MS", "50")) / 1000,
+                max_items=int(os.getenv("TWEET_BATCH_MAX_ITEMS", "20")),
+                workers=int(os.getenv("TWEET_BATCH_WORKERS", "4")),
+                name="tweet-batch",
+            )
+        return _TWEET_BATCHER
+
+
+def build_twitter_summary(text):
+    """
+    推文摘要：同一时间窗口内的推文合并成一次 LLM 请求；
+    未配置 LLM、推文太短或该条失败时保持原文作为摘要
+    """
+    summary = text.strip()
+    fallback = {"summary": summary, "highlights": []}
+    min_chars = int(os.getenv("TWEET_LLM_MIN_CHARS", "40"))
+    if not is_twitter_llm_enabled() or len(summary) < min_chars or not get_summary_providers():
+        return fallback
+
+    snippet = get_tweet_snippet(summary)
+    cached = load_any_cached_summary(
+        snippet, "Twitter", TWEET_PROMPT_NAME, TWEET_PROMPT_VERSION, snippet=snippet
+    )
+    if cached:
+        return cached
+    wait_seconds = get_tweet_batcher().window_seconds + max(
+        get_provider_timeout(p) for p in get_summary_providers()
+    ) * len(get_summary_providers())
+    try:
+        result = get_tweet_batcher().submit(snippet).result(timeout=wait_seconds)
+    except Exception:
+        result = None
+    return result or fallback
+
+
+def is_audio_transcription_enabled():
+    return os.getenv("ENABLE_AUDIO_TRANSCRIPT", "").lower() in ("1", "true", "yes")
+
+
+def is_subtitle_dlp_enabled():
+    return os.getenv("ENABLE_SUBTITLE_DLP", "1").lower() in ("1", "true", "yes")
+
+
+def transcribe_audio_with_openai(file_path):
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("未配置 OPENAI_API_KEY，无法进行音频转写。")
+    client = get_openai_client()
+    if not client:
+        raise RuntimeError("OpenAI SDK 未安装，无法进行音频转写。")
+    model = os.getenv("WHISPER_MODEL", "whisper-1")
+    if not acquire_provider_slot("openai", model):
+        observe_llm_call("openai", model, "transcription", time.monotonic(), 0, status="rate_limited")
+        raise RuntimeError("Whisper 转写排队超时（本地限流），请稍后重试。")
+    started = time.monotonic()
+    try:
+        with open(file_path, "rb") as audio_file:
+            # 共享客户端的默认超时按对话请求设置，上传与转写整段音频需要更长的超时
+            result = client.audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+                response_format="text",
+                timeout=float(os.getenv("WHISPER_TIMEOUT_SECONDS", "600")),
+            )
+    except Exception as exc:
+        if note_rate_limit_error("openai", model, exc):
+            observe_llm_call("openai", model, "transcription", started, 0, status="rate_limited")
+            raise RuntimeError("Whisper 转写被服务商限流，请稍后重试。") from exc
+        observe_llm_call("openai", model, "transcription", started, 0, status="error")
+        raise
+    observe_llm_call("openai", model, "transcription", started, 0)
+    if isinstance(result, str):
+        return result
+    return getattr(result, "text", "") or ""
+
+
+_AUDIO_EXECUTOR = None
+_AUDIO_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_audio_executor():
+    """所有视频共享的分段转写线程池，限制同时进行的 Whisper 请求数"""
+    global _AUDIO_EXECUTOR
+    with _AUDIO_EXECUTOR_LOCK:
+        if _AUDIO_EXECUTOR is None:
+            _AUDIO_EXECUTOR = ThreadPoolExecutor(
+                max_workers=max(1, int(os.getenv("AUDIO_TRANSCRIBE_WORKERS", "4"))),
+                thread_name_prefix="audio-segment",
+            )
+        return _AUDIO_EXECUTOR
+
+
+def get_audio_segment_options(video_id, on_progress):
+    """分段转写的公共参数：片段时长、重叠、按片段读写字幕存储的回调与进度上报"""
+    segment_seconds = float(os.getenv("AUDIO_SEGMENT_SECONDS", "600"))
+    overlap_seconds = float(os.getenv("AUDIO_SEGMENT_OVERLAP_SECONDS", "5"))
+    config = f"{segment_seconds:g}/{overlap_seconds:g}"
+
+    def load_cached(key):
+        text, _ = load_stored_transcript(video_id, [f"audio:{config}:{key}"])
+        return text
+
+    def save_cached(key, text):
+        save_transcript(video_id, f"audio:{config}:{key}", text)
+
+    def report(done, total):
+        if on_progress:
+            on_progress(done, total)
+        if is_debug_enabled():
+            print(f"[DEBUG] audio segments {done}/{total or '?'} ({video_id})")
+
+    return {
+        "segment_seconds": segment_seconds,
+        "overlap_seconds": overlap_seconds,
+        "load_cached": load_cached if video_id else None,
+        "save_cached": save_cached if video_id else None,
+        "on_progress": report,
+    }
+
+
+def get_audio_max_bytes():
+    max_mb = os.getenv("YOUTUBE_AUDIO_MAX_MB")
+    if max_mb and max_mb.isdigit():
+        return int(max_mb) * 1024 * 1024
+    return None
+
+
+def is_audio_streaming_enabled():
+    return os.getenv("AUDIO_STREAMING", "1").lower() in ("1", "true", "yes") and is_ffmpeg_available()
+
+
+def iter_audio_stream(url, headers, chunk_bytes=10 * 1024 * 1024):
+    """
+    按 Range 分块下载音频直链（与 yt-dlp 的 http_chunk_size 相同，避免被限速），逐块产出字节
+    """
+    proxy = os.getenv("YOUTUBE_PROXY", "").strip()
+    proxies = {"http": proxy, "https": proxy} if proxy else None
+    offset = 0
+    total = None
+    with requests.Session() as session:
+        while total is None or offset < total:
+            range_headers = {**headers, "Range": f"bytes={offset}-{offset + chunk_bytes - 1}"}
+            with session.get(url, headers=range_headers, stream=True, timeout=15, proxies=proxies) as response:
+                if response.status_code not in (200, 206):
+                    raise RuntimeError(f"音频下载失败（HTTP {response.status_code}）。")
+                content_range = response.headers.get("Content-Range", "")
+                if response.status_code == 200:
+                    total = -1
+                elif "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+                    total = int(content_range.rsplit("/", 1)[1])
+                received = 0
+                for block in response.iter_content(chunk_size=64 * 1024):
+                    received += len(block)
+                    yield block
+            # 服务端忽略 Range 返回整个文件，或本块不足 chunk_bytes，说明已到结尾
+            if total == -1 or received < chunk_bytes:
+                return
+            offset += received
+
+
+def transcribe_segment_with_openai(file_path):
+    """分段转写的单个片段：一个视频会发出多个请求，排在交互请求之后"""
+    return run_with_background_priority(transcribe_audio_with_openai, file_path)
+
+
+def transcribe_youtube_audio_stream(info, video_id, on_progress, max_bytes):
+    """下载与转写流水线：字节边到达边切段，每段切好立即提交转写"""
+    url = info.get("url")
+    if not url:
+        raise RuntimeError("未找到音频直链。")
+    options = get_audio_segment_options(video_id, on_progress)
+    return transcribe_stream(
+        iter_audio_stream(url, info.get("http_headers") or {}),
+        transcribe_segment_with_openai,
+        get_audio_executor(),
+        ext=info.get("ext") or "m4a",
+        max_bytes=max_bytes,
+        expected_duration=info.get("duration"),
+        **options,
+    )
+
+
+def transcribe_audio_file(file_path, video_id=None, on_progress=None):
+    """
+    安装了 ffmpeg 时按 AUDIO_SEGMENT_SECONDS 切成重叠片段并发转写，
+    片段结果写入字幕存储（source=audio:<起点>+<时长>），重试时跳过已完成的片段；
+    否则整段上传
+    """
+    if not is_ffmpeg_available(require_probe=True):
+        return transcribe_audio_with_openai(file_path)
+
+    options = get_audio_segment_options(video_id, on_progress)
+    return transcribe_in_segments(
+        file_path,
+        transcribe_segment_with_openai,
+        get_audio_executor(),
+        os.path.dirname(file_path),
+        **options,
+    )
+
+
+_YTDLP_CONTEXT = None
+_YTDLP_CONTEXT_LOCK = threading.Lock()
+
+
+def get_ytdlp_context():
+    """
+    进程内共享的 yt-dlp 上下文：字幕与音频使用同一组参数，一次 extract_info
+    即可同时得到全部字幕轨道（subtitles / automatic_captions）与选中的 bestaudio 格式；
+    没有匹配的音频格式时不报错（字幕仍可用），由音频转写自行检查
+    """
+    global _YTDLP_CONTEXT
+    with _YTDLP_CONTEXT_LOCK:
+        if _YTDLP_CONTEXT is None:
+            clients = [c.strip() for c in os.getenv("YOUTUBE_DLP_CLIENTS", "").split(",") if c.strip()]
+            proxy = os.getenv("YOUTUBE_PROXY", "").strip()
+            options = {
+                "format": "bestaudio[ext=m4a]/bestaudio",
+                "ignore_no_formats_error": True,
+                "skip_download": True,
+                "noplaylist": True,
+                "quiet": True,
+                "no_warnings": True,
+                "socket_timeout": 10,
+            }
+            if clients:
+                options["extractor_args"] = {"youtube": {"player_client": clients}}
+            if proxy:
+                options["proxy"] = proxy
+            _YTDLP_CONTEXT = YtDlpContext(
+                options,
+                cookies_b64=os.getenv("YOUTUBE_COOKIES_B64", "").strip(),
+                pool_size=int(os.getenv("YTDLP_POOL_SIZE", "2")),
+                info_ttl_seconds=int(os.getenv("YTDLP_INFO_TTL_SECONDS", "600")),
+            )
+        return _YTDLP_CONTEXT
+
+
+def transcribe_youtube_audio(video_url, video_id=None, on_progress=None):
+    """
+    on_progress(done, total) 上报已完成的音频片段数
+    """
+    try:
+        import yt_dlp  # noqa: F401
+    except Exception:
+        raise RuntimeError("yt-dlp 未安装，无法下载视频音频。")
+
+    context = get_ytdlp_context()
+    max_bytes = get_audio_max_bytes()
+
+    if is_audio_streaming_enabled():
+        try:
+            info = context.extract_info(video_url)
+            transcript = transcribe_youtube_audio_stream(info, video_id, on_progress, max_bytes)
+            if transcript.strip():
+                return transcript
+        except AudioTooLargeError:
+            raise
+        except Exception as exc:
+            # 流式失败时回退到先下载再转写；已完成的片段在字幕存储中，不会重复转写。
+            # 直链可能已失效，重新解析
+            context.forget(video_url)
+            if is_debug_enabled():
+                print(f"[DEBUG] streaming audio transcription failed: {exc}")
+
+    info = context.extract_info(video_url)
+    if not info.get("url"):
+        raise RuntimeError("yt-dlp 未找到可用的音频格式。")
+    expected_size = info.get("filesize") or info.get("filesize_approx")
+    if max_bytes and expected_size and expected_size > max_bytes:
+        raise AudioTooLargeError(f"音频超过 {max_bytes // (1024 * 1024)}MB 上限。")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, f"{info.get('id', 'audio')}.{info.get('ext', 'm4a')}")
+        # 缺少 filesize 时由下载器按响应长度拒绝超限文件，而不是下载完才检查
+        context.download(info, file_path, max_filesize=max_bytes or None)
+        if not os.path.exists(file_path):
+            raise RuntimeError("下载音频失败，未找到输出文件（或超过大小上限）。")
+        if max_bytes and os.path.getsize(file_path) > max_bytes:
+            raise AudioTooLargeError(f"音频超过 {max_bytes // (1024 * 1024)}MB 上限。")
+        transcript = transcribe_audio_file(file_path, video_id, on_progress)
+        if not transcript.strip():
+            raise RuntimeError("音频转写结果为空。")
+        return transcript
+
+
+def fetch_youtube_subtitles_ytdlp(video_url):
+    try:
+        import yt_dlp  # noqa: F401
+    except Exception:
+        raise RuntimeError("yt-dlp 未安装，无法下载字幕。")
+
+    languages = get_preferred_transcript_languages()
+    context = get_ytdlp_context()
+    info = context.extract_info(video_url)
+
+    # 先从 info dict 列出全部轨道，按语言偏好选出一条，只下载这一条；
+    # 下载或解析失败时换下一条，最多 YTDLP_SUBTITLE_ATTEMPTS 次
+    tracks = normalize_ytdlp_tracks(info, preferred_ext="vtt")
+    if not tracks:
+        raise RuntimeError("yt-dlp 未找到字幕。")
+    attempts = max(1, int(os.getenv("YTDLP_SUBTITLE_ATTEMPTS", "2")))
+    tried = set()
+    last_error = None
+    for _ in range(attempts):
+        chosen = select_caption_track(tracks, languages, exclude_urls=tried)
+        if not chosen:
+            break
+        tried.add(chosen["url"])
+        try:
+            transcript = parse_caption_payload(context.fetch_text(chosen["url"]))
+        except Exception as exc:
+            last_error = exc
+            continue
+        if transcript:
+            if is_debug_enabled():
+                print(f"[DEBUG] yt-dlp subtitle track: {chosen['language']} asr={chosen['is_asr']} ext={chosen['ext']}")
+            return transcript
+        last_error = RuntimeError("yt-dlp 字幕解析为空。")
+    raise last_error or RuntimeError("yt-dlp 未找到字幕。")
+
+
+def fetch_fixtweet_status(tweet_id):
+    """
+    FixTweet API 原始推文数据（免费、稳定、无需API Key）
+    https://github.com/FixTweet/FixTweet/wiki/API
+    """
+    url = f"https://api.fxtwitter.com/status/{tweet_id}"
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"
+    }
+
+    try:
+        response = requests.get(url, headers=headers, timeout=10)
+        if response.ok:
+            data = response.json()
+
+            # 检查响应格式
+            if data.get("code") == 200 and "tweet" in data:
+                return data["tweet"]
     except Exception:
         pass
 
-    # 2. 降级：Syndication API（2024年已不稳定）
+    raise RuntimeError("fixtweet-failed")
+
+
+def fixtweet_to_text(tweet):
+    text = tweet.get("text", "")
+    if not text:
+        raise RuntimeError("fixtweet-failed")
+    author = tweet.get("author", {})
+    display_name = author.get("name", "User")
+    screen_name = author.get("screen_name", "")
+    title = f"{display_name} @{screen_name}".strip()
+    return title, text, "fixtweet"
+
+
+def fetch_twitter_via_fixtweet(tweet_id):
+    """使用 FixTweet API 获取推文内容"""
+    return fixtweet_to_text(fetch_fixtweet_status(tweet_id))
+
+
+def fetch_twitter_via_syndication(tweet_id):
+    """Syndication API（2024 年起不稳定）"""
     syndication_url = (
         f"https://cdn.syndication.twimg.com/tweet-result?id={tweet_id}&lang=zh"
     )
@@ -952,7 +1865,15 @@ def fetch_twitter_text(url, cookie_map=None):
     except Exception:
         pass
 
-    # 3. 降级：snscrape（需额外安装 snscrape 库）
+    raise RuntimeError("syndication-failed")
+
+
+def is_snscrape_available():
+    return importlib.util.find_spec("snscrape") is not None
+
+
+def fetch_twitter_via_snscrape(tweet_id):
+    """snscrape（需额外安装 snscrape 库）"""
     try:
         import snscrape.modules.twitter as sntwitter
         scraper = sntwitter.TwitterTweetScraper(tweet_id)
@@ -965,42 +1886,405 @@ def fetch_twitter_text(url, cookie_map=None):
     except Exception:
         pass
 
-    # 4. 最后兜底：Playwright（需浏览器内核，常常失败）
+    raise RuntimeError("snscrape-failed")
+
+
+TWITTER_FAST_METHODS = {
+    "fixtweet": fetch_twitter_via_fixtweet,
+    "syndication": fetch_twitter_via_syndication,
+    "snscrape": fetch_twitter_via_snscrape,
+}
+
+_TWITTER_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TWITTER_RACE_WORKERS", "8")), thread_name_prefix="twitter-race"
+)
+_TWITTER_STATS_LOCK = threading.Lock()
+_TWITTER_STATS = {}
+
+
+def record_twitter_attempt(method, outcome, latency=None):
+    """outcome: win / lost（有效结果但晚于胜者）/ failed / cancelled"""
+    with _TWITTER_STATS_LOCK:
+        stats = _TWITTER_STATS.setdefault(
+            method,
+            {"attempts": 0, "win": 0, "lost": 0, "failed": 0, "cancelled": 0, "latency_sum": 0.0, "latency_count": 0},
+        )
+        stats["attempts"] += 1
+        stats[outcome] += 1
+        if latency is not None:
+            stats["latency_sum"] += latency
+            stats["latency_count"] += 1
+
+
+def get_twitter_method_stats():
+    with _TWITTER_STATS_LOCK:
+        stats = json.loads(json.dumps(_TWITTER_STATS))
+    for item in stats.values():
+        item["win_rate"] = round(item["win"] / item["attempts"], 4) if item["attempts"] else 0.0
+        item["avg_latency"] = round(item["latency_sum"] / item["latency_count"], 4) if item["latency_count"] else 0.0
+    return stats
+
+
+def _timed_twitter_attempt(method, tweet_id):
+    started = time.monotonic()
     try:
-        from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-        
-        title = "Twitter/X 内容抓取 (Live)"
-        text = ""
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent=(
-                    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/120.0.0.0 Safari/537.36"
-                )
-            )
-            if cookie_map:
-                context.add_cookies(build_playwright_cookies(cookie_map))
-            page = context.new_page()
-            try:
-                page.goto(url, wait_until="domcontentloaded", timeout=20000)
-                title = page.title() or title
-                page.wait_for_selector('[data-testid="tweetText"]', timeout=20000)
-                text = page.locator('[data-testid="tweetText"]').first.inner_text().strip()
-                if text:
-                    return title, text, "playwright"
-            except:
-                pass
-            finally:
-                context.close()
-                browser.close()
+        return TWITTER_FAST_METHODS[method](tweet_id), time.monotonic() - started
     except Exception:
-        pass
+        return None, time.monotonic() - started
+
+
+def fetch_twitter_text_fast(tweet_id):
+    """
+    FixTweet 与 Syndication 同时请求，snscrape 在 TWITTER_HEDGE_MS 后（或前两者都已失败时）加入；
+    第一个有效结果胜出，未开始的尝试被取消，仍在进行的请求结果被丢弃。全部失败返回 None
+    """
+    methods = ["fixtweet", "syndication"]
+    if is_snscrape_available():
+        methods.append("snscrape")
+
+    if os.getenv("TWITTER_RACE_MODE", "race").lower() == "sequential":
+        for method in methods:
+            result, latency = _timed_twitter_attempt(method, tweet_id)
+            record_twitter_attempt(method, "win" if result else "failed", latency)
+            if result:
+                return result
+        return None
+
+    hedge_seconds = float(os.getenv("TWITTER_HEDGE_MS", "1500")) / 1000
+    deadline = time.monotonic() + hedge_seconds + float(os.getenv("TWITTER_RACE_TIMEOUT_SECONDS", "15"))
+    immediate, delayed = methods[:2], methods[2:]
+    attempts = {}
+    state = {"winner": None}
+
+    def settle(future):
+        method = attempts[future]
+        if future.cancelled():
+            record_twitter_attempt(method, "cancelled")
+            return
+        result, latency = future.result()
+        if not result:
+            record_twitter_attempt(method, "failed", latency)
+        elif state["winner"] is None:
+            state["winner"] = method
+            record_twitter_attempt(method, "win", latency)
+        else:
+            record_twitter_attempt(method, "lost", latency)
+
+    def launch(method):
+        future = _TWITTER_EXECUTOR.submit(_timed_twitter_attempt, method, tweet_id)
+        attempts[future] = method
+        return future
+
+    running = {launch(method) for method in immediate}
+    hedge_at = time.monotonic() + hedge_seconds
+    while running:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        timeout = min(hedge_at, deadline) - now if delayed else deadline - now
+        finished, running = wait(running, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+        winner = next((future for future in finished if future.result()[0]), None)
+        if winner:
+            settle(winner)
+        for future in finished:
+            if future is not winner:
+                settle(future)
+        if winner:
+            for other in running:
+                other.cancel()
+                other.add_done_callback(settle)
+            return winner.result()[0]
+        # 对冲时间已到，或首批请求都已失败：加入后续方法
+        if delayed and (time.monotonic() >= hedge_at or not running):
+            running = running | {launch(delayed.pop(0))}
+            hedge_at = time.monotonic() + hedge_seconds
+
+    for future in running:
+        future.cancel()
+        future.add_done_callback(settle)
+    return None
+
+
+_BROWSER_POOL = None
+_BROWSER_POOL_LOCK = threading.Lock()
+
+
+def get_browser_pool():
+    global _BROWSER_POOL
+    with _BROWSER_POOL_LOCK:
+        if _BROWSER_POOL is None:
+            blocked = os.getenv("PLAYWRIGHT_BLOCK_RESOURCES", "image,font,media")
+            _BROWSER_POOL = BrowserPool(
+                max_pages=int(os.getenv("PLAYWRIGHT_MAX_PAGES", "2")),
+                recycle_pages=int(os.getenv("PLAYWRIGHT_RECYCLE_PAGES", "50")),
+                recycle_rss_bytes=int(os.getenv("PLAYWRIGHT_RECYCLE_RSS_MB", "1024")) * 1024 * 1024,
+                blocked_resource_types=[t.strip() for t in blocked.split(",") if t.strip()],
+                max_contexts=int(os.getenv("PLAYWRIGHT_MAX_CONTEXTS", "8")),
+                context_ttl_seconds=int(os.getenv("TWITTER_SESSION_TTL_SECONDS", "900")),
+                context_rss_bytes=int(os.getenv("PLAYWRIGHT_CONTEXTS_RSS_MB", "768")) * 1024 * 1024,
+            )
+        return _BROWSER_POOL
+
+
+_TWITTER_SESSIONS = None
+_TWITTER_SESSIONS_LOCK = threading.Lock()
+
+
+def get_twitter_sessions():
+    global _TWITTER_SESSIONS
+    browser_pool = get_browser_pool()
+    with _TWITTER_SESSIONS_LOCK:
+        if _TWITTER_SESSIONS is None:
+            _TWITTER_SESSIONS = TwitterSessionManager(
+                ttl_seconds=int(os.getenv("TWITTER_SESSION_TTL_SECONDS", "900")),
+                max_sessions=int(os.getenv("TWITTER_SESSION_MAX", "32")),
+                browser_pool=browser_pool,
+                headers={"User-Agent": DEFAULT_USER_AGENT},
+            )
+        return _TWITTER_SESSIONS
+
+
+def fetch_twitter_via_session(tweet_id, cookie_map):
+    """
+    带登录态的 v1.1 接口（需要 auth_token / ct0 cookie 与 TWITTER_BEARER_TOKEN），
+    复用该用户的常驻 HTTP 会话；登录态失效时丢弃会话
+    """
+    bearer_token = os.getenv("TWITTER_BEARER_TOKEN", "").strip()
+    if not bearer_token or not cookie_map or not cookie_map.get("auth_token") or not cookie_map.get("ct0"):
+        return None
+    sessions = get_twitter_sessions()
+    try:
+        response = sessions.http_session(cookie_map).get(
+            "https://api.x.com/1.1/statuses/show.json",
+            params={"id": tweet_id, "tweet_mode": "extended"},
+            headers={"Authorization": f"Bearer {bearer_token}", "x-twitter-auth-type": "OAuth2Session"},
+            timeout=10,
+        )
+        if response.status_code in (401, 403):
+            sessions.forget(cookie_map)
+            return None
+        if response.ok:
+            data = response.json()
+            text = data.get("full_text") or data.get("text")
+            if text:
+                user = data.get("user") or {}
+                title = f"{user.get('name', 'User')} @{user.get('screen_name', '')}".strip()
+                return title, text, "session"
+    except Exception as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] twitter session fetch failed: {exc}")
+    return None
+
+
+async def scrape_tweet_page(page, url):
+    await page.goto(url, wait_until="domcontentloaded", timeout=20000)
+    title = await page.title() or "Twitter/X 内容抓取 (Live)"
+    await page.wait_for_selector('[data-testid="tweetText"]', timeout=20000)
+    text = (await page.locator('[data-testid="tweetText"]').first.inner_text()).strip()
+    return title, text
+
+
+def fetch_twitter_text(url, cookie_map=None):
+    """
+    多级降级策略抓取推文：
+    1. FixTweet API（免费稳定）与 2. Syndication API 同时请求，
+    3. snscrape（需额外安装）在 TWITTER_HEDGE_MS 后仍无结果时加入，先返回有效结果者胜出
+    （TWITTER_RACE_MODE=sequential 时按顺序逐个尝试）
+    4. 带登录态的接口（有 cookie 且配置了 TWITTER_BEARER_TOKEN 时）
+    5. Playwright（最后兜底，需浏览器内核）
+    有 cookie 时 4、5 复用该 cookie 集合的常驻 HTTP 会话与浏览器 context
+    """
+    tweet_id = extract_twitter_id(url)
+    if not tweet_id:
+        raise RuntimeError("invalid-twitter-url")
+
+    # 1-3. FixTweet / Syndication 并发竞速，snscrape 在对冲延迟后加入
+    result = fetch_twitter_text_fast(tweet_id)
+    if result:
+        return result
+
+    # 4. 带登录态的接口
+    result = fetch_twitter_via_session(tweet_id, cookie_map)
+    if result:
+        return result
+
+    # 5. 最后兜底：Playwright（需浏览器内核，常常失败），使用进程内常驻的浏览器池
+    try:
+        title, text = get_twitter_sessions().run_page(
+            lambda page: scrape_tweet_page(page, url),
+            cookie_map,
+            cookies=build_playwright_cookies(cookie_map),
+            timeout=int(os.getenv("PLAYWRIGHT_TIMEOUT_SECONDS", "45")),
+        )
+        if text:
+            return title, text, "playwright"
+    except Exception as exc:
+        if is_debug_enabled():
+            print(f"[DEBUG] playwright fallback failed: {exc}")
 
     raise RuntimeError("tweet-text-not-found")
 
 
+def collect_youtube_text(url, video_id, on_progress=None):
+    """
+    按 存储 -> 字幕 -> yt-dlp 字幕 -> 音频转写 -> 元数据 的顺序获取视频文本
+    on_progress(stage, status, detail=None) 用于上报进度，detail 为可选的进度说明（如音频片段 3/8）
+
+    Returns:
+        tuple: (full_text, source, metadata)；全部失败时抛出 RuntimeError
+    """
+    def report(stage, status, detail=None):
+        if on_progress:
+            on_progress(stage, status, detail)
+
+    transcript_error = None
+    subtitle_error = None
+    audio_error = None
+    metadata_error = None
+    full_text = ""
+    source = None
+    metadata = None
+
+    stored_text, stored_source = load_stored_transcript(
+        video_id, ["transcript", "subtitle", "audio"]
+    )
+    if stored_text:
+        report("store", "done")
+        return stored_text, stored_source, None
+
+    report("transcript", "running")
+    try:
+        transcript_data = fetch_youtube_transcript(video_id)
+        full_text = transcript_to_text(transcript_data)
+        if full_text:
+            source = "transcript"
+            save_transcript(video_id, source, full_text)
+    except Exception as exc:
+        transcript_error = exc
+    report("transcript", "done" if full_text else "failed")
+
+    if not full_text and is_subtitle_dlp_enabled():
+        report("subtitle", "running")
+        try:
+            subtitle_data = fetch_youtube_subtitles_ytdlp(url)
+            full_text = transcript_to_text(subtitle_data)
+            if full_text:
+                source = "subtitle"
+                save_transcript(video_id, source, full_text)
+        except Exception as exc:
+            subtitle_error = exc
+        report("subtitle", "done" if full_text else "failed")
+
+    if not full_text and is_audio_transcription_enabled():
+        report("audio", "running")
+        try:
+            full_text = transcribe_youtube_audio(
+                url, video_id, lambda done, total: report("audio", "running", f"{done}/{total or '?'}")
+            )
+            if full_text:
+                source = "audio"
+                save_transcript(video_id, source, full_text)
+        except Exception as exc:
+            audio_error = exc
+        report("audio", "done" if full_text else "failed")
+
+    if not full_text:
+        report("metadata", "running")
+        try:
+            metadata = fetch_youtube_metadata(video_id, url)
+            full_text = build_metadata_text(metadata)
+            if full_text:
+                source = "metadata"
+        except Exception as exc:
+            metadata_error = exc
+        report("metadata", "done" if full_text else "failed")
+
+    if not full_text:
+        category = classify_youtube_error(transcript_error, subtitle_error, audio_error, metadata_error)
+        message = f"未能获取视频内容（{category}）。"
+        if is_debug_enabled():
+            details = []
+            if transcript_error:
+                details.append(f"transcript_error={transcript_error}")
+            if subtitle_error:
+                details.append(f"subtitle_error={subtitle_error}")
+            if audio_error:
+                details.append(f"audio_error={audio_error}")
+            if metadata_error:
+                details.append(f"metadata_error={metadata_error}")
+            if details:
+                message = f"{message} ({'; '.join(details)})"
+        raise RuntimeError(message)
+
+    return full_text, source, metadata
+
+
+def build_youtube_card(full_text, source, metadata, summary_data, used_llm):
+    title = metadata.get("title") if metadata else ""
+    title = title or "YouTube 视频内容实时解析 (Real Prototype)"
+    if source == "transcript":
+        confidence = "100% (Transcript + AI)" if used_llm else "85% (Transcript)"
+    elif source == "subtitle":
+        confidence = "95% (Subtitle + AI)" if used_llm else "80% (Subtitle)"
+    elif source == "audio":
+        confidence = "90% (Audio + AI)" if used_llm else "70% (Audio)"
+    else:
+        confidence = "70% (Metadata + AI)" if used_llm else "50% (Metadata)"
+    if source == "metadata":
+        length = f"{len(full_text)} 字符"
+    else:
+        length = f"{max(1, len(full_text) // 1000)}k 字符"
+
+    # For this prototype, we return the transcript length and summary
+    return {
+        "title": title,
+        "summary": summary_data.get("summary", ""),
+        "length": length,
+        "confidence": confidence,
+        "highlights": summary_data.get("highlights", [])
+    }
+
+
+def get_request_twitter_cookies(data):
+    twitter_cookies = data.get("twitter_cookies") or {}
+    if isinstance(twitter_cookies, str):
+        twitter_cookies = parse_cookie_header(twitter_cookies)
+    if not isinstance(twitter_cookies, dict):
+        twitter_cookies = {}
+    if data.get("auth_token"):
+        twitter_cookies.setdefault("auth_token", data.get("auth_token"))
+    if data.get("ct0"):
+        twitter_cookies.setdefault("ct0", data.get("ct0"))
+    return twitter_cookies
+
+
+TWITTER_METHOD_LABELS = {
+    "fixtweet": "FixTweet API（推荐）",
+    "syndication": "Syndication API（不稳定）",
+    "snscrape": "snscrape 抓取",
+    "session": "登录态接口",
+    "playwright": "Playwright DOM 抓取（兜底）",
+}
+
+TWITTER_METHOD_CONFIDENCES = {
+    "fixtweet": "95%",
+    "syndication": "75%",
+    "snscrape": "80%",
+    "session": "90%",
+    "playwright": "60%",
+}
+
+
+def build_twitter_card(title, text, method, summary_data):
+    return {
+        "title": title,
+        "summary": summary_data.get("summary", ""),
+        "length": f"{len(text)} 字符",
+        "confidence": TWITTER_METHOD_CONFIDENCES.get(method, "70%"),
+        "highlights": summary_data.get("highlights", [])
+    }
+
+
 @app.route('/api/parse', methods=['POST'])
 @app.route('/api/magic', methods=['POST'])
 def parse_content():
@@ -1013,147 +2297,609 @@ def parse_content():
     if not platform:
         return jsonify({"error": "Platform is required"}), 400
 
-    cache_key = f"{platform}:{url}"
+    if platform not in ('YouTube', 'Twitter'):
+        return jsonify({"error": "Unsupported platform"}), 400
+    if platform == 'YouTube' and not extract_youtube_id(url):
+        return jsonify({"error": "Invalid YouTube URL"}), 400
+
+    try:
+        return jsonify(build_card(url, platform, get_request_twitter_cookies(data)))
+    except Exception as e:
+        return jsonify({
+            "error": "extraction-failed",
+            "message": str(e)
+        }), 500
+
+
+def build_card(url, platform, twitter_cookies=None, on_progress=None):
+    """
+    /api/magic 与异步任务共用的完整流水线（含结果缓存）
+    on_progress(stage, status, detail=None) 用于上报进度
+    """
+    cache_key = get_card_cache_key(url, platform)
     cached = cache_get(cache_key)
     if cached:
-        return jsonify(cached)
+        return cached
+
+    def report(stage, status, detail=None):
+        if on_progress:
+            on_progress(stage, status, detail)
+
+    if platform == 'YouTube':
+        video_id = extract_youtube_id(url)
+        if not video_id:
+            raise RuntimeError("Invalid YouTube URL")
+        full_text, source, metadata = collect_youtube_text(url, video_id, on_progress)
+        report("summary", "running")
+        summary_data, used_llm = build_summary_with_fallback(full_text, "YouTube")
+        response_payload = build_youtube_card(full_text, source, metadata, summary_data, used_llm)
+    else:
+        report("tweet", "running")
+        title, text, method = fetch_twitter_text(url, twitter_cookies or {})
+        report("summary", "running")
+        summary_data = build_twitter_summary(text)
+        response_payload = build_twitter_card(title, text, method, summary_data)
+    cache_set(cache_key, response_payload)
+    return response_payload
+
+
+def get_content_key(url, platform):
+    """规范化内容 ID（同一视频 / 推文的不同链接形式得到同一个键），无法识别时返回 None"""
+    if platform == 'YouTube':
+        video_id = extract_youtube_id(url)
+        return f"youtube:{video_id}" if video_id else None
+    if platform == 'Twitter':
+        tweet_id = extract_twitter_id(url)
+        return f"twitter:{tweet_id}" if tweet_id else None
+    return None
 
-    try:
-        if platform == 'YouTube':
-            video_id = extract_youtube_id(url)
-            if not video_id:
-                return jsonify({"error": "Invalid YouTube URL"}), 400
-
-            transcript_error = None
-            subtitle_error = None
-            audio_error = None
-            metadata_error = None
-            full_text = ""
-            source = None
-            metadata = None
 
-            try:
-                transcript_data = fetch_youtube_transcript(video_id)
-                full_text = transcript_to_text(transcript_data)
-                if full_text:
-                    source = "transcript"
-            except Exception as exc:
-                transcript_error = exc
-
-            if not full_text and is_subtitle_dlp_enabled():
-                try:
-                    subtitle_data = fetch_youtube_subtitles_ytdlp(url)
-                    full_text = transcript_to_text(subtitle_data)
-                    if full_text:
-                        source = "subtitle"
-                except Exception as exc:
-                    subtitle_error = exc
+def get_card_cache_key(url, platform):
+    """结果缓存键：按规范化内容 ID，同一视频 / 推文的不同链接形式（以及单条、批量、流式接口）共用缓存"""
+    return get_content_key(url, platform) or f"{platform}:{url}"
 
-            if not full_text and is_audio_transcription_enabled():
-                try:
-                    full_text = transcribe_youtube_audio(url)
-                    if full_text:
-                        source = "audio"
-                except Exception as exc:
-                    audio_error = exc
 
-            if not full_text:
+_JOB_QUEUE = None
+_JOB_QUEUE_LOCK = threading.Lock()
+_JOB_WORKERS = None
+_JOB_WORKERS_LOCK = threading.Lock()
+
+
+def get_job_queue():
+    global _JOB_QUEUE
+    with _JOB_QUEUE_LOCK:
+        if _JOB_QUEUE is None:
+            path = os.getenv("JOBS_DB_PATH", "").strip() or os.path.join(
+                tempfile.gettempdir(), "magic-card", "jobs.sqlite3"
+            )
+            _JOB_QUEUE = JobQueue(
+                path,
+                lease_seconds=int(os.getenv("JOBS_LEASE_SECONDS", "60")),
+                max_attempts=int(os.getenv("JOBS_MAX_ATTEMPTS", "2")),
+                reuse_seconds=int(os.getenv("JOBS_REUSE_SECONDS", "600")),
+            )
+        return _JOB_QUEUE
+
+
+def is_embedded_job_workers_enabled():
+    return os.getenv("JOBS_EMBEDDED_WORKERS", "1").lower() in ("1", "true", "yes")
+
+
+def ensure_job_workers():
+    """
+    按需启动内置 worker 进程池（JOB_WORKERS 个）。同一台机器上只有拿到文件锁的
+    web 进程会启动，其他进程直接返回；也可以关闭内置 worker，单独运行 scripts/job_worker.py
+    """
+    global _JOB_WORKERS
+    if not is_embedded_job_workers_enabled():
+        return
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    job_queue = get_job_queue()
+    with _JOB_WORKERS_LOCK:
+        if _JOB_WORKERS is None or _JOB_WORKERS[0] != os.getpid():
+            lock_file = open(f"{job_queue.path}.workers.lock", "w")
+            if fcntl:
                 try:
-                    metadata = fetch_youtube_metadata(video_id, url)
-                    full_text = build_metadata_text(metadata)
-                    if full_text:
-                        source = "metadata"
-                except Exception as exc:
-                    metadata_error = exc
-
-            if not full_text:
-                category = classify_youtube_error(transcript_error, subtitle_error, audio_error, metadata_error)
-                message = f"未能获取视频内容（{category}）。"
-                if is_debug_enabled():
-                    details = []
-                    if transcript_error:
-                        details.append(f"transcript_error={transcript_error}")
-                    if subtitle_error:
-                        details.append(f"subtitle_error={subtitle_error}")
-                    if audio_error:
-                        details.append(f"audio_error={audio_error}")
-                    if metadata_error:
-                        details.append(f"metadata_error={metadata_error}")
-                    if details:
-                        message = f"{message} ({'; '.join(details)})"
-                raise RuntimeError(message)
-
-            summary_data, used_llm = build_summary_with_fallback(full_text, "YouTube")
-            title = metadata.get("title") if metadata else ""
-            title = title or "YouTube 视频内容实时解析 (Real Prototype)"
-            if source == "transcript":
-                confidence = "100% (Transcript + AI)" if used_llm else "85% (Transcript)"
-            elif source == "subtitle":
-                confidence = "95% (Subtitle + AI)" if used_llm else "80% (Subtitle)"
-            elif source == "audio":
-                confidence = "90% (Audio + AI)" if used_llm else "70% (Audio)"
-            else:
-                confidence = "70% (Metadata + AI)" if used_llm else "50% (Metadata)"
-            if source == "metadata":
-                length = f"{len(full_text)} 字符"
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return
+            _JOB_WORKERS = (os.getpid(), lock_file, [])
+        processes = _JOB_WORKERS[2]
+        alive = [process for process in processes if process.is_alive()]
+        missing = max(1, int(os.getenv("JOB_WORKERS", "2"))) - len(alive)
+        if missing > 0:
+            alive += start_worker_pool(
+                job_queue.path,
+                "server:run_job",
+                missing,
+                lease_seconds=job_queue.lease_seconds,
+                max_attempts=job_queue.max_attempts,
+                reuse_seconds=job_queue.reuse_seconds,
+            )
+        processes[:] = alive
+
+
+def run_job(payload, report):
+    """worker 进程中执行的任务入口"""
+    return run_with_background_priority(
+        build_card, payload["url"], payload["platform"], payload.get("twitter_cookies") or {}, on_progress=report
+    )
+
+
+def format_job(job):
+    body = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "version": job["version"],
+        "created": job["created"],
+        "updated": job["updated"],
+    }
+    if job["stage"]:
+        body["progress"] = {"stage": job["stage"], "status": job["stage_status"]}
+        if job["detail"]:
+            body["progress"]["detail"] = job["detail"]
+    if job["status"] == "succeeded":
+        body["result"] = job["result"]
+    elif job["status"] == "failed":
+        body["error"] = "extraction-failed"
+        body["message"] = job["error"]
+    return body
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    异步版 /api/magic：立即返回 202 与任务 ID，由 worker 进程执行；
+    同一内容（视频 ID / 推文 ID）已有进行中或近期完成的任务时直接返回该任务
+    """
+    data = request.get_json(silent=True) or {}
+    url = data.get('url')
+    platform = data.get('platform')
+
+    if not url:
+        return jsonify({"error": "URL is required"}), 400
+    if not platform:
+        return jsonify({"error": "Platform is required"}), 400
+    if platform not in ('YouTube', 'Twitter'):
+        return jsonify({"error": "Unsupported platform"}), 400
+    content_key = get_content_key(url, platform)
+    if not content_key:
+        return jsonify({"error": f"Invalid {platform} URL"}), 400
+
+    payload = {"url": url, "platform": platform}
+    if platform == 'Twitter':
+        payload["twitter_cookies"] = get_request_twitter_cookies(data)
+    job, _ = get_job_queue().enqueue(content_key, payload)
+    ensure_job_workers()
+    status_code = 200 if job["status"] == "succeeded" else 202
+    response = jsonify(format_job(job))
+    response.headers["Location"] = f"/api/jobs/{job['job_id']}"
+    return response, status_code
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    查询任务；带 wait=<秒> 时为短时长轮询：任务版本号超过 since 或任务结束时立即返回。
+    等待会占用一个同步 worker，因此最多等待 JOBS_MAX_WAIT_SECONDS（默认 2 秒），客户端应循环轮询
+    """
+    try:
+        wait_seconds = min(float(request.args.get("wait", 0)), float(os.getenv("JOBS_MAX_WAIT_SECONDS", "2")))
+        since = request.args.get("since")
+        since = int(since) if since not in (None, "") else None
+    except ValueError:
+        return jsonify({"error": "Invalid wait/since"}), 400
+    job = get_job_queue().wait(job_id, since_version=since, timeout=wait_seconds)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(format_job(job))
+
+
+_STREAM_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("STREAM_WORKERS", "16")), thread_name_prefix="magic-stream"
+)
+
+
+def format_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def generate_youtube_events(url, video_id, cache_key):
+    events = queue.Queue()
+    done = object()
+
+    def on_progress(stage, status, detail=None):
+        payload = {"stage": stage, "status": status}
+        if detail:
+            payload["detail"] = detail
+        events.put(("progress", payload))
+
+    def load_metadata():
+        metadata = fetch_youtube_metadata(video_id, url)
+        events.put(("meta", {"platform": "YouTube", "title": metadata.get("title", ""), "author": metadata.get("author", "")}))
+        return metadata
+
+    metadata_future = _STREAM_EXECUTOR.submit(load_metadata)
+    text_future = _STREAM_EXECUTOR.submit(
+        contextvars.copy_context().run, collect_youtube_text, url, video_id, on_progress
+    )
+    text_future.add_done_callback(lambda _: events.put((done, None)))
+
+    while True:
+        try:
+            event, payload = events.get(timeout=5)
+        except queue.Empty:
+            yield ": keep-alive\n\n"
+            continue
+        if event is done:
+            break
+        yield format_sse(event, payload)
+
+    full_text, source, metadata = text_future.result()
+    try:
+        metadata = metadata or metadata_future.result(timeout=5)
+    except Exception:
+        pass
+    while not events.empty():
+        event, payload = events.get_nowait()
+        yield format_sse(event, payload)
+
+    yield format_sse("progress", {"stage": "summary", "status": "running"})
+    summary_stream = stream_summary_with_fallback(full_text, "YouTube")
+    while True:
+        try:
+            item = next(summary_stream)
+        except StopIteration as stop:
+            summary_data, used_llm = stop.value
+            break
+        yield format_sse(item["type"], item)
+
+    response_payload = build_youtube_card(full_text, source, metadata, summary_data, used_llm)
+    cache_set(cache_key, response_payload)
+    yield format_sse("card", response_payload)
+
+
+def generate_twitter_events(url, data, cache_key):
+    yield format_sse("progress", {"stage": "tweet", "status": "running"})
+    title, text, method = fetch_twitter_text(url, get_request_twitter_cookies(data))
+    yield format_sse("meta", {"platform": "Twitter", "title": title, "method": TWITTER_METHOD_LABELS.get(method, "未知方式")})
+    summary_data = build_twitter_summary(text)
+    response_payload = build_twitter_card(title, text, method, summary_data)
+    cache_set(cache_key, response_payload)
+    yield format_sse("card", response_payload)
+
+
+@app.route('/api/parse/stream', methods=['GET', 'POST'])
+@app.route('/api/magic/stream', methods=['GET', 'POST'])
+def parse_content_stream():
+    """
+    SSE 版 /api/magic：依次推送 meta（标题）、progress（流水线进度）、
+    delta（LLM 增量文本）、card（最终卡片，与 /api/magic 返回一致）或 error
+    """
+    data = request.get_json(silent=True) or request.args.to_dict()
+    url = data.get('url')
+    platform = data.get('platform')
+
+    if not url:
+        return jsonify({"error": "URL is required"}), 400
+    if not platform:
+        return jsonify({"error": "Platform is required"}), 400
+    if platform not in ('YouTube', 'Twitter'):
+        return jsonify({"error": "Unsupported platform"}), 400
+
+    video_id = None
+    if platform == 'YouTube':
+        video_id = extract_youtube_id(url)
+        if not video_id:
+            return jsonify({"error": "Invalid YouTube URL"}), 400
+
+    cache_key = get_card_cache_key(url, platform)
+
+    def generate():
+        cached = cache_get(cache_key)
+        if cached:
+            yield format_sse("meta", {"platform": platform, "title": cached.get("title", "")})
+            yield format_sse("card", cached)
+            return
+        try:
+            if platform == 'YouTube':
+                yield from generate_youtube_events(url, video_id, cache_key)
             else:
-                length = f"{max(1, len(full_text) // 1000)}k 字符"
-
-            # For this prototype, we return the transcript length and summary
-            response_payload = {
-                "title": title,
-                "summary": summary_data.get("summary", ""),
-                "length": length,
-                "confidence": confidence,
-                "highlights": summary_data.get("highlights", [])
-            }
-            cache_set(cache_key, response_payload)
-            return jsonify(response_payload)
-
-        elif platform == 'Twitter':
-            twitter_cookies = data.get("twitter_cookies") or {}
-            if isinstance(twitter_cookies, str):
-                twitter_cookies = parse_cookie_header(twitter_cookies)
-            if not isinstance(twitter_cookies, dict):
-                twitter_cookies = {}
-            if data.get("auth_token"):
-                twitter_cookies.setdefault("auth_token", data.get("auth_token"))
-            if data.get("ct0"):
-                twitter_cookies.setdefault("ct0", data.get("ct0"))
+                yield from generate_twitter_events(url, data, cache_key)
+        except Exception as e:
+            yield format_sse("error", {"error": "extraction-failed", "message": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
 
+_TWITTER_BULK_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TWITTER_BULK_WORKERS", "8")), thread_name_prefix="twitter-bulk"
+)
+
+
+def parse_tweet_ref(value):
+    """推文链接或纯数字 ID -> ID，无法识别时返回 None"""
+    value = str(value or "").strip()
+    if value.isdigit():
+        return value
+    tweet_id = extract_twitter_id(value)
+    return tweet_id if tweet_id and tweet_id.isdigit() else None
+
+
+def resolve_twitter_thread(tweet_id, known, max_items):
+    """
+    从线程中的最后一条推文沿 replying_to_status 向上追溯同一作者的推文，返回按时间顺序排列的 ID；
+    FixTweet 只提供父推文链接，因此需要传入线程的最后一条（只传首条时结果只有首条）
+    """
+    ids = []
+    current = tweet_id
+    author = None
+    while current and len(ids) < max_items:
+        tweet = known.get(current) or fetch_fixtweet_status(current)
+        known[current] = tweet
+        screen_name = (tweet.get("author") or {}).get("screen_name")
+        if author and screen_name != author:
+            break
+        author = screen_name
+        ids.append(current)
+        parent = tweet.get("replying_to_status")
+        if not parent or (tweet.get("replying_to") and tweet.get("replying_to") != author):
+            break
+        current = str(parent)
+    ids.reverse()
+    return ids
+
+
+def build_bulk_tweet_item(tweet_id, twitter_cookies, known):
+    """
+    单条推文卡片：优先使用结果缓存与已取得的 FixTweet 数据，FixTweet 失败时走完整降级链；
+    并发的摘要请求经 build_twitter_summary 的微批合并为少数几次 LLM 调用
+    """
+    url = f"https://x.com/i/status/{tweet_id}"
+    item = {"id": tweet_id, "url": url}
+    cache_key = get_card_cache_key(url, "Twitter")
+    cached = cache_get(cache_key)
+    if cached:
+        item["card"] = cached
+        return item
+    try:
+        try:
+            tweet = known.get(tweet_id) or fetch_fixtweet_status(tweet_id)
+            title, text, method = fixtweet_to_text(tweet)
+        except Exception:
             title, text, method = fetch_twitter_text(url, twitter_cookies)
-            summary_data = build_twitter_summary(text)
-            method_labels = {
-                "fixtweet": "FixTweet API（推荐）",
-                "syndication": "Syndication API（不稳定）",
-                "snscrape": "snscrape 抓取",
-                "playwright": "Playwright DOM 抓取（兜底）",
-            }
-            confidences = {
-                "fixtweet": "95%",
-                "syndication": "75%",
-                "snscrape": "80%",
-                "playwright": "60%",
-            }
-            method_label = method_labels.get(method, "未知方式")
-            confidence = confidences.get(method, "70%")
-            response_payload = {
-                "title": title,
-                "summary": summary_data.get("summary", ""),
-                "length": f"{len(text)} 字符",
-                "confidence": confidence,
-                "highlights": summary_data.get("highlights", [])
-            }
-            cache_set(cache_key, response_payload)
-            return jsonify(response_payload)
+        card = build_twitter_card(title, text, method, build_twitter_summary(text))
+        cache_set(cache_key, card)
+        item["card"] = card
+    except Exception as exc:
+        item["error"] = "extraction-failed"
+        item["message"] = str(exc)
+    return item
 
-        return jsonify({"error": "Unsupported platform"}), 400
 
-    except Exception as e:
-        return jsonify({
-            "error": "extraction-failed",
-            "message": str(e)
-        }), 500
+@app.route('/api/twitter/bulk', methods=['POST'])
+def twitter_bulk():
+    """
+    批量推文卡片：ids 为推文 ID / 链接列表，或 thread 为线程最后一条推文；
+    有界并发抓取，结果按输入顺序返回；stream=true 时以 SSE 逐条推送 item 事件，最后推送 done
+    """
+    data = request.get_json(silent=True) or {}
+    max_items = int(os.getenv("TWITTER_BULK_MAX_ITEMS", "100"))
+    twitter_cookies = get_request_twitter_cookies(data)
+    known = {}
+    # thread 模式下的锚点：用户传入的线程最后一条推文（并非线程首条）
+    anchor_id = None
+
+    if data.get("thread"):
+        anchor_id = parse_tweet_ref(data.get("thread"))
+        if not anchor_id:
+            return jsonify({"error": "Invalid thread URL"}), 400
+        try:
+            ids = resolve_twitter_thread(anchor_id, known, int(os.getenv("TWITTER_THREAD_MAX", "25")))
+        except Exception as e:
+            return jsonify({"error": "extraction-failed", "message": str(e)}), 500
+    else:
+        refs = data.get("ids") or data.get("urls") or []
+        if not isinstance(refs, list) or not refs:
+            return jsonify({"error": "ids or thread is required"}), 400
+        ids = [parse_tweet_ref(ref) for ref in refs]
+        if not all(ids):
+            return jsonify({"error": "Invalid tweet ID or URL"}), 400
+        if len(ids) > max_items:
+            return jsonify({"error": f"At most {max_items} tweets per request"}), 400
+
+    # 重复 ID 只抓取一次
+    futures = {}
+    for tweet_id in ids:
+        if tweet_id not in futures:
+            futures[tweet_id] = _TWITTER_BULK_EXECUTOR.submit(
+                contextvars.copy_context().run, build_bulk_tweet_item, tweet_id, twitter_cookies, known
+            )
+
+    extra = {"anchor_id": anchor_id} if anchor_id else {}
+    if not data.get("stream"):
+        return jsonify({"items": [futures[tweet_id].result() for tweet_id in ids], **extra})
+
+    def generate():
+        for index, tweet_id in enumerate(ids):
+            yield format_sse("item", {"index": index, **futures[tweet_id].result()})
+        yield format_sse("done", {"count": len(ids), **extra})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+
+_PARSE_BATCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PARSE_BATCH_CONCURRENCY", "8")), thread_name_prefix="parse-batch"
+)
+
+
+def classify_twitter_error(exc):
+    text = str(exc).lower()
+    if "invalid-twitter-url" in text:
+        return "INVALID_URL"
+    if "401" in text or "403" in text or "429" in text or "login" in text:
+        return "BOT_BLOCKED"
+    if "timeout" in text or "connection" in text:
+        return "NETWORK"
+    if "tweet-text-not-found" in text:
+        return "TWEET_NOT_FOUND"
+    return "UNKNOWN"
+
+
+def classify_extraction_error(exc, platform="YouTube"):
+    """
+    YouTube 沿用 classify_youtube_error 的类别（流水线的错误信息中已带有类别）；
+    推文失败归为 INVALID_URL / BOT_BLOCKED / NETWORK / TWEET_NOT_FOUND
+    """
+    if platform == "Twitter":
+        return classify_twitter_error(exc)
+    match = re.search(r"（([A-Z_]+)）", str(exc))
+    if match:
+        return match.group(1)
+    return classify_youtube_error(exc)
+
+
+@app.route('/api/batch', methods=['POST'])
+def parse_batch():
+    """
+    批量解析：items 为 [{url, platform}, ...]，按规范化内容 ID 去重后并发执行
+    （全进程共用 PARSE_BATCH_CONCURRENCY 个线程），以 NDJSON 逐行返回，先完成的先返回；
+    每行带输入中的 index，重复项与其首次出现的项同时返回，最后一行为 {"done": true, ...}
+    整个批次在一个请求内完成：gunicorn 需使用线程 worker（--threads，见 start.sh），
+    否则同步 worker 会在 --timeout 后被杀掉；更大的批次应逐条提交到 /api/jobs
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items is required"}), 400
+    max_items = int(os.getenv("PARSE_BATCH_MAX_ITEMS", "500"))
+    if len(items) > max_items:
+        return jsonify({"error": f"At most {max_items} items per request"}), 400
+    twitter_cookies = get_request_twitter_cookies(data)
+
+    lines = []
+    groups = {}
+    for index, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        url = item.get("url")
+        platform = item.get("platform")
+        line = {"index": index, "url": url, "platform": platform}
+        if not url or platform not in ('YouTube', 'Twitter'):
+            error = "URL is required" if not url else "Unsupported platform"
+            lines.append({**line, "error": "invalid-request", "message": error})
+            continue
+        content_key = get_content_key(url, platform)
+        if not content_key:
+            lines.append({**line, "error": "invalid-request", "message": f"Invalid {platform} URL"})
+            continue
+        groups.setdefault(content_key, (url, platform, []))[2].append(line)
+
+    def generate():
+        futures = {
+            _PARSE_BATCH_EXECUTOR.submit(
+                contextvars.copy_context().run, run_with_background_priority, build_card, url, platform, twitter_cookies
+            ): members
+            for url, platform, members in groups.values()
+        }
+        failed = len(lines)
+        try:
+            for line in lines:
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            for future in as_completed(futures):
+                platform = futures[future][0]["platform"]
+                try:
+                    result = {"card": future.result()}
+                except Exception as e:
+                    result = {
+                        "error": "extraction-failed",
+                        "category": classify_extraction_error(e, platform),
+                        "message": str(e),
+                    }
+                    failed += len(futures[future])
+                for line in futures[future]:
+                    yield json.dumps({**line, **result}, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "total": len(items), "unique": len(groups), "failed": failed}) + "\n"
+        finally:
+            # 客户端断开时不再执行尚未开始的项
+            for future in futures:
+                future.cancel()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson", headers=headers)
+
+
+@app.before_request
+def start_llm_usage_log():
+    begin_request()
+
+
+@app.teardown_request
+def write_llm_usage_log(_exc=None):
+    # 流式响应的 teardown 在生成器结束后才执行，统计包含整个 SSE 过程
+    write_request_log(request.path)
+
+
+def render_race_metrics():
+    stats = get_summary_race_stats()
+    lines = [
+        "# HELP llm_summary_races_total Summaries that raced more than one provider.",
+        "# TYPE llm_summary_races_total counter",
+        f"llm_summary_races_total{format_labels()} {stats['races']}",
+        "# HELP llm_summary_hedges_total Hedge requests fired to a secondary provider.",
+        "# TYPE llm_summary_hedges_total counter",
+        f"llm_summary_hedges_total{format_labels()} {stats['hedges_fired']}",
+        "# HELP llm_summary_race_wins_total Races won per provider.",
+        "# TYPE llm_summary_race_wins_total counter",
+    ]
+    lines += [f"llm_summary_race_wins_total{format_labels(provider=p)} {n}" for p, n in sorted(stats["wins"].items())]
+    lines += [
+        "# HELP llm_summary_wasted_tokens_total Tokens spent on cancelled or discarded race attempts.",
+        "# TYPE llm_summary_wasted_tokens_total counter",
+        f"llm_summary_wasted_tokens_total{format_labels(kind='prompt')} {stats['wasted_prompt_tokens']}",
+        f"llm_summary_wasted_tokens_total{format_labels(kind='completion')} {stats['wasted_completion_tokens']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def render_twitter_metrics():
+    stats = get_twitter_method_stats()
+    lines = [
+        "# HELP twitter_fetch_attempts_total Tweet text fetch attempts per method and outcome.",
+        "# TYPE twitter_fetch_attempts_total counter",
+    ]
+    for method, item in sorted(stats.items()):
+        for outcome in ("win", "lost", "failed", "cancelled"):
+            lines.append(f"twitter_fetch_attempts_total{format_labels(method=method, outcome=outcome)} {item[outcome]}")
+    lines += [
+        "# HELP twitter_fetch_latency_seconds Latency of completed tweet fetch attempts.",
+        "# TYPE twitter_fetch_latency_seconds summary",
+    ]
+    for method, item in sorted(stats.items()):
+        lines.append(f"twitter_fetch_latency_seconds_sum{format_labels(method=method)} {item['latency_sum']:.6f}")
+        lines.append(f"twitter_fetch_latency_seconds_count{format_labels(method=method)} {item['latency_count']}")
+    return "\n".join(lines) + "\n"
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus 抓取端点（指标为当前 worker 进程内的累计值，带 pid 标签）
+    需配置 METRICS_TOKEN，并以 Authorization: Bearer <token> 或 ?token= 访问；未配置时不开放
+    """
+    token = os.getenv("METRICS_TOKEN", "")
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip() or request.args.get("token", "")
+    if not hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+        return jsonify({"error": "Unauthorized"}), 401
+    body = render_prometheus() + render_race_metrics() + render_twitter_metrics()
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 if __name__ == '__main__':
     port = int(os.getenv("PORT", "5000"))
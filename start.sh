@@ -4,5 +4,10 @@
 # 设置环境变量（如果需要）
 export PORT=${PORT:-5000}
 
-# 启动 gunicorn
-exec gunicorn server:app --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+# SERVER_MODE=asgi 时使用 uvicorn 运行 asgi.py（需 pip install uvicorn asgiref），所有接口保持可用
+if [ "${SERVER_MODE}" = "asgi" ]; then
+    exec uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+fi
+
+# 启动 gunicorn：使用线程 worker，/api/batch 等长时间的流式响应不会在 --timeout 后被杀掉
+exec gunicorn server:app --bind 0.0.0.0:$PORT --workers 2 --threads ${GUNICORN_THREADS:-8} --timeout 120
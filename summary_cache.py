@@ -0,0 +1,122 @@
+"""
+LLM 摘要结果持久化缓存
+键为 (规范化输入文本, 平台, 服务商, 模型, 提示词版本) 的哈希，值为解析后的
+{"summary", "highlights"}；SQLite 存储，按容量做 LRU 淘汰，提示词版本变化时整批失效
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    cache_key TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_name TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_last_access ON summaries (last_access);
+CREATE INDEX IF NOT EXISTS idx_summaries_prompt ON summaries (prompt_name, prompt_version);
+"""
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_input(text):
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def make_cache_key(text, platform, provider, model, prompt_name, prompt_version):
+    digest = hashlib.sha256()
+    for part in (prompt_name, prompt_version, provider, model, platform or "", normalize_input(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, path, max_bytes, ttl_seconds=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._purged = set()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def purge_stale_versions(self, prompt_name, prompt_version):
+        """删除同一提示词旧版本的结果（每个进程每个版本只执行一次）"""
+        marker = (prompt_name, prompt_version)
+        if marker in self._purged:
+            return 0
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM summaries WHERE prompt_name = ? AND prompt_version != ?",
+                (prompt_name, prompt_version),
+            )
+            self._purged.add(marker)
+            return cursor.rowcount
+
+    def get(self, cache_key):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT payload, created FROM summaries WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if not row:
+                return None
+            payload, created = row
+            if self.ttl_seconds and now - created > self.ttl_seconds:
+                conn.execute("DELETE FROM summaries WHERE cache_key = ?", (cache_key,))
+                return None
+            conn.execute("UPDATE summaries SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def set(self, cache_key, value, provider, model, prompt_name, prompt_version):
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries "
+                "(cache_key, provider, model, prompt_name, prompt_version, payload, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, provider, model, prompt_name, prompt_version, payload,
+                 len(payload.encode("utf-8")), now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        if not self.max_bytes or self.max_bytes <= 0:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT cache_key, size FROM summaries ORDER BY last_access ASC").fetchall()
+        for cache_key, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM summaries WHERE cache_key = ?", (cache_key,))
+            total -= size
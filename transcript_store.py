@@ -0,0 +1,165 @@
+"""
+本地字幕 / 转写文本存储
+按 (video_id, language, source) 建索引，正文按内容哈希去重后压缩落盘
+（安装 zstandard 时用 zstd，否则用 zlib），SQLite 记录索引与最近访问时间，
+超过容量上限按 LRU 淘汰，读取时通过 mmap 映射文件
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transcripts (
+    video_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    source TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (video_id, language, source)
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs (last_access);
+CREATE INDEX IF NOT EXISTS idx_transcripts_digest ON transcripts (digest);
+"""
+
+
+def _compress(data):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def _decompress(codec, buffer):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard 未安装，无法读取 zstd 压缩的字幕。")
+        return zstandard.ZstdDecompressor().decompress(buffer)
+    return zlib.decompress(buffer)
+
+
+class TranscriptStore:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+    def _connection(self):
+        # gunicorn fork 之后不能复用父进程的连接
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                os.path.join(self.root, "index.sqlite3"),
+                timeout=10,
+                check_same_thread=False,
+                isolation_level=None,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _blob_path(self, digest, codec):
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.{codec}")
+
+    def get(self, video_id, language, source):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT b.digest, b.codec FROM transcripts t JOIN blobs b ON b.digest = t.digest "
+                "WHERE t.video_id = ? AND t.language = ? AND t.source = ?",
+                (video_id, language, source),
+            ).fetchone()
+            if not row:
+                return None
+            digest, codec = row
+            path = self._blob_path(digest, codec)
+            try:
+                with open(path, "rb") as blob_file:
+                    with mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        data = _decompress(codec, mapped)
+            except (OSError, ValueError, zlib.error):
+                # 文件丢失或损坏：删除索引，让调用方重新获取
+                conn.execute("DELETE FROM transcripts WHERE digest = ?", (digest,))
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                return None
+            conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        return data.decode("utf-8")
+
+    def put(self, video_id, language, source, text):
+        if not text:
+            return None
+        raw = text.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT codec FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row and os.path.exists(self._blob_path(digest, row[0])):
+                conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (now, digest))
+            else:
+                codec, payload = _compress(raw)
+                path = self._blob_path(digest, codec)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as blob_file:
+                    blob_file.write(payload)
+                os.replace(tmp_path, path)
+                conn.execute(
+                    "INSERT OR REPLACE INTO blobs (digest, codec, size, raw_size, created, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, codec, len(payload), len(raw), now, now),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts (video_id, language, source, digest, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (video_id, language, source, digest, now),
+            )
+            self._evict(conn)
+        return digest
+
+    def _evict(self, conn):
+        if not self.max_bytes or self.max_bytes <= 0:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT digest, codec, size FROM blobs ORDER BY last_access ASC").fetchall()
+        for digest, codec, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM transcripts WHERE digest = ?", (digest,))
+            conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            try:
+                os.remove(self._blob_path(digest, codec))
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            blobs, size, raw_size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM blobs"
+            ).fetchone()
+            entries = conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+        return {"entries": entries, "blobs": blobs, "bytes": size, "raw_bytes": raw_size}
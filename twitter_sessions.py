@@ -0,0 +1,123 @@
+"""
+Twitter 登录态会话管理
+以 cookie 集合的哈希为键，为重复使用同一组 cookie 的用户保留常驻的 requests.Session
+（cookie、CSRF 头与连接池已就绪）以及浏览器池中的常驻 BrowserContext，
+带登录态的抓取不必每次重新写入 cookie；会话空闲超时或数量超出上限时淘汰最久未用的，
+同时关闭对应的浏览器 context
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+COOKIE_DOMAINS = (".x.com", ".twitter.com")
+
+
+def cookie_key(cookie_map):
+    """cookie 集合 -> 稳定的会话键（不保留 cookie 原文），无 cookie 时返回 None"""
+    if not cookie_map:
+        return None
+    encoded = json.dumps(sorted(cookie_map.items()), ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+class _Session:
+    __slots__ = ("http", "last_used")
+
+    def __init__(self, http):
+        self.http = http
+        self.last_used = time.monotonic()
+
+
+class TwitterSessionManager:
+    def __init__(self, ttl_seconds=900, max_sessions=32, browser_pool=None, headers=None):
+        """
+        Args:
+            ttl_seconds: 会话空闲超时
+            max_sessions: 常驻会话数量上限（浏览器 context 另受浏览器池的上限约束）
+            browser_pool: BrowserPool，会话淘汰时关闭其常驻 context
+            headers: 每个 HTTP 会话的默认请求头
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        self.browser_pool = browser_pool
+        self.headers = dict(headers or {})
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._pid = None
+        self.stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    def _create_http(self, cookie_map):
+        http = requests.Session()
+        http.headers.update(self.headers)
+        for domain in COOKIE_DOMAINS:
+            for name, value in cookie_map.items():
+                http.cookies.set(name, value, domain=domain, path="/")
+        if cookie_map.get("ct0"):
+            http.headers["x-csrf-token"] = cookie_map["ct0"]
+        return http
+
+    def _evict(self, now, reserve=0):
+        """调用方持有 self._lock；返回被淘汰的会话"""
+        evicted = []
+        for key, session in list(self._sessions.items()):
+            expired = now - session.last_used >= self.ttl_seconds
+            if expired or len(self._sessions) + reserve > self.max_sessions:
+                evicted.append((key, self._sessions.pop(key)))
+        self.stats["evicted"] += len(evicted)
+        return evicted
+
+    def _close(self, evicted):
+        for key, session in evicted:
+            session.http.close()
+            if self.browser_pool is not None:
+                self.browser_pool.close_context(key)
+
+    def _touch(self, cookie_map):
+        """取出或创建该 cookie 集合的会话并刷新使用时间，顺带淘汰过期与超出上限的会话"""
+        key = cookie_key(cookie_map)
+        now = time.monotonic()
+        with self._lock:
+            # fork 出的子进程不复用父进程的连接
+            if self._pid != os.getpid():
+                self._sessions = OrderedDict()
+                self._pid = os.getpid()
+            session = self._sessions.get(key)
+            if session and now - session.last_used < self.ttl_seconds:
+                self._sessions.move_to_end(key)
+                session.last_used = now
+                self.stats["reused"] += 1
+                evicted = self._evict(now)
+            else:
+                evicted = self._evict(now, reserve=1)
+                session = _Session(self._create_http(cookie_map))
+                self._sessions[key] = session
+                self.stats["created"] += 1
+        self._close(evicted)
+        return key, session
+
+    def http_session(self, cookie_map):
+        """返回该 cookie 集合的常驻 requests.Session（cookie 与 CSRF 头已设置）"""
+        if not cookie_map:
+            raise ValueError("cookie_map is empty")
+        return self._touch(cookie_map)[1].http
+
+    def run_page(self, page_fn, cookie_map, cookies=None, timeout=60):
+        """
+        在浏览器池中执行 page_fn(page)：有 cookie 时复用该 cookie 集合的常驻 context，
+        cookies 为 Playwright 格式，只在首次创建 context 时写入
+        """
+        key = self._touch(cookie_map)[0] if cookie_map else None
+        return self.browser_pool.run(page_fn, cookies=cookies, timeout=timeout, context_key=key)
+
+    def forget(self, cookie_map):
+        """登录态失效（401 / 403）时丢弃会话，下次重新建立"""
+        key = cookie_key(cookie_map)
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session:
+            self._close([(key, session)])
@@ -0,0 +1,146 @@
+"""
+进程级 yt-dlp 上下文
+cookie 只在创建时解码一次，写入进程私有的临时文件；YoutubeDL 实例常驻复用
+（cookie jar、extractor 状态与 HTTP 连接都保留在实例里），YoutubeDL 不是线程安全的，
+因此按 pool_size 维护一个小实例池；extract_info 的结果按 URL 缓存一段时间，
+字幕与音频共用同一份 info dict
+"""
+import atexit
+import base64
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _remove_file(path, owner_pid):
+    if os.getpid() != owner_pid:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class YtDlpContext:
+    def __init__(self, options, cookies_b64="", pool_size=2, info_ttl_seconds=600, info_max_items=128):
+        """
+        Args:
+            options: 所有实例共用的 YoutubeDL 参数
+            cookies_b64: base64 编码的 Netscape cookie 文件
+        """
+        self.options = dict(options)
+        self.cookies_b64 = cookies_b64
+        self.pool_size = max(1, pool_size)
+        self.info_ttl_seconds = info_ttl_seconds
+        self.info_max_items = info_max_items
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created = 0
+        self._pid = None
+        self._cookie_path = None
+        self._cookie_error = None
+        self._info = {}
+        self._info_lock = threading.Lock()
+
+    def _prepare(self):
+        """首次使用（或 fork 之后）解码 cookie；调用方持有 self._cond"""
+        if self._pid == os.getpid():
+            return
+        # fork 出的子进程不能复用父进程的实例与连接
+        self._idle = []
+        self._created = 0
+        self._pid = os.getpid()
+        self._cookie_path = None
+        self._cookie_error = None
+        if self.cookies_b64:
+            try:
+                data = base64.b64decode(self.cookies_b64)
+                fd, path = tempfile.mkstemp(prefix="ytdlp-cookies-", suffix=".txt")
+                with os.fdopen(fd, "wb") as cookie_file:
+                    cookie_file.write(data)
+                self._cookie_path = path
+                # cookie 文件含登录凭据，进程退出时删除（fork 出的子进程不删除父进程的文件）
+                atexit.register(_remove_file, path, os.getpid())
+            except Exception as exc:
+                self._cookie_error = exc
+
+    def _create(self):
+        from yt_dlp import YoutubeDL
+
+        options = dict(self.options)
+        if self._cookie_path:
+            options["cookiefile"] = self._cookie_path
+        return YoutubeDL(options)
+
+    @contextmanager
+    def instance(self):
+        """借出一个空闲的 YoutubeDL 实例，池满时等待"""
+        with self._cond:
+            self._prepare()
+            if self._cookie_error:
+                raise RuntimeError(f"cookie decode failed: {self._cookie_error}")
+            while not self._idle and self._created >= self.pool_size:
+                self._cond.wait()
+            if self._idle:
+                ydl = self._idle.pop()
+                pid = self._pid
+            else:
+                self._created += 1
+                ydl = None
+                pid = self._pid
+        if ydl is None:
+            try:
+                ydl = self._create()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield ydl
+        finally:
+            with self._cond:
+                if pid == self._pid:
+                    self._idle.append(ydl)
+                    self._cond.notify()
+
+    def extract_info(self, url):
+        """不下载，返回处理后的 info dict（含选中的音频格式与 requested_subtitles）"""
+        now = time.time()
+        with self._info_lock:
+            cached = self._info.get(url)
+            if cached and now - cached[1] < self.info_ttl_seconds:
+                return cached[0]
+        with self.instance() as ydl:
+            info = ydl.extract_info(url, download=False)
+        with self._info_lock:
+            if len(self._info) >= self.info_max_items:
+                expired = [key for key, (_, created) in self._info.items() if now - created >= self.info_ttl_seconds]
+                for key in expired or [min(self._info, key=lambda key: self._info[key][1])]:
+                    self._info.pop(key, None)
+            self._info[url] = (info, time.time())
+        return info
+
+    def forget(self, url):
+        """直链失效（403 等）时丢弃缓存的 info，下次重新解析"""
+        with self._info_lock:
+            self._info.pop(url, None)
+
+    def fetch_text(self, url):
+        """用实例自带的会话（cookie、代理、连接复用）下载字幕等小文件"""
+        with self.instance() as ydl:
+            with ydl.urlopen(url) as response:
+                return response.read().decode("utf-8", errors="ignore")
+
+    def download(self, info, path, max_filesize=None):
+        """把 info 中选中的格式下载到 path；max_filesize 按响应长度拒绝超限的文件"""
+        with self.instance() as ydl:
+            previous = ydl.params.get("max_filesize")
+            ydl.params["max_filesize"] = max_filesize
+            try:
+                ydl.dl(path, dict(info))
+            finally:
+                ydl.params["max_filesize"] = previous
+        return path